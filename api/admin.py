@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import MobileUser, DeviceToken, GestureData, Product, Order, ProductReview
+from .models import MobileUser, DeviceToken, GestureData, Product, Order, OrderLine, ProductReview, StockReservation
 from .tasks import generate_product_with_ai
 
 @admin.register(MobileUser)
@@ -28,7 +28,10 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ('is_ai_generated',)
     search_fields = ('name', 'description')
     ordering = ('-created_at',)
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = (
+        'created_at', 'updated_at', 'reserved_stock', 'rating_sum', 'rating_count',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count'
+    )
     actions = [generate_ai_product]
 
     def get_queryset(self, request):
@@ -38,18 +41,29 @@ class ProductAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         if obj is not None:
             # Check if product has any orders with PROTECT
-            has_orders = obj.orders.filter(status__in=['pending', 'paid', 'shipped']).exists()
+            has_orders = obj.order_lines.filter(order__status__in=Order.ACTIVE_STATUSES).exists()
             if has_orders:
                 return False
         return super().has_delete_permission(request, obj)
 
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    extra = 0
+    raw_id_fields = ('product',)
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'product', 'quantity', 'status', 'created_at')
+    list_display = ('id', 'user', 'total_price', 'status', 'created_at')
     list_filter = ('status',)
-    search_fields = ('user__username', 'product__name')
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'lines__product__name')
     ordering = ('-created_at',)
     readonly_fields = ('total_price', 'created_at', 'updated_at')
+    inlines = [OrderLineInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        Order.objects.filter(pk=form.instance.pk).update_totals()
 
 @admin.register(ProductReview)
 class ProductReviewAdmin(admin.ModelAdmin):
@@ -65,3 +79,18 @@ class GestureDataAdmin(admin.ModelAdmin):
     list_filter = ('gesture_type', 'processed')
     search_fields = ('user__username', 'gesture_type')
     ordering = ('-timestamp',)
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('cart', 'product', 'quantity', 'expires_at')
+    list_select_related = ('cart__user', 'product')
+    search_fields = ('cart__user__username', 'product__name')
+    ordering = ('expires_at',)
+    # reserved_stock est maintenu par api/reservations.py : lecture seule
+    readonly_fields = ('cart', 'product', 'quantity', 'expires_at', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,133 @@
+"""
+Cache des générations IA de produits, indexé sur la requête normalisée.
+
+- Résultat : ``ai-gen:result:<hash>`` -> id du produit généré (TTL AI_GENERATION_CACHE_TTL).
+- En vol : ``ai-gen:inflight:<hash>`` -> id de la tâche Celery. Posé avec ``cache.add``
+  (atomique sous Redis et LocMemCache), il garantit qu'une seule génération tourne
+  par requête normalisée : les recherches concurrentes partagent la même tâche.
+- Jobs : ``ai-gen:job:<task_id>`` marque les tâches de génération lancées par l'API
+  (TTL AI_GENERATION_CACHE_TTL) ; generation-jobs/<task_id>/ ne suit que celles-ci.
+- Compteurs : hits, misses, coalesced et upstream_calls (appels réels au LLM).
+
+L'éviction est celle du backend de cache choisi par AI_GENERATION_CACHE : LocMemCache
+évince en LRU au-delà de MAX_ENTRIES, Redis avec ``maxmemory-policy allkeys-lru``.
+"""
+import hashlib
+import re
+import unicodedata
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_TTL = 60 * 60 * 24
+# Durée maximale d'une génération en vol avant qu'une nouvelle puisse être lancée
+DEFAULT_INFLIGHT_TTL = 120
+
+METRICS = ('hits', 'misses', 'coalesced', 'upstream_calls')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def get_cache():
+    return caches[getattr(settings, 'AI_GENERATION_CACHE', 'default')]
+
+
+def normalize_prompt(query):
+    """
+    Forme canonique d'une recherche : minuscules, sans accents, mots dédoublonnés
+    et triés, pluriels simples retirés ("Chaussures  rouges" == "rouge chaussure").
+    """
+    text = unicodedata.normalize('NFKD', query.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    tokens = set()
+    for token in TOKEN_RE.findall(text):
+        if len(token) > 3 and token.endswith(('s', 'x')):
+            token = token[:-1]
+        tokens.add(token)
+    return ' '.join(sorted(tokens))
+
+
+def get_cache_key(query):
+    digest = hashlib.sha256(normalize_prompt(query).encode('utf-8')).hexdigest()
+    return digest[:32]
+
+
+def result_key(cache_key):
+    return f'ai-gen:result:{cache_key}'
+
+
+def inflight_key(cache_key):
+    return f'ai-gen:inflight:{cache_key}'
+
+
+def job_key(task_id):
+    return f'ai-gen:job:{task_id}'
+
+
+def increment(metric):
+    cache = get_cache()
+    key = f'ai-gen:metrics:{metric}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Clé évincée entre add() et incr()
+        cache.set(key, 1, timeout=None)
+
+
+def get_cached_product_id(cache_key):
+    return get_cache().get(result_key(cache_key))
+
+
+def forget_product(cache_key):
+    get_cache().delete(result_key(cache_key))
+
+
+def get_or_start_generation(cache_key, start):
+    """
+    Renvoie ``(task_id, started)``. Si une génération est déjà en vol pour cette
+    requête, son id est renvoyé ; sinon ``start(task_id)`` est appelé avec un id
+    réservé atomiquement.
+    """
+    cache = get_cache()
+    inflight_ttl = getattr(settings, 'AI_GENERATION_INFLIGHT_TTL', DEFAULT_INFLIGHT_TTL)
+    task_id = str(uuid.uuid4())
+    for _ in range(3):
+        if cache.add(inflight_key(cache_key), task_id, timeout=inflight_ttl):
+            break
+        existing = cache.get(inflight_key(cache_key))
+        if existing is not None:
+            increment('coalesced')
+            return existing, False
+        # La génération en vol vient de se terminer : nouvelle tentative de réservation
+    increment('misses')
+    record_job(task_id)
+    start(task_id)
+    return task_id, True
+
+
+def record_job(task_id):
+    """Marque ``task_id`` comme tâche de génération consultable par l'API"""
+    ttl = getattr(settings, 'AI_GENERATION_CACHE_TTL', DEFAULT_TTL)
+    get_cache().set(job_key(task_id), 1, timeout=ttl)
+
+
+def is_generation_job(task_id):
+    return get_cache().get(job_key(task_id)) is not None
+
+
+def record_result(cache_key, product_id):
+    cache = get_cache()
+    if product_id:
+        ttl = getattr(settings, 'AI_GENERATION_CACHE_TTL', DEFAULT_TTL)
+        cache.set(result_key(cache_key), product_id, timeout=ttl)
+    cache.delete(inflight_key(cache_key))
+
+
+def get_metrics():
+    values = get_cache().get_many([f'ai-gen:metrics:{metric}' for metric in METRICS])
+    metrics = {metric: values.get(f'ai-gen:metrics:{metric}', 0) for metric in METRICS}
+    lookups = metrics['hits'] + metrics['misses'] + metrics['coalesced']
+    metrics['saved_upstream_calls'] = metrics['hits'] + metrics['coalesced']
+    metrics['hit_ratio'] = metrics['saved_upstream_calls'] / lookups if lookups else 0.0
+    return metrics
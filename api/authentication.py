@@ -0,0 +1,96 @@
+"""
+Authentification JWT sans requête par appel.
+
+CachedJWTAuthentication garde en mémoire, par jti, l'utilisateur chargé pour un jeton
+(LRU borné par JWT_PRINCIPAL_CACHE_SIZE, durée JWT_PRINCIPAL_CACHE_TTL et au plus
+l'expiration du jeton). La révocation (api/revocation.py) est vérifiée dans Redis à
+chaque appel : une déconnexion ou une désactivation de compte s'applique
+immédiatement dans tous les workers. Si Redis est indisponible, l'utilisateur est
+rechargé depuis la base comme avec JWTAuthentication.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from redis.exceptions import RedisError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from . import revocation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 60
+
+
+class PrincipalCache:
+    """
+    LRU à durée de vie, propre au processus. Conserve les valeurs des colonnes et
+    reconstruit une instance à chaque lecture : les requêtes ne partagent pas d'objet.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, jti, user_model):
+        with self.lock:
+            entry = self.entries.get(jti)
+            if entry is None:
+                return None
+            expires_at, field_names, values = entry
+            if expires_at <= time.time():
+                del self.entries[jti]
+                return None
+            self.entries.move_to_end(jti)
+        return user_model.from_db(DEFAULT_DB_ALIAS, field_names, values)
+
+    def set(self, jti, user, expires_at):
+        field_names = [field.attname for field in user._meta.concrete_fields]
+        values = tuple(getattr(user, name) for name in field_names)
+        max_size = getattr(settings, 'JWT_PRINCIPAL_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+        with self.lock:
+            self.entries[jti] = (expires_at, field_names, values)
+            self.entries.move_to_end(jti)
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+    def discard(self, jti):
+        with self.lock:
+            self.entries.pop(jti, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+principal_cache = PrincipalCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if jti is None:
+            return super().get_user(validated_token)
+
+        try:
+            revoked = revocation.is_revoked(validated_token)
+        except RedisError as e:
+            logger.warning(f"Révocation JWT invérifiable, utilisateur rechargé depuis la base : {e}")
+            principal_cache.discard(jti)
+            return super().get_user(validated_token)
+        if revoked:
+            principal_cache.discard(jti)
+            raise AuthenticationFailed(_("Token has been revoked"), code='token_revoked')
+
+        user = principal_cache.get(jti, self.user_model)
+        if user is None:
+            user = super().get_user(validated_token)
+            ttl = getattr(settings, 'JWT_PRINCIPAL_CACHE_TTL', DEFAULT_CACHE_TTL)
+            principal_cache.set(jti, user, min(time.time() + ttl, validated_token['exp']))
+        return user
@@ -0,0 +1,255 @@
+"""
+Stockage des paniers utilisé par CartViewSet, choisi par le réglage CART_STORE :
+- ``db`` (défaut) : tables Cart/CartItem ;
+- ``redis`` : un hash Redis par panier (``cart:<id>`` : produit -> quantité), chargé
+  depuis la base au premier accès puis persisté en écriture différée : chaque
+  modification marque le panier dans ``cart:dirty`` et la tâche périodique
+  ``flush_cart_store`` recopie les paniers marqués dans CartItem.
+
+Les identifiants d'articles renvoyés dans les instantanés sont propres au stockage
+(id de CartItem en base, id du produit sous Redis) : les clients les renvoient tels
+quels à update_item et remove_item.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from redis.exceptions import WatchError
+from .models import Cart, CartItem, Product
+from .redis_client import get_redis
+from .serializers import CartSerializer
+
+# Durée de vie d'un panier inactif dans Redis (il reste en base)
+DEFAULT_TTL = 60 * 60 * 24 * 7
+DEFAULT_FLUSH_BATCH = 500
+
+DIRTY_KEY = 'cart:dirty'
+# Champ sentinelle : distingue un panier vide chargé d'un panier absent de Redis
+LOADED_FIELD = '_loaded'
+
+
+class DatabaseCartStore:
+    write_behind = False
+
+    def get_items(self, cart):
+        """Quantités par produit"""
+        quantities = {}
+        for product_id, quantity in cart.items.values_list('product_id', 'quantity'):
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        return quantities
+
+    def get_item_map(self, cart):
+        """Articles par identifiant : {item_id: (product_id, quantité)}"""
+        return {
+            item_id: (product_id, quantity)
+            for item_id, product_id, quantity in cart.items.values_list('id', 'product_id', 'quantity')
+        }
+
+    def replace_items(self, cart, quantities):
+        persist_cart(cart.id, quantities)
+
+    def get_item_product(self, cart, item_id):
+        item = get_object_or_404(CartItem.objects.select_related('product'), id=item_id, cart=cart)
+        return item.product
+
+    def add_item(self, cart, product, quantity):
+        cart_item, created = CartItem.objects.get_or_create(
+            cart=cart,
+            product=product,
+            defaults={'quantity': quantity}
+        )
+        if not created:
+            cart_item.quantity += quantity
+            cart_item.save(update_fields=['quantity'])
+
+    def set_quantity(self, cart, item_id, quantity):
+        CartItem.objects.filter(id=item_id, cart=cart).update(quantity=quantity)
+
+    def remove_item(self, cart, item_id):
+        get_object_or_404(CartItem, id=item_id, cart=cart).delete()
+
+    def persist(self, cart):
+        pass
+
+    def forget(self, cart):
+        pass
+
+    def snapshot(self, cart):
+        """Panier sérialisé, total et sous-totaux calculés en SQL"""
+        return CartSerializer(cart.load_items()).data
+
+
+class RedisCartStore:
+    write_behind = True
+
+    def __init__(self, client=None):
+        self.client = client or get_redis()
+        self.ttl = getattr(settings, 'CART_STORE_TTL', DEFAULT_TTL)
+
+    def key(self, cart_id):
+        return f'cart:{cart_id}'
+
+    def load(self, cart_id):
+        """Charge le panier depuis la base s'il est absent de Redis"""
+        key = self.key(cart_id)
+        if self.client.exists(key):
+            return
+        mapping = {LOADED_FIELD: 1}
+        for product_id, quantity in CartItem.objects.filter(cart_id=cart_id).values_list('product_id', 'quantity'):
+            mapping[product_id] = int(mapping.get(product_id, 0)) + quantity
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.exists(key):
+                    return
+                pipe.multi()
+                pipe.hset(key, mapping=mapping)
+                pipe.expire(key, self.ttl)
+                pipe.execute()
+            except WatchError:
+                # Chargé entre-temps par une autre requête
+                pass
+
+    def get_items(self, cart):
+        self.load(cart.id)
+        return self.decode(self.client.hgetall(self.key(cart.id)))
+
+    def decode(self, values):
+        return {
+            int(product_id): int(quantity)
+            for product_id, quantity in values.items()
+            if product_id != LOADED_FIELD and int(quantity) > 0
+        }
+
+    def get_item_map(self, cart):
+        return {
+            product_id: (product_id, quantity)
+            for product_id, quantity in self.get_items(cart).items()
+        }
+
+    def replace_items(self, cart, quantities):
+        key = self.key(cart.id)
+        stale = set(self.client.hkeys(key)) - {LOADED_FIELD} - {str(pid) for pid in quantities}
+        with self.client.pipeline() as pipe:
+            if stale:
+                pipe.hdel(key, *stale)
+            pipe.hset(key, mapping={LOADED_FIELD: 1, **quantities})
+            pipe.expire(key, self.ttl)
+            pipe.sadd(DIRTY_KEY, cart.id)
+            pipe.execute()
+
+    def get_item_product(self, cart, item_id):
+        self.load(cart.id)
+        if not self.client.hexists(self.key(cart.id), item_id):
+            raise Http404("No CartItem matches the given query.")
+        return get_object_or_404(Product, id=item_id)
+
+    def write(self, cart, apply):
+        self.load(cart.id)
+        key = self.key(cart.id)
+        with self.client.pipeline() as pipe:
+            apply(pipe, key)
+            pipe.expire(key, self.ttl)
+            pipe.sadd(DIRTY_KEY, cart.id)
+            pipe.execute()
+
+    def add_item(self, cart, product, quantity):
+        self.write(cart, lambda pipe, key: pipe.hincrby(key, product.id, quantity))
+
+    def set_quantity(self, cart, item_id, quantity):
+        self.write(cart, lambda pipe, key: pipe.hset(key, item_id, quantity))
+
+    def remove_item(self, cart, item_id):
+        self.load(cart.id)
+        if not self.client.hexists(self.key(cart.id), item_id):
+            raise Http404("No CartItem matches the given query.")
+        self.write(cart, lambda pipe, key: pipe.hdel(key, item_id))
+
+    def persist(self, cart):
+        """Recopie immédiatement le panier en base (avant une validation par exemple)"""
+        if self.client.srem(DIRTY_KEY, cart.id):
+            persist_cart(cart.id, self.decode(self.client.hgetall(self.key(cart.id))))
+
+    def forget(self, cart):
+        self.client.delete(self.key(cart.id))
+
+    def flush(self, batch=None):
+        """Persiste les paniers modifiés ; renvoie le nombre de paniers écrits"""
+        batch = batch or getattr(settings, 'CART_STORE_FLUSH_BATCH', DEFAULT_FLUSH_BATCH)
+        cart_ids = self.client.spop(DIRTY_KEY, batch)
+        if not cart_ids:
+            return 0
+        with self.client.pipeline(transaction=False) as pipe:
+            for cart_id in cart_ids:
+                pipe.hgetall(self.key(cart_id))
+            contents = pipe.execute()
+        for cart_id, values in zip(cart_ids, contents):
+            # Un hash expiré entre-temps n'a plus rien à écrire
+            if values:
+                persist_cart(int(cart_id), self.decode(values))
+        return len(cart_ids)
+
+    def load_items(self, cart):
+        """Articles du panier (CartItem non enregistrés) avec sous-totaux et total, comme with_subtotals"""
+        quantities = self.get_items(cart)
+        products = Product.objects.in_bulk(list(quantities))
+        items = []
+        for product_id in sorted(quantities):
+            product = products.get(product_id)
+            if product is None:
+                continue
+            item = CartItem(id=product_id, cart=cart, product=product, quantity=quantities[product_id])
+            item.line_subtotal = product.price * item.quantity
+            items.append(item)
+        total = sum(item.line_subtotal for item in items)
+        for item in items:
+            item.cart_total = total
+        return items
+
+    def snapshot(self, cart):
+        """Panier sérialisé depuis Redis : une seule requête, sur les produits"""
+        cart._prefetched_objects_cache = {'items': self.load_items(cart)}
+        return CartSerializer(cart).data
+
+
+def persist_cart(cart_id, quantities):
+    """Aligne les lignes CartItem d'un panier sur ``quantities`` (produit -> quantité)"""
+    with transaction.atomic():
+        existing = {}
+        stale = []
+        for item in CartItem.objects.select_for_update().filter(cart_id=cart_id).order_by('id'):
+            if item.product_id in quantities and item.product_id not in existing:
+                existing[item.product_id] = item
+            else:
+                stale.append(item.id)
+        if stale:
+            CartItem.objects.filter(id__in=stale).delete()
+
+        changed = []
+        for product_id, item in existing.items():
+            if item.quantity != quantities[product_id]:
+                item.quantity = quantities[product_id]
+                changed.append(item)
+        if changed:
+            CartItem.objects.bulk_update(changed, ['quantity'])
+
+        valid_products = set(
+            Product.objects.filter(id__in=[pid for pid in quantities if pid not in existing])
+            .values_list('id', flat=True)
+        )
+        CartItem.objects.bulk_create([
+            CartItem(cart_id=cart_id, product_id=product_id, quantity=quantities[product_id])
+            for product_id in sorted(valid_products)
+        ])
+        Cart.objects.filter(id=cart_id).update(updated_at=timezone.now())
+
+
+STORES = {
+    'db': DatabaseCartStore,
+    'redis': RedisCartStore,
+}
+
+
+def get_cart_store():
+    return STORES[getattr(settings, 'CART_STORE', 'db')]()
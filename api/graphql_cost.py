@@ -0,0 +1,269 @@
+"""
+Analyse statique du coût des requêtes GraphQL, avant exécution.
+
+Chaque champ objet coûte 1 (GRAPHQL_FIELD_COSTS ajuste des champs précis, ex. les
+totalCount qui exécutent un COUNT) plus le coût de ses sous-champs, multiplié pour
+les listes : par ``first`` (borné comme la pagination) sur les connexions, par
+GRAPHQL_DEFAULT_LIST_SIZE sur les autres listes. Les scalaires et l'introspection
+sont gratuits.
+
+CostLimitedGraphQLView refuse les requêtes qui dépassent la profondeur ou le coût
+autorisés au profil de l'utilisateur (GRAPHQL_QUERY_LIMITS : anonyme, utilisateur,
+staff) et renvoie le coût calculé dans ``extensions.cost`` de chaque réponse.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import HttpResponseBadRequest, HttpResponseNotAllowed
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    ExecutionResult, FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLError,
+    GraphQLInt, GraphQLInterfaceType, GraphQLList, GraphQLNonNull, GraphQLObjectType,
+    InlineFragmentNode, OperationType, execute, get_named_type, parse, validate,
+    validate_schema, value_from_ast,
+)
+from graphql.execution.values import get_variable_values
+from graphql.pyutils import Undefined
+from graphql.utilities import get_operation_ast
+from rest_framework.exceptions import AuthenticationFailed
+from .authentication import CachedJWTAuthentication
+from .pagination import KeysetPagination
+
+DEFAULT_LIST_SIZE = 10
+
+DEFAULT_FIELD_COSTS = {
+    'ProductConnection.totalCount': 1,
+    'OrderConnection.totalCount': 1,
+}
+
+DEFAULT_QUERY_LIMITS = {
+    'anonymous': {'depth': 6, 'cost': 300},
+    'user': {'depth': 8, 'cost': 1500},
+    'staff': {'depth': 12, 'cost': 10000},
+}
+
+
+class QueryCost:
+    def __init__(self, cost, depth):
+        self.cost = cost
+        self.depth = depth
+
+
+class CostAnalyzer:
+    def __init__(self, schema, document, variables=None):
+        self.schema = schema
+        self.variables = variables or {}
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+        self.field_costs = {**DEFAULT_FIELD_COSTS, **getattr(settings, 'GRAPHQL_FIELD_COSTS', {})}
+        self.list_size = getattr(settings, 'GRAPHQL_DEFAULT_LIST_SIZE', DEFAULT_LIST_SIZE)
+
+    def analyze(self, operation):
+        root_type = self.schema.get_root_type(operation.operation)
+        if root_type is None:
+            return QueryCost(0, 0)
+        # Variables converties comme à l'exécution ; invalides, l'exécution renverra
+        # l'erreur et le coût est estimé avec les valeurs par défaut
+        variables = get_variable_values(self.schema, operation.variable_definitions or (), self.variables)
+        self.variables = variables if isinstance(variables, dict) else {}
+        cost, depth = self.selection_set_cost(operation.selection_set, root_type, 0, frozenset())
+        return QueryCost(cost, depth)
+
+    def selection_set_cost(self, selection_set, parent_type, depth, visited):
+        """(coût, profondeur maximale) d'un ensemble de sélections ; les champs inconnus sont ignorés"""
+        cost = 0
+        max_depth = depth
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                selection_cost, selection_depth = self.field_cost(selection, parent_type, depth, visited)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition is not None:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value) or parent_type
+                selection_cost, selection_depth = self.selection_set_cost(
+                    selection.selection_set, fragment_type, depth, visited
+                )
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                # Un fragment n'est parcouru qu'une fois par branche (défense si le document n'est pas validé)
+                if fragment is None or name in visited:
+                    continue
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value) or parent_type
+                selection_cost, selection_depth = self.selection_set_cost(
+                    fragment.selection_set, fragment_type, depth, visited | {name}
+                )
+            else:
+                continue
+            cost += selection_cost
+            max_depth = max(max_depth, selection_depth)
+        return cost, max_depth
+
+    def field_cost(self, node, parent_type, depth, visited):
+        name = node.name.value
+        if name.startswith('__') or not isinstance(parent_type, (GraphQLObjectType, GraphQLInterfaceType)):
+            return 0, depth
+        field = parent_type.fields.get(name)
+        if field is None:
+            return 0, depth
+
+        named_type = get_named_type(field.type)
+        composite = isinstance(named_type, (GraphQLObjectType, GraphQLInterfaceType))
+        own_cost = self.field_costs.get(f'{parent_type.name}.{name}', 1 if composite else 0)
+        if not composite or node.selection_set is None:
+            return own_cost, depth + 1 if composite else depth
+
+        children_cost, children_depth = self.selection_set_cost(
+            node.selection_set, named_type, depth + 1, visited
+        )
+        return own_cost + self.multiplier(node, field) * children_cost, children_depth
+
+    def multiplier(self, node, field):
+        """Nombre d'éléments estimé d'un champ"""
+        if 'first' in field.args:
+            first = None
+            for argument in node.arguments:
+                if argument.name.value == 'first':
+                    first = value_from_ast(argument.value, GraphQLInt, self.variables)
+            if first is None or first is Undefined:
+                return KeysetPagination.page_size
+            return max(0, min(first, KeysetPagination.max_page_size))
+        field_type = field.type.of_type if isinstance(field.type, GraphQLNonNull) else field.type
+        # Les edges d'une connexion sont déjà comptées par ``first``
+        if isinstance(field_type, GraphQLList) and node.name.value != 'edges':
+            return self.list_size
+        return 1
+
+
+def get_request_user(request):
+    """
+    Utilisateur de la requête avant exécution : JSONWebTokenMiddleware de graphql_jwt
+    ne l'authentifie qu'au premier résolveur, on décode donc le jeton Bearer comme l'API
+    REST (sans passer par authenticate(), qui émettrait user_login_failed à chaque requête
+    anonyme). Un jeton invalide compte comme anonyme : le résolveur le refusera.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            authenticated = CachedJWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            authenticated = None
+        if authenticated is not None:
+            user = authenticated[0]
+    return user
+
+
+def get_query_limits(user):
+    limits = {**DEFAULT_QUERY_LIMITS, **getattr(settings, 'GRAPHQL_QUERY_LIMITS', {})}
+    if user is None or not user.is_authenticated:
+        return limits['anonymous']
+    if user.is_staff:
+        return limits['staff']
+    return limits['user']
+
+
+class CostLimitedGraphQLView(GraphQLView):
+    """
+    Reprend l'exécution de GraphQLView pour insérer la vérification du coût entre la
+    validation et l'exécution. ``get_document`` fournit le document analysé et validé :
+    api/graphql_documents.py le surcharge pour le mettre en cache.
+    """
+
+    def get_document(self, query):
+        """(document, erreurs) : document analysé et validé contre le schéma, ou erreurs"""
+        schema = self.schema.graphql_schema
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return None, schema_validation_errors
+        try:
+            document = parse(query)
+        except GraphQLError as e:
+            return None, [e]
+        validation_errors = validate(
+            schema, document, self.validation_rules, graphene_settings.MAX_VALIDATION_ERRORS
+        )
+        if validation_errors:
+            return None, validation_errors
+        return document, []
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        document, errors = self.get_document(query)
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+
+        operation = get_operation_ast(document, operation_name)
+        if request.method.lower() == 'get' and operation is not None and operation.operation != OperationType.QUERY:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseNotAllowed(
+                ['POST'], f"Can only perform a {operation.operation.value} operation from a POST request."
+            ))
+
+        if operation is not None:
+            cost = CostAnalyzer(self.schema.graphql_schema, document, variables).analyze(operation)
+            limits = get_query_limits(get_request_user(request))
+            request.graphql_cost = {
+                'requested': cost.cost,
+                'depth': cost.depth,
+                'maxCost': limits['cost'],
+                'maxDepth': limits['depth'],
+            }
+            if cost.depth > limits['depth']:
+                return ExecutionResult(errors=[GraphQLError(
+                    f"Query depth {cost.depth} exceeds the maximum of {limits['depth']}",
+                    extensions={'code': 'QUERY_TOO_DEEP'}
+                )])
+            if cost.cost > limits['cost']:
+                return ExecutionResult(errors=[GraphQLError(
+                    f"Query cost {cost.cost} exceeds the maximum of {limits['cost']}",
+                    extensions={'code': 'QUERY_TOO_COSTLY'}
+                )])
+
+        return self.execute_document(request, document, operation, variables, operation_name)
+
+    def execute_document(self, request, document, operation, variables, operation_name):
+        """Exécution d'un document validé, comme GraphQLView (mutations atomiques comprises)"""
+        schema = self.schema.graphql_schema
+        try:
+            execute_options = {
+                'root_value': self.get_root_value(request),
+                'context_value': self.get_context(request),
+                'variable_values': variables,
+                'operation_name': operation_name,
+                'middleware': self.get_middleware(request),
+            }
+            if self.execution_context_class:
+                execute_options['execution_context_class'] = self.execution_context_class
+
+            if (
+                operation is not None
+                and operation.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get('ATOMIC_MUTATIONS', False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            return execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def json_encode(self, request, d, pretty=False):
+        cost = getattr(request, 'graphql_cost', None)
+        if cost is not None and isinstance(d, dict):
+            d = {**d, 'extensions': {**d.get('extensions', {}), 'cost': cost}}
+        return super().json_encode(request, d, pretty)
@@ -0,0 +1,158 @@
+"""
+Requêtes persistées et cache des documents GraphQL.
+
+- Requêtes persistées automatiques (protocole ``persistedQuery`` d'Apollo) : le client
+  envoie ``extensions.persistedQuery.sha256Hash`` sans le texte de la requête. Un hash
+  inconnu renvoie l'erreur ``PersistedQueryNotFound`` ; le client renvoie alors le texte
+  avec le hash, vérifié puis enregistré (``graphql:apq:<hash>`` dans le cache
+  GRAPHQL_PERSISTED_QUERY_CACHE, durée GRAPHQL_PERSISTED_QUERY_TTL) pour tous les workers.
+- Cache des documents : LRU propre au processus (GRAPHQL_DOCUMENT_CACHE_SIZE), indexé
+  par le hash de la requête, des documents analysés et validés contre le schéma. Une
+  requête déjà vue n'est ni réanalysée ni revalidée ; les requêtes invalides ne sont pas
+  conservées. graphql-core ne modifie pas le document à l'exécution, il est partagé
+  entre les requêtes.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.http.response import HttpResponseBadRequest
+from graphene_django.views import HttpError
+from graphql import ExecutionResult, GraphQLError
+from .graphql_cost import CostLimitedGraphQLView
+
+DEFAULT_DOCUMENT_CACHE_SIZE = 500
+DEFAULT_PERSISTED_QUERY_TTL = 60 * 60 * 24 * 30
+
+PERSISTED_QUERY_VERSION = 1
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+def get_cache():
+    return caches[getattr(settings, 'GRAPHQL_PERSISTED_QUERY_CACHE', 'default')]
+
+
+def persisted_query_key(sha256_hash):
+    return f'graphql:apq:{sha256_hash}'
+
+
+def get_persisted_query(sha256_hash):
+    return get_cache().get(persisted_query_key(sha256_hash))
+
+
+def persist_query(sha256_hash, query):
+    ttl = getattr(settings, 'GRAPHQL_PERSISTED_QUERY_TTL', DEFAULT_PERSISTED_QUERY_TTL)
+    get_cache().set(persisted_query_key(sha256_hash), query, ttl)
+
+
+class DocumentCache:
+    """LRU des documents validés, propre au processus"""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            document = self.entries.get(key)
+            if document is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return document
+
+    def set(self, key, document):
+        max_size = getattr(settings, 'GRAPHQL_DOCUMENT_CACHE_SIZE', DEFAULT_DOCUMENT_CACHE_SIZE)
+        with self.lock:
+            self.entries[key] = document
+            self.entries.move_to_end(key)
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+document_cache = DocumentCache()
+
+
+def persisted_query_error(message, code):
+    return GraphQLError(message, extensions={'code': code})
+
+
+class PersistedQueryGraphQLView(CostLimitedGraphQLView):
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+        request.persisted_query_error = None
+
+        extension = self.get_persisted_query_extension(request, data)
+        if extension is None:
+            return query, variables, operation_name, id
+
+        sha256_hash = extension.get('sha256Hash')
+        if extension.get('version', PERSISTED_QUERY_VERSION) != PERSISTED_QUERY_VERSION or not isinstance(sha256_hash, str):
+            request.persisted_query_error = persisted_query_error(
+                'PersistedQueryNotSupported', 'PERSISTED_QUERY_NOT_SUPPORTED'
+            )
+        elif query:
+            # Enregistrement au premier usage : le hash doit être celui du texte envoyé
+            if query_hash(query) != sha256_hash:
+                raise HttpError(HttpResponseBadRequest("provided sha does not match query"))
+            persist_query(sha256_hash, query)
+        else:
+            query = get_persisted_query(sha256_hash)
+            if query is None:
+                request.persisted_query_error = persisted_query_error(
+                    'PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND'
+                )
+        return query, variables, operation_name, id
+
+    @staticmethod
+    def get_persisted_query_extension(request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        if not isinstance(extensions, dict):
+            return None
+        extension = extensions.get('persistedQuery')
+        return extension if isinstance(extension, dict) else None
+
+    def get_response(self, request, data, show_graphiql=False):
+        result, status_code = super().get_response(request, data, show_graphiql)
+        # Le client attend un 200 pour renvoyer la requête complète
+        if getattr(request, 'persisted_query_error', None) is not None:
+            status_code = 200
+        return result, status_code
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        error = getattr(request, 'persisted_query_error', None)
+        if error is not None:
+            return ExecutionResult(errors=[error])
+        return super().execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+    def get_document(self, query):
+        key = query_hash(query)
+        document = document_cache.get(key)
+        if document is not None:
+            return document, []
+        document, errors = super().get_document(query)
+        if not errors:
+            document_cache.set(key, document)
+        return document, errors
@@ -0,0 +1,298 @@
+"""
+Transport websocket de GraphQL (protocole ``graphql-transport-ws``), servi par
+mobile_app/asgi.py sur ``/graphql/``.
+
+Le client s'authentifie dans ``connection_init`` (``{"authorization": "Bearer <jwt>"}``),
+puis chaque ``subscribe`` exécute une opération : les abonnements (api/schema.py,
+Subscription) envoient un ``next`` par événement publié jusqu'au ``complete`` du
+client ; les requêtes et mutations, un seul. Les documents passent par le même cache
+et les mêmes limites de coût que le point d'accès HTTP.
+
+Le jeton reste vérifié pendant la connexion : la socket est fermée (4401) à son
+expiration, ou au premier événement qui suit sa révocation (déconnexion, compte
+désactivé ou supprimé, api/revocation.py).
+
+L'ORM est synchrone : chaque événement est résolu dans le thread de sync_to_async,
+la boucle ne fait qu'attendre les messages. Une socket inactive ne coûte qu'une file
+d'attente dans le courtier (api/subscriptions.py).
+"""
+import asyncio
+import json
+import logging
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from graphql import ExecutionResult, GraphQLError, OperationType, execute, get_operation_ast
+from graphql.execution import create_source_event_stream
+from redis.exceptions import RedisError
+from rest_framework.exceptions import AuthenticationFailed
+from . import revocation
+from .authentication import CachedJWTAuthentication
+from .graphql_cost import CostAnalyzer, get_query_limits
+from .graphql_documents import PersistedQueryGraphQLView
+from .schema import schema
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL = 'graphql-transport-ws'
+
+# Délai accordé au client pour envoyer connection_init (secondes)
+DEFAULT_INIT_TIMEOUT = 10
+
+CLOSE_INVALID_MESSAGE = 4400
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_INIT_TIMEOUT = 4408
+CLOSE_SUBSCRIBER_EXISTS = 4409
+CLOSE_TOO_MANY_INIT = 4429
+
+
+def database_sync_to_async(func):
+    """sync_to_async qui referme les connexions obsolètes, comme le cycle d'une requête HTTP"""
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=True)
+
+
+def authenticate_token(raw_token):
+    """(utilisateur, jeton validé) d'un jeton d'accès ; lève AuthenticationFailed s'il est invalide ou révoqué"""
+    authentication = CachedJWTAuthentication()
+    token = authentication.get_validated_token(raw_token)
+    return authentication.get_user(token), token
+
+
+class SubscriptionContext:
+    """``info.context`` d'une opération : un par événement, pour des chargeurs neufs"""
+
+    def __init__(self, user):
+        self.user = user
+
+
+class GraphQLWebSocket:
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.send_lock = asyncio.Lock()
+        self.view = PersistedQueryGraphQLView(schema=schema)
+        self.user = AnonymousUser()
+        self.token = None
+        self.expiry = None
+        self.init_received = False
+        self.acknowledged = False
+        self.closed = False
+        self.operations = {}
+
+    async def run(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        if PROTOCOL not in self.scope.get('subprotocols', []):
+            await self.send({'type': 'websocket.close'})
+            return
+        await self.send({'type': 'websocket.accept', 'subprotocol': PROTOCOL})
+
+        init_timeout = asyncio.create_task(self.close_unless_initialised())
+        try:
+            while not self.closed:
+                message = await self.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if message['type'] == 'websocket.receive':
+                    await self.handle(message.get('text') or message.get('bytes'))
+        finally:
+            tasks = [init_timeout, *self.operations.values()]
+            if self.expiry is not None:
+                tasks.append(self.expiry)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def close_unless_initialised(self):
+        await asyncio.sleep(getattr(settings, 'GRAPHQL_WS_INIT_TIMEOUT', DEFAULT_INIT_TIMEOUT))
+        if not self.acknowledged:
+            await self.close(CLOSE_INIT_TIMEOUT, 'Connection initialisation timeout')
+
+    async def close_on_expiry(self):
+        await asyncio.sleep(max(self.token['exp'] - time.time(), 0))
+        if not self.closed:
+            await self.close(CLOSE_UNAUTHORIZED, 'Token expired')
+
+    async def token_is_valid(self):
+        """Vérifie le jeton de la connexion avant un événement ; ferme la socket sinon"""
+        if self.token is None:
+            return True
+        if self.token['exp'] <= time.time():
+            await self.close(CLOSE_UNAUTHORIZED, 'Token expired')
+            return False
+        try:
+            revoked = await sync_to_async(revocation.is_revoked)(self.token)
+        except RedisError as e:
+            # Même dégradation que CachedJWTAuthentication : la révocation est invérifiable
+            logger.warning(f"Révocation JWT invérifiable, abonnement maintenu : {e}")
+            return True
+        if revoked:
+            await self.close(CLOSE_UNAUTHORIZED, 'Token has been revoked')
+            return False
+        return True
+
+    async def handle(self, text):
+        try:
+            message = json.loads(text)
+            message_type = message['type']
+        except (TypeError, ValueError, KeyError):
+            await self.close(CLOSE_INVALID_MESSAGE, 'Invalid message received')
+            return
+
+        if message_type == 'connection_init':
+            await self.initialise(message.get('payload') or {})
+        elif message_type == 'ping':
+            await self.send_message({'type': 'pong'})
+        elif message_type == 'pong':
+            pass
+        elif message_type == 'subscribe':
+            await self.subscribe(message)
+        elif message_type == 'complete':
+            task = self.operations.pop(message.get('id'), None)
+            if task is not None:
+                task.cancel()
+        else:
+            await self.close(CLOSE_INVALID_MESSAGE, 'Invalid message received')
+
+    async def initialise(self, payload):
+        if self.init_received:
+            await self.close(CLOSE_TOO_MANY_INIT, 'Too many initialisation requests')
+            return
+        self.init_received = True
+
+        authorization = payload.get('authorization') or payload.get('Authorization')
+        if authorization:
+            # "Bearer <jeton>" (REST) ou "JWT <jeton>" (graphql_jwt)
+            try:
+                self.user, self.token = await database_sync_to_async(authenticate_token)(authorization.split()[-1])
+            except AuthenticationFailed:
+                await self.close(CLOSE_FORBIDDEN, 'Forbidden')
+                return
+            self.expiry = asyncio.create_task(self.close_on_expiry())
+        self.acknowledged = True
+        await self.send_message({'type': 'connection_ack'})
+
+    async def subscribe(self, message):
+        if not self.acknowledged:
+            await self.close(CLOSE_UNAUTHORIZED, 'Unauthorized')
+            return
+        operation_id = message.get('id')
+        payload = message.get('payload')
+        if not isinstance(operation_id, str) or not isinstance(payload, dict) or not payload.get('query'):
+            await self.close(CLOSE_INVALID_MESSAGE, 'Invalid message received')
+            return
+        if operation_id in self.operations:
+            await self.close(CLOSE_SUBSCRIBER_EXISTS, f'Subscriber for {operation_id} already exists')
+            return
+        self.operations[operation_id] = asyncio.create_task(self.run_operation(operation_id, payload))
+
+    async def run_operation(self, operation_id, payload):
+        try:
+            errors = await self.execute_operation(operation_id, payload)
+            if errors:
+                await self.send_message({
+                    'id': operation_id, 'type': 'error', 'payload': [error.formatted for error in errors]
+                })
+            elif not self.closed:
+                await self.send_message({'id': operation_id, 'type': 'complete'})
+        finally:
+            self.operations.pop(operation_id, None)
+
+    async def execute_operation(self, operation_id, payload):
+        """Exécute l'opération ; renvoie les erreurs qui l'empêchent de démarrer"""
+        variables = payload.get('variables') or {}
+        operation_name = payload.get('operationName')
+
+        document, errors = self.view.get_document(payload['query'])
+        if errors:
+            return errors
+        operation = get_operation_ast(document, operation_name)
+        if operation is None:
+            return [GraphQLError("Must provide a valid operation name.")]
+
+        cost = CostAnalyzer(schema.graphql_schema, document, variables).analyze(operation)
+        limits = get_query_limits(self.user)
+        if cost.depth > limits['depth']:
+            return [GraphQLError(
+                f"Query depth {cost.depth} exceeds the maximum of {limits['depth']}",
+                extensions={'code': 'QUERY_TOO_DEEP'}
+            )]
+        if cost.cost > limits['cost']:
+            return [GraphQLError(
+                f"Query cost {cost.cost} exceeds the maximum of {limits['cost']}",
+                extensions={'code': 'QUERY_TOO_COSTLY'}
+            )]
+
+        if operation.operation != OperationType.SUBSCRIPTION:
+            result = await database_sync_to_async(self.execute_document)(
+                document, operation, None, variables, operation_name
+            )
+            await self.send_result(operation_id, result)
+            return []
+
+        stream = await create_source_event_stream(
+            schema.graphql_schema, document, None, SubscriptionContext(self.user), variables, operation_name
+        )
+        if isinstance(stream, ExecutionResult):
+            return stream.errors
+        try:
+            async for event in stream:
+                if not await self.token_is_valid():
+                    break
+                result = await database_sync_to_async(self.execute_document)(
+                    document, operation, event, variables, operation_name
+                )
+                await self.send_result(operation_id, result)
+        finally:
+            await stream.aclose()
+        return []
+
+    def execute_document(self, document, operation, root_value, variables, operation_name):
+        execute_options = {
+            'root_value': root_value,
+            'context_value': SubscriptionContext(self.user),
+            'variable_values': variables,
+            'operation_name': operation_name,
+        }
+        try:
+            if operation.operation == OperationType.MUTATION:
+                with transaction.atomic():
+                    return execute(schema.graphql_schema, document, **execute_options)
+            return execute(schema.graphql_schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    async def send_result(self, operation_id, result):
+        payload = {'data': result.data}
+        if result.errors:
+            payload['errors'] = [
+                error.formatted if isinstance(error, GraphQLError) else {'message': str(error)}
+                for error in result.errors
+            ]
+        await self.send_message({'id': operation_id, 'type': 'next', 'payload': payload})
+
+    async def send_message(self, message):
+        async with self.send_lock:
+            await self.send({'type': 'websocket.send', 'text': json.dumps(message, cls=DjangoJSONEncoder)})
+
+    async def close(self, code, reason):
+        self.closed = True
+        async with self.send_lock:
+            await self.send({'type': 'websocket.close', 'code': code, 'reason': reason})
+
+
+async def graphql_ws_application(scope, receive, send):
+    await GraphQLWebSocket(scope, receive, send).run()
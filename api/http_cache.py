@@ -0,0 +1,115 @@
+"""
+GET conditionnels des produits (ProductViewSet : list, retrieve, reviews, ai_generated).
+
+L'ETag faible d'une réponse combine :
+- la version du catalogue (``catalog:version`` dans le cache CATALOG_VERSION_CACHE),
+  incrémentée par api/signals.py quand change ce que ``updated_at`` ne couvre pas :
+  création ou suppression d'un produit, avis, nom d'un auteur d'avis ;
+- le ``updated_at`` des produits, avancé par chaque écriture d'un produit, y compris
+  les UPDATE du stock, des réservations et des notes (ProductQuerySet, reservations.py).
+
+Un ``If-None-Match`` qui correspond est servi en 304 après une seule requête étroite
+(``updated_at`` du produit, ou des produits de la page demandée), sans sérialiseur
+ni préchargement des avis. Sans If-None-Match, l'ETag est calculé sur les produits
+déjà chargés pour la réponse : aucune requête supplémentaire.
+Cache-Control (PRODUCT_CACHE_CONTROL) : par défaut ``private, no-cache``, le client
+revalide à chaque fois ; derrière un CDN, par exemple ``{'public': True, 's_maxage': 30}``.
+"""
+import hashlib
+import secrets
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+from .models import Product
+
+VERSION_KEY = 'catalog:version'
+
+DEFAULT_CACHE_CONTROL = {'private': True, 'no_cache': True}
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_VERSION_CACHE', 'default')]
+
+
+def initial_version():
+    # Après une éviction, la version repart d'une valeur aléatoire : pas d'ETag déjà servi
+    return secrets.randbits(48)
+
+
+def catalog_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, initial_version(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, initial_version(), None)
+
+
+def fingerprint(products):
+    """Identifiant et ``updated_at`` de chaque produit représenté"""
+    return ','.join(f'{product.pk}:{int(product.updated_at.timestamp() * 1_000_000)}' for product in products)
+
+
+def product_etag(version, product, prefix='product'):
+    return f'W/"{prefix}-{version}-{fingerprint([product])}"'
+
+
+def current_product_etag(version, pk, prefix='product'):
+    """ETag actuel d'un produit en une requête d'une colonne, ou None s'il n'existe pas"""
+    try:
+        product = Product.objects.filter(pk=pk).only('updated_at').first()
+    except (TypeError, ValueError, ValidationError):
+        return None
+    return product_etag(version, product, prefix) if product is not None else None
+
+
+def page_etag(version, page, has_next):
+    digest = hashlib.sha1(f'{fingerprint(page)}|{has_next}'.encode()).hexdigest()
+    return f'W/"products-{version}-{digest}"'
+
+
+def etag_matches(request, etag):
+    """Comparaison faible (RFC 9110) avec If-None-Match"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    target = etag.removeprefix('W/')
+    return any(tag.removeprefix('W/') == target for tag in parse_etags(header))
+
+
+def conditional_response(request, current_etag, build):
+    """
+    ``current_etag(version)`` calcule l'ETag de l'état actuel, seulement si le client
+    envoie If-None-Match ; ``build(version)`` renvoie (réponse, ETag des données
+    sérialisées). Les deux doivent suivre la même formule. La version est lue avant les
+    données : une modification concurrente donne au pire un ETag déjà périmé.
+    """
+    version = catalog_version()
+    if request.method in ('GET', 'HEAD') and request.META.get('HTTP_IF_NONE_MATCH'):
+        etag = current_etag(version)
+        if etag is not None and etag_matches(request, etag):
+            return add_validators(Response(status=304), etag)
+    response, etag = build(version)
+    if etag is not None and response.status_code == 200:
+        add_validators(response, etag)
+    return response
+
+
+def add_validators(response, etag):
+    response['ETag'] = etag
+    patch_cache_control(response, **getattr(settings, 'PRODUCT_CACHE_CONTROL', DEFAULT_CACHE_CONTROL))
+    patch_vary_headers(response, ('Accept', 'Authorization'))
+    return response
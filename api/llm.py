@@ -0,0 +1,135 @@
+"""
+Fournisseurs LLM utilisés par les tâches IA (génération de produits, gestes).
+
+Le fournisseur est choisi par le réglage LLM_PROVIDER :
+- ``openai`` (défaut) : API OpenAI, client créé à la première utilisation ;
+- ``fake`` : fournisseur local déterministe, sans réseau ni quota, dont la
+  latence, le taux d'erreurs et le taux de 429 sont configurables
+  (LLM_FAKE_LATENCY, LLM_FAKE_ERROR_RATE, LLM_FAKE_RATE_LIMIT_RATE, LLM_FAKE_SEED).
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+import openai
+from django.conf import settings
+
+
+class LLMError(Exception):
+    """Erreur du fournisseur LLM"""
+
+
+class LLMRateLimitError(LLMError):
+    """Quota dépassé (HTTP 429) : la requête peut être retentée plus tard"""
+
+
+class OpenAIProvider:
+    name = 'openai-gpt-3.5-turbo'
+    model = 'gpt-3.5-turbo'
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self._client = None
+
+    def is_available(self):
+        return bool(self.api_key) and not self.api_key.startswith('sk-xxxxxxx')
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = openai.OpenAI(api_key=self.api_key)
+        return self._client
+
+    def complete(self, messages, task=None, max_tokens=300, temperature=0.7):
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+        except openai.RateLimitError as e:
+            raise LLMRateLimitError(str(e)) from e
+        except openai.OpenAIError as e:
+            raise LLMError(str(e)) from e
+        return response.choices[0].message.content
+
+
+class FakeLLMProvider:
+    """
+    Fournisseur local pour les tests de charge. Les réponses dépendent uniquement
+    du prompt ; les pannes suivent une séquence pseudo-aléatoire initialisée par
+    ``seed``, donc reproductible d'une exécution à l'autre.
+    """
+    name = 'fake-llm'
+
+    GESTURES = ('swipe_left', 'swipe_right', 'tap', 'circle', 'shake')
+
+    def __init__(self, latency=0.0, error_rate=0.0, rate_limit_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'rate_limited': 0, 'errors': 0}
+
+    def is_available(self):
+        return True
+
+    def complete(self, messages, task=None, max_tokens=300, temperature=0.7):
+        with self._lock:
+            self.stats['calls'] += 1
+            draw = self._random.random()
+        if self.latency:
+            time.sleep(self.latency)
+        if draw < self.rate_limit_rate:
+            with self._lock:
+                self.stats['rate_limited'] += 1
+            raise LLMRateLimitError("Fake provider: rate limit exceeded (429)")
+        if draw < self.rate_limit_rate + self.error_rate:
+            with self._lock:
+                self.stats['errors'] += 1
+            raise LLMError("Fake provider: upstream error")
+
+        prompt = messages[-1]['content']
+        digest = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest(), 16)
+        if task == 'gesture_classification':
+            gesture = self.GESTURES[digest % len(self.GESTURES)]
+            confidence = 0.5 + (digest % 50) / 100
+            return f"Type: {gesture}\nConfidence: {confidence:.2f}"
+        return json.dumps({
+            'name': f"Produit {digest % 100000:05d}",
+            'description': f"Produit généré localement pour : {prompt[:80]}",
+            'price': round(10 + (digest % 99000) / 100, 2),
+            'stock': 1 + digest % 100,
+        })
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_llm_provider():
+    """Fournisseur configuré ; une instance par configuration (les compteurs du faux sont partagés)"""
+    name = getattr(settings, 'LLM_PROVIDER', 'openai')
+    if name == 'fake':
+        config = (
+            name,
+            getattr(settings, 'LLM_FAKE_LATENCY', 0.0),
+            getattr(settings, 'LLM_FAKE_ERROR_RATE', 0.0),
+            getattr(settings, 'LLM_FAKE_RATE_LIMIT_RATE', 0.0),
+            getattr(settings, 'LLM_FAKE_SEED', 0),
+        )
+    elif name == 'openai':
+        config = (name, settings.OPENAI_API_KEY)
+    else:
+        raise LLMError(f"Unknown LLM_PROVIDER: {name}")
+
+    with _providers_lock:
+        if config not in _providers:
+            if name == 'fake':
+                _providers[config] = FakeLLMProvider(*config[1:])
+            else:
+                _providers[config] = OpenAIProvider(*config[1:])
+        return _providers[config]
@@ -0,0 +1,80 @@
+"""
+DataLoaders des résolveurs GraphQL (api/schema.py), un jeu par requête.
+
+graphql-core exécute les requêtes synchrones en profondeur : les champs d'un élément
+de liste sont résolus avant de passer à l'élément suivant, et un chargeur ne peut donc
+pas attendre la fin d'un niveau pour grouper ses clés. Les résolveurs qui renvoient
+une liste annoncent les clés dont leurs éléments auront besoin (``prime``) ; le
+premier ``load`` absent du cache charge toutes les clés annoncées en une requête.
+Une clé jamais annoncée est chargée seule : le résultat reste correct.
+"""
+from .cart_store import get_cart_store
+from .models import Cart, CartItem, MobileUser, Product, ProductReview
+
+
+class DataLoader:
+    def __init__(self, batch_load, default=None):
+        # batch_load(clés) -> {clé: valeur}
+        self.batch_load = batch_load
+        self.default = default
+        self.cache = {}
+        self.pending = set()
+
+    def prime(self, keys):
+        """Annonce des clés qui seront chargées au prochain lot"""
+        self.pending.update(key for key in keys if key is not None and key not in self.cache)
+
+    def prime_values(self, values):
+        """Ajoute au cache des valeurs déjà chargées ailleurs ({clé: valeur})"""
+        self.cache.update(values)
+        self.pending.difference_update(values)
+
+    def load(self, key):
+        if key is None:
+            return self.default
+        if key not in self.cache:
+            keys = self.pending | {key}
+            self.pending = set()
+            loaded = self.batch_load(list(keys))
+            for batch_key in keys:
+                self.cache[batch_key] = loaded.get(batch_key, self.default)
+        return self.cache[key]
+
+
+class Loaders:
+    def __init__(self):
+        self.users = DataLoader(MobileUser.objects.in_bulk)
+        self.products = DataLoader(Product.objects.in_bulk)
+        self.reviews_by_product = DataLoader(self.load_reviews, default=[])
+        self.cart_items_by_cart = DataLoader(self.load_cart_items, default=[])
+
+    def load_reviews(self, product_ids):
+        reviews = {}
+        for review in ProductReview.objects.filter(product_id__in=product_ids).order_by('-created_at', '-id'):
+            reviews.setdefault(review.product_id, []).append(review)
+        # Auteurs et produits des avis chargés au premier champ qui les demande
+        self.users.prime(review.user_id for group in reviews.values() for review in group)
+        self.products.prime(reviews)
+        return reviews
+
+    def load_cart_items(self, cart_ids):
+        items = {}
+        store = get_cart_store()
+        if store.write_behind:
+            # Sous Redis, CartItem n'est à jour qu'après la persistance différée : lecture dans le magasin
+            for cart_id in cart_ids:
+                items[cart_id] = store.load_items(Cart(id=cart_id))
+        else:
+            for item in CartItem.objects.filter(cart_id__in=cart_ids).with_subtotals():
+                items.setdefault(item.cart_id, []).append(item)
+        # Les produits viennent avec les articles (select_related ou in_bulk)
+        self.products.prime_values({item.product_id: item.product for group in items.values() for item in group})
+        return items
+
+
+def get_loaders(info):
+    """Chargeurs de la requête HTTP en cours, créés au premier appel"""
+    loaders = getattr(info.context, 'loaders', None)
+    if loaders is None:
+        loaders = info.context.loaders = Loaders()
+    return loaders
@@ -0,0 +1,87 @@
+"""
+Suivi des connexions (last_login, last_login_ip), choisi par le réglage LOGIN_TRACKING :
+- ``db`` (défaut) : un UPDATE des deux colonnes à chaque connexion ;
+- ``redis`` : la connexion est notée dans le hash ``login:pending`` (utilisateur ->
+  horodatage|adresse, la plus récente l'emporte) et la tâche périodique
+  ``flush_login_tracking`` l'écrit en base par lots de bulk_update, hors du chemin
+  de la requête.
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from redis.exceptions import RedisError, ResponseError
+from .models import MobileUser
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_BATCH = 1000
+
+PENDING_KEY = 'login:pending'
+# Lot en cours d'écriture : conservé jusqu'à la fin du bulk_update pour être repris en cas d'échec
+FLUSHING_KEY = 'login:flushing'
+
+
+class DatabaseLoginTracker:
+    write_behind = False
+
+    def record(self, user, ip):
+        user.record_login(ip)
+
+
+class RedisLoginTracker:
+    write_behind = True
+
+    def __init__(self, client=None):
+        self.client = client or get_redis()
+
+    def record(self, user, ip):
+        try:
+            self.client.hset(PENDING_KEY, user.pk, f'{timezone.now().timestamp()}|{ip or ""}')
+        except RedisError as e:
+            # Redis indisponible : la connexion réussit, notée directement en base
+            logger.warning(f"Suivi de connexion différé impossible, écriture en base : {e}")
+            user.record_login(ip)
+
+    def flush(self, batch=None):
+        """Écrit les connexions en attente ; renvoie le nombre d'utilisateurs mis à jour"""
+        batch = batch or getattr(settings, 'LOGIN_TRACKING_FLUSH_BATCH', DEFAULT_FLUSH_BATCH)
+        if not self.client.exists(FLUSHING_KEY):
+            try:
+                self.client.renamenx(PENDING_KEY, FLUSHING_KEY)
+            except ResponseError:
+                # Aucune connexion en attente
+                return 0
+
+        users = []
+        flushed = 0
+        for user_id, value in self.client.hscan_iter(FLUSHING_KEY, count=batch):
+            timestamp, ip = value.split('|', 1)
+            users.append(MobileUser(
+                pk=int(user_id),
+                last_login=datetime.fromtimestamp(float(timestamp), tz=dt_timezone.utc),
+                last_login_ip=ip or None,
+            ))
+            if len(users) >= batch:
+                flushed += self.write(users)
+                users = []
+        if users:
+            flushed += self.write(users)
+        self.client.delete(FLUSHING_KEY)
+        return flushed
+
+    def write(self, users):
+        # Utilisateurs supprimés entre-temps : aucune ligne modifiée
+        MobileUser.objects.bulk_update(users, ['last_login', 'last_login_ip'])
+        return len(users)
+
+
+TRACKERS = {
+    'db': DatabaseLoginTracker,
+    'redis': RedisLoginTracker,
+}
+
+
+def get_login_tracker():
+    return TRACKERS[getattr(settings, 'LOGIN_TRACKING', 'db')]()
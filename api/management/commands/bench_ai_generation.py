@@ -0,0 +1,85 @@
+import queue
+import statistics
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from api.llm import get_llm_provider
+from api.models import Product
+from api.tasks import generate_product_with_ai
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure hors ligne le débit de generate_product_with_ai avec le fournisseur LLM local "
+        "(latence, erreurs et 429 simulés) : débit, tentatives, profondeur de file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=100, help="Nombre de tâches à exécuter")
+        parser.add_argument('--workers', type=int, default=4, help="Nombre de workers simulés")
+        parser.add_argument('--latency', type=float, default=0.05, help="Latence simulée par appel (s)")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Proportion d'erreurs amont")
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Proportion de 429")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help="Conserver les produits créés")
+
+    def handle(self, *args, **options):
+        with override_settings(
+            LLM_PROVIDER='fake',
+            LLM_FAKE_LATENCY=options['latency'],
+            LLM_FAKE_ERROR_RATE=options['error_rate'],
+            LLM_FAKE_RATE_LIMIT_RATE=options['rate_limit_rate'],
+            LLM_FAKE_SEED=options['seed'],
+        ):
+            provider = get_llm_provider()
+            provider.stats.update(calls=0, rate_limited=0, errors=0)
+            results = self.run(options['tasks'], options['workers'])
+            stats = dict(provider.stats)
+
+        created = [product_id for product_id, _ in results['runs'] if product_id]
+        durations = sorted(duration for _, duration in results['runs'])
+        elapsed = results['elapsed']
+
+        self.stdout.write(f"Tâches            : {options['tasks']} ({options['workers']} workers)")
+        self.stdout.write(f"Durée totale      : {elapsed:.2f}s")
+        self.stdout.write(f"Débit             : {options['tasks'] / elapsed:.1f} tâches/s")
+        self.stdout.write(f"Latence p50 / p95 : {statistics.median(durations) * 1000:.1f}ms / "
+                          f"{durations[int(len(durations) * 0.95) - 1] * 1000:.1f}ms")
+        self.stdout.write(f"Appels amont      : {stats['calls']} (429: {stats['rate_limited']}, erreurs: {stats['errors']})")
+        self.stdout.write(f"Tentatives (retry): {stats['calls'] - options['tasks']}")
+        self.stdout.write(f"Produits créés    : {len(created)}")
+        self.stdout.write(f"File max / moyenne: {max(results['depths'])} / {statistics.mean(results['depths']):.1f}")
+
+        if not options['keep']:
+            Product.objects.filter(id__in=created).delete()
+
+    def run(self, tasks, workers):
+        jobs = queue.Queue()
+        for i in range(tasks):
+            jobs.put(f"Produit de test de charge n°{i}")
+        runs = []
+        depths = []
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                try:
+                    prompt = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                started = time.perf_counter()
+                product_id = generate_product_with_ai.apply(args=[prompt]).result
+                with lock:
+                    runs.append((product_id, time.perf_counter() - started))
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            depths.append(jobs.qsize())
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        return {'runs': runs, 'depths': depths or [0], 'elapsed': time.perf_counter() - started}
@@ -0,0 +1,144 @@
+import asyncio
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.client import AsyncRequestFactory
+from rest_framework.test import APIRequestFactory
+from api.models import MobileUser
+
+HASHERS = {
+    'pbkdf2': 'api.passwords.ConfigurablePBKDF2PasswordHasher',
+    'bcrypt': 'api.passwords.ConfigurableBCryptSHA256PasswordHasher',
+    'argon2': 'api.passwords.ConfigurableArgon2PasswordHasher',
+    'md5': 'django.contrib.auth.hashers.MD5PasswordHasher',
+}
+
+# Réglage de coût de chaque hacheur (--cost)
+COST_SETTINGS = {
+    'pbkdf2': 'PASSWORD_PBKDF2_ITERATIONS',
+    'bcrypt': 'PASSWORD_BCRYPT_ROUNDS',
+    'argon2': 'PASSWORD_ARGON2_TIME_COST',
+}
+
+PASSWORD = 'bench-password-123'
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure l'inscription et la connexion (UserRegisterView, UserLoginView ou la "
+        "connexion asynchrone) selon le hacheur de mots de passe et son coût"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasher', choices=sorted(HASHERS), default='pbkdf2')
+        parser.add_argument('--cost', type=int, help="Itérations PBKDF2, tours bcrypt ou time_cost Argon2")
+        parser.add_argument('--users', type=int, default=40, help="Utilisateurs inscrits puis connectés")
+        parser.add_argument('--concurrency', type=int, default=8, help="Requêtes simultanées")
+        parser.add_argument('--async', dest='use_async', action='store_true',
+                            help="Connexion par api.views.async_login (hachage dans le pool)")
+
+    def handle(self, *args, **options):
+        overrides = {'PASSWORD_HASHERS': [HASHERS[options['hasher']]]}
+        if options['cost'] is not None:
+            if options['hasher'] not in COST_SETTINGS:
+                raise CommandError(f"--cost ne s'applique pas à {options['hasher']}")
+            overrides[COST_SETTINGS[options['hasher']]] = options['cost']
+
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        usernames = [f"{prefix}-{i}" for i in range(options['users'])]
+        try:
+            with override_settings(**overrides):
+                register = self.run_threaded(self.register, usernames, options['concurrency'])
+                if options['use_async']:
+                    login, lag = asyncio.run(self.run_async(usernames, options['concurrency']))
+                else:
+                    login = self.run_threaded(self.login, usernames, options['concurrency'])
+                    lag = None
+        finally:
+            MobileUser.objects.filter(username__startswith=prefix).delete()
+
+        label = options['hasher'] + (f" coût={options['cost']}" if options['cost'] is not None else '')
+        self.report(f"inscription {label}", *register)
+        self.report(f"connexion{' asynchrone' if options['use_async'] else ''} {label}", *login)
+        if lag is not None:
+            self.stdout.write(f"retard maximal de la boucle d'événements : {lag * 1000:.1f}ms")
+
+    def register(self, username):
+        from api.views import UserRegisterView
+        request = APIRequestFactory().post(
+            '/api/v1/users/register/', {'username': username, 'password': PASSWORD}, format='json'
+        )
+        try:
+            return UserRegisterView.as_view()(request).status_code == 201
+        finally:
+            connection.close()
+
+    def login(self, username):
+        from api.views import UserLoginView
+        request = APIRequestFactory().post(
+            '/api/v1/users/login/', {'username': username, 'password': PASSWORD}, format='json'
+        )
+        try:
+            return UserLoginView.as_view()(request).status_code == 200
+        finally:
+            connection.close()
+
+    def run_threaded(self, func, usernames, concurrency):
+        def timed(username):
+            started = time.perf_counter()
+            ok = func(username)
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, usernames))
+        return results, time.perf_counter() - started
+
+    async def run_async(self, usernames, concurrency):
+        from api.views import async_login
+        factory = AsyncRequestFactory()
+        semaphore = asyncio.Semaphore(concurrency)
+        lag = 0.0
+        done = asyncio.Event()
+
+        async def watch_loop():
+            # Un hachage exécuté dans la boucle retarderait ce réveil d'autant
+            nonlocal lag
+            while not done.is_set():
+                expected = time.perf_counter() + 0.01
+                await asyncio.sleep(0.01)
+                lag = max(lag, time.perf_counter() - expected)
+
+        async def timed(username):
+            async with semaphore:
+                request = factory.post(
+                    '/api/v1/users/login/', {'username': username, 'password': PASSWORD},
+                    content_type='application/json'
+                )
+                started = time.perf_counter()
+                response = await async_login(request)
+                return time.perf_counter() - started, response.status_code == 200
+
+        watcher = asyncio.create_task(watch_loop())
+        started = time.perf_counter()
+        results = await asyncio.gather(*[timed(username) for username in usernames])
+        elapsed = time.perf_counter() - started
+        done.set()
+        await watcher
+        return (results, elapsed), lag
+
+    def report(self, label, results, elapsed):
+        durations = sorted(duration for duration, _ in results)
+        failures = sum(1 for _, ok in results if not ok)
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        self.stdout.write(
+            f"{label:<32} n={len(results)} échecs={failures} "
+            f"p50={statistics.median(durations) * 1000:.1f}ms p95={p95 * 1000:.1f}ms "
+            f"débit={len(results) / elapsed:.1f}/s"
+        )
+        if failures:
+            self.stdout.write(self.style.ERROR(f"{failures} requêtes en échec"))
@@ -0,0 +1,87 @@
+import statistics
+import threading
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import connection
+from api.models import MobileUser, Product, Cart, CartItem, OrderLine, InsufficientStockError
+
+
+class Command(BaseCommand):
+    help = (
+        "Lance des validations de panier concurrentes sur des produits partagés : "
+        "vérifie l'absence de survente et mesure la latence selon la taille du panier"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cart-sizes', default='1,5,20,50', help="Tailles de panier, séparées par des virgules")
+        parser.add_argument('--buyers', type=int, default=8, help="Acheteurs concurrents par taille de panier")
+        parser.add_argument('--stock', type=int, default=5, help="Stock initial de chaque produit")
+        parser.add_argument('--keep', action='store_true', help="Conserver les données créées")
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        users = []
+        products = []
+        try:
+            for size in [int(value) for value in options['cart_sizes'].split(',')]:
+                products_for_size = Product.objects.bulk_create([
+                    Product(name=f"bench-{run_id}-{size}-{i}", price=10, stock=options['stock'])
+                    for i in range(size)
+                ])
+                products += products_for_size
+                buyers = []
+                for i in range(options['buyers']):
+                    user = MobileUser.objects.create_user(username=f"bench-{run_id}-{size}-{i}")
+                    cart = Cart.objects.create(user=user)
+                    CartItem.objects.bulk_create([
+                        CartItem(cart=cart, product=product, quantity=1) for product in products_for_size
+                    ])
+                    users.append(user)
+                    buyers.append(cart)
+                self.report(size, products_for_size, buyers, options['stock'])
+        finally:
+            if not options['keep']:
+                MobileUser.objects.filter(id__in=[user.id for user in users]).delete()
+                Product.objects.filter(id__in=[product.id for product in products]).delete()
+
+    def report(self, size, products, carts, initial_stock):
+        durations = []
+        outcomes = {'ok': 0, 'insufficient': 0, 'error': 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(carts))
+
+        def buy(cart):
+            barrier.wait()
+            started = time.perf_counter()
+            try:
+                cart.checkout()
+                outcome = 'ok'
+            except InsufficientStockError:
+                outcome = 'insufficient'
+            except Exception as e:
+                self.stderr.write(f"Erreur de validation : {e}")
+                outcome = 'error'
+            finally:
+                connection.close()
+            with lock:
+                durations.append(time.perf_counter() - started)
+                outcomes[outcome] += 1
+
+        threads = [threading.Thread(target=buy, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product_ids = [product.id for product in products]
+        remaining = Product.objects.filter(id__in=product_ids).values_list('stock', flat=True)
+        ordered = sum(OrderLine.objects.filter(product_id__in=product_ids).values_list('quantity', flat=True))
+        oversold = min(remaining) < 0 or sum(remaining) + ordered != initial_stock * len(products)
+
+        self.stdout.write(
+            f"panier={size:>4} acheteurs={len(carts)} validés={outcomes['ok']} "
+            f"refusés={outcomes['insufficient']} erreurs={outcomes['error']} "
+            f"p50={statistics.median(durations) * 1000:.1f}ms max={max(durations) * 1000:.1f}ms "
+            + (self.style.ERROR("SURVENTE") if oversold else self.style.SUCCESS("stock cohérent"))
+        )
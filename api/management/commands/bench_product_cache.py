@@ -0,0 +1,85 @@
+import statistics
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from api import product_cache
+from api.models import MobileUser, Product, ProductReview
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le listing des produits (ProductViewSet.list) sans cache, avec le cache "
+        "des représentations froid (versions incrémentées avant chaque requête) puis chaud"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50, help="Produits par page (100 au plus)")
+        parser.add_argument('--reviews', type=int, default=5, help="Avis par produit")
+        parser.add_argument('--requests', type=int, default=50, help="Requêtes par scénario")
+        parser.add_argument('--keep', action='store_true', help="Conserver les données créées")
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        page_size = min(options['products'], 100)
+        reviewers = [
+            MobileUser.objects.create_user(username=f"bench-{run_id}-{i}")
+            for i in range(max(options['reviews'], 1))
+        ]
+        products = Product.objects.bulk_create([
+            Product(name=f"bench-{run_id}-{i}", description="Produit de test", price=10, stock=5)
+            for i in range(page_size)
+        ])
+        ProductReview.objects.bulk_create([
+            ProductReview(product=product, user=reviewer, rating=4, comment="Bien")
+            for product in products
+            for reviewer in reviewers[:options['reviews']]
+        ])
+        try:
+            with override_settings(PRODUCT_REPRESENTATION_CACHE=None):
+                self.report("sans cache", self.run(page_size, options['requests'], reviewers[0]))
+            self.report("cache froid", self.run(page_size, options['requests'], reviewers[0], products))
+            before = product_cache.get_metrics()
+            self.report("cache chaud", self.run(page_size, options['requests'], reviewers[0]))
+            after = product_cache.get_metrics()
+        finally:
+            if not options['keep']:
+                Product.objects.filter(pk__in=[product.pk for product in products]).delete()
+                MobileUser.objects.filter(pk__in=[user.pk for user in reviewers]).delete()
+
+        hits = after['hits'] - before['hits']
+        lookups = hits + after['misses'] - before['misses']
+        self.stdout.write(f"taux de hit du cache chaud : {hits / lookups if lookups else 0.0:.1%}")
+
+    def run(self, page_size, count, user, invalidate=()):
+        from api.views import ProductViewSet
+        view = ProductViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+        results = []
+        for _ in range(count):
+            # Cache froid : chaque produit de la page a une nouvelle version
+            for product in invalidate:
+                product_cache.bump_version(product.pk)
+            request = factory.get('/api/v1/products/', {'page_size': page_size})
+            force_authenticate(request, user=user)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = view(request)
+                response.render()
+                elapsed = time.perf_counter() - started
+            results.append((elapsed, len(queries), response.status_code == 200))
+        return results
+
+    def report(self, label, results):
+        durations = sorted(duration for duration, _, _ in results)
+        failures = sum(1 for _, _, ok in results if not ok)
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        self.stdout.write(
+            f"{label:<12} n={len(results)} requêtes SQL={statistics.median(q for _, q, _ in results):g} "
+            f"p50={statistics.median(durations) * 1000:.1f}ms p95={p95 * 1000:.1f}ms"
+        )
+        if failures:
+            self.stdout.write(self.style.ERROR(f"{failures} requêtes en échec"))
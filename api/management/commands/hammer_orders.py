@@ -0,0 +1,100 @@
+import multiprocessing
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Sum
+from rest_framework.test import APIRequestFactory, force_authenticate
+from api.models import MobileUser, Product, OrderLine
+
+
+def place_orders(user_id, product_id, count, results):
+    """Processus enfant : passe ``count`` commandes d'une unité via OrderViewSet"""
+    # Les connexions héritées du parent ne doivent pas être partagées après fork
+    connections.close_all()
+    from api.views import OrderViewSet
+
+    view = OrderViewSet.as_view({'post': 'create'})
+    factory = APIRequestFactory()
+    user = MobileUser.objects.get(pk=user_id)
+    outcomes = {'created': 0, 'conflict': 0, 'error': 0}
+    for _ in range(count):
+        request = factory.post(
+            '/api/v1/orders/', {'lines': [{'product': product_id, 'quantity': 1}]}, format='json'
+        )
+        force_authenticate(request, user=user)
+        try:
+            response = view(request)
+            if response.status_code == 201:
+                outcomes['created'] += 1
+            elif response.status_code == 409:
+                outcomes['conflict'] += 1
+            else:
+                outcomes['error'] += 1
+        except Exception:
+            outcomes['error'] += 1
+    connections.close_all()
+    results.put(outcomes)
+
+
+class Command(BaseCommand):
+    help = (
+        "Passe des commandes concurrentes depuis plusieurs processus sur un même produit : "
+        "vérifie qu'aucune décrémentation de stock n'est perdue"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500, help="Nombre total de commandes")
+        parser.add_argument('--processes', type=int, default=8, help="Processus concurrents")
+        parser.add_argument('--stock', type=int, help="Stock initial (par défaut : la moitié des commandes)")
+        parser.add_argument('--keep', action='store_true', help="Conserver les données créées")
+
+    def handle(self, *args, **options):
+        orders = options['orders']
+        processes = max(1, min(options['processes'], orders))
+        initial_stock = options['stock'] if options['stock'] is not None else orders // 2
+        run_id = uuid.uuid4().hex[:8]
+
+        user = MobileUser.objects.create_user(username=f"hammer-{run_id}")
+        product = Product.objects.create(name=f"hammer-{run_id}", price=10, stock=initial_stock)
+        try:
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            results = context.Queue()
+            shares = [orders // processes + (1 if i < orders % processes else 0) for i in range(processes)]
+            workers = [
+                context.Process(target=place_orders, args=(user.id, product.id, share, results))
+                for share in shares
+            ]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            outcomes = {'created': 0, 'conflict': 0, 'error': 0}
+            for _ in workers:
+                for key, value in results.get().items():
+                    outcomes[key] += value
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+
+            product.refresh_from_db(fields=['stock'])
+            ordered = OrderLine.objects.filter(product=product).aggregate(total=Sum('quantity'))['total'] or 0
+            lost = (
+                initial_stock - product.stock != ordered
+                or ordered != outcomes['created']
+                or outcomes['created'] != min(orders - outcomes['error'], initial_stock)
+            )
+
+            self.stdout.write(
+                f"commandes={orders} processus={processes} stock={initial_stock}->{product.stock} "
+                f"créées={outcomes['created']} refusées={outcomes['conflict']} erreurs={outcomes['error']} "
+                f"durée={elapsed:.2f}s "
+                + (self.style.ERROR("MISES À JOUR PERDUES") if lost else self.style.SUCCESS("stock cohérent"))
+            )
+            if lost:
+                raise CommandError("Le stock ne correspond pas aux commandes créées")
+        finally:
+            if not options['keep']:
+                user.delete()
+                OrderLine.objects.filter(product=product).delete()
+                product.delete()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recalcule les colonnes de résumé des notes (somme, nombre, histogramme) de tous les produits"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            type=int,
+            action='append',
+            dest='product_ids',
+            help="Limiter le recalcul à ce produit (option répétable)",
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['product_ids']:
+            products = products.filter(id__in=options['product_ids'])
+        updated = products.rebuild_rating_summaries()
+        self.stdout.write(self.style.SUCCESS(f"{updated} produit(s) recalculé(s)"))
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:58
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_summaries(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    ProductReview = apps.get_model('api', 'ProductReview')
+    reviews = ProductReview.objects.filter(product=models.OuterRef('pk')).order_by().values('product')
+
+    def aggregate(expression, **filters):
+        return Coalesce(
+            models.Subquery(reviews.filter(**filters).annotate(value=expression).values('value')),
+            0
+        )
+
+    columns = {
+        'rating_sum': aggregate(models.Sum('rating')),
+        'rating_count': aggregate(models.Count('id')),
+    }
+    for star in range(1, 6):
+        columns[f'rating_{star}_count'] = aggregate(models.Count('id'), rating=star)
+    Product.objects.update(**columns)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_product_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_summaries, migrations.RunPython.noop),
+    ]
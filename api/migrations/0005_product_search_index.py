@@ -0,0 +1,69 @@
+import sqlite3
+
+from django.db import migrations
+
+SQLITE_HAS_TRIGRAM = sqlite3.sqlite_version_info >= (3, 34, 0)
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE api_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+    ") STORED",
+    "CREATE INDEX api_product_search_idx ON api_product USING GIN (search_vector)",
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX api_product_name_trgm_idx ON api_product USING GIN (name gin_trgm_ops)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS api_product_name_trgm_idx",
+    "DROP INDEX IF EXISTS api_product_search_idx",
+    "ALTER TABLE api_product DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE api_product_fts USING fts5("
+    "name, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "INSERT INTO api_product_fts(rowid, name, description) "
+    "SELECT id, name, description FROM api_product",
+]
+
+SQLITE_TRIGRAM_FORWARD = [
+    "CREATE VIRTUAL TABLE api_product_trigram USING fts5(name, tokenize='trigram')",
+    "INSERT INTO api_product_trigram(rowid, name) SELECT id, name FROM api_product",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS api_product_trigram",
+    "DROP TABLE IF EXISTS api_product_fts",
+]
+
+
+def get_statements(vendor, forward):
+    if vendor == 'postgresql':
+        return POSTGRES_FORWARD if forward else POSTGRES_BACKWARD
+    if vendor == 'sqlite':
+        if not forward:
+            return SQLITE_BACKWARD
+        return SQLITE_FORWARD + (SQLITE_TRIGRAM_FORWARD if SQLITE_HAS_TRIGRAM else [])
+    return []
+
+
+def create_search_index(apps, schema_editor):
+    for statement in get_statements(schema_editor.connection.vendor, forward=True):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    for statement in get_statements(schema_editor.connection.vendor, forward=False):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_product_rating_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
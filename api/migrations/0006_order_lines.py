@@ -0,0 +1,119 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:08
+
+import datetime
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Les anciennes validations de panier créaient une commande par article, dans une
+# même boucle : les lignes d'un même utilisateur et statut créées à moins d'une
+# seconde d'intervalle sont regroupées sous une seule commande.
+GROUPING_WINDOW = datetime.timedelta(seconds=1)
+
+
+def group_orders(apps, schema_editor):
+    Order = apps.get_model('api', 'Order')
+    OrderLine = apps.get_model('api', 'OrderLine')
+
+    lines = []
+    merged_ids = []
+    header = None
+    group_start = None
+    for order in Order.objects.order_by('user_id', 'status', 'created_at', 'id').iterator():
+        if (
+            header is None
+            or order.user_id != header.user_id
+            or order.status != header.status
+            or order.created_at - group_start > GROUPING_WINDOW
+        ):
+            header = order
+            group_start = order.created_at
+        else:
+            merged_ids.append(order.id)
+        lines.append(OrderLine(
+            order_id=header.id,
+            product_id=order.product_id,
+            quantity=order.quantity,
+            unit_price=order.unit_price,
+        ))
+    OrderLine.objects.bulk_create(lines, batch_size=1000)
+    Order.objects.filter(id__in=merged_ids).delete()
+
+    lines_total = (
+        OrderLine.objects.filter(order=models.OuterRef('pk')).order_by().values('order')
+        .annotate(total=models.Sum(models.F('unit_price') * models.F('quantity')))
+        .values('total')
+    )
+    Order.objects.update(total_price=models.Subquery(lines_total))
+
+
+def split_orders(apps, schema_editor):
+    Order = apps.get_model('api', 'Order')
+    OrderLine = apps.get_model('api', 'OrderLine')
+
+    for order in Order.objects.prefetch_related('lines').iterator(chunk_size=1000):
+        lines = sorted(order.lines.all(), key=lambda line: line.id)
+        for position, line in enumerate(lines):
+            if position:
+                order.pk = None
+            order.product_id = line.product_id
+            order.quantity = line.quantity
+            order.unit_price = line.unit_price
+            order.total_price = line.unit_price * line.quantity
+            order.save()
+    OrderLine.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='api.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='order_lines', to='api.product')),
+            ],
+        ),
+        # Colonnes rendues facultatives pour que la migration reste réversible
+        migrations.AlterField(
+            model_name='order',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='orders', to='api.product'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='quantity',
+            field=models.IntegerField(null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(group_orders, split_orders),
+        migrations.RemoveField(
+            model_name='order',
+            name='product',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='quantity',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='unit_price',
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+    ]
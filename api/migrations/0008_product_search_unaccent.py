@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# unaccent() n'est pas IMMUTABLE (dictionnaire modifiable) : enveloppe à dictionnaire
+# explicite, utilisable dans une colonne générée et un index
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "CREATE OR REPLACE FUNCTION api_unaccent(text) RETURNS text AS "
+    "$$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$ "
+    "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT",
+    "DROP INDEX IF EXISTS api_product_search_idx",
+    "DROP INDEX IF EXISTS api_product_name_trgm_idx",
+    "ALTER TABLE api_product DROP COLUMN search_vector",
+    "ALTER TABLE api_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', api_unaccent(coalesce(name, ''))), 'A') || "
+    "setweight(to_tsvector('simple', api_unaccent(coalesce(description, ''))), 'B')"
+    ") STORED",
+    "CREATE INDEX api_product_search_idx ON api_product USING GIN (search_vector)",
+    "CREATE INDEX api_product_name_trgm_idx ON api_product USING GIN (api_unaccent(name) gin_trgm_ops)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS api_product_search_idx",
+    "DROP INDEX IF EXISTS api_product_name_trgm_idx",
+    "ALTER TABLE api_product DROP COLUMN search_vector",
+    "ALTER TABLE api_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+    ") STORED",
+    "CREATE INDEX api_product_search_idx ON api_product USING GIN (search_vector)",
+    "CREATE INDEX api_product_name_trgm_idx ON api_product USING GIN (name gin_trgm_ops)",
+    "DROP FUNCTION IF EXISTS api_unaccent(text)",
+]
+
+
+def create_unaccent_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_FORWARD:
+            schema_editor.execute(statement)
+
+
+def drop_unaccent_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_BACKWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_unaccent_index, drop_unaccent_index),
+    ]
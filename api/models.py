@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from decimal import Decimal
 import uuid
 import graphene
 from graphene_django.types import DjangoObjectType
@@ -22,6 +25,19 @@ class MobileUser(AbstractUser):
             )
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Nom lu en base : les caches qui l'embarquent ne sont invalidés que s'il change (api/signals.py)
+        instance._loaded_username = instance.__dict__.get('username')
+        return instance
+
+    def record_login(self, ip):
+        """Enregistre la date et l'adresse de connexion, sans réécrire le reste de la ligne"""
+        self.last_login = timezone.now()
+        self.last_login_ip = ip
+        self.save(update_fields=['last_login', 'last_login_ip'])
+
 class DeviceToken(models.Model):
     user = models.ForeignKey(MobileUser, related_name='device_tokens', on_delete=models.CASCADE)
     token = models.CharField(max_length=255)
@@ -46,26 +62,154 @@ class GestureData(models.Model):
             models.Index(fields=['gesture_type', 'timestamp']),
         ]
 
+class ProductQuerySet(models.QuerySet):
+    def for_listing(self, reviews_limit=None):
+        """
+        Précharge les avis avec leurs auteurs ; les statistiques de notes sont lues
+        dans les colonnes de synthèse dénormalisées. Avec reviews_limit, seuls les K
+        derniers avis de chaque produit sont préchargés dans ``prefetched_reviews``
+        (un Prefetch tronqué exige un to_attr).
+        """
+        if reviews_limit == 0:
+            return self
+        return self.prefetch_related(self.reviews_prefetch(reviews_limit))
+
+    @staticmethod
+    def reviews_prefetch(reviews_limit=None):
+        """Préchargement de for_listing, appliqué aussi à des produits déjà chargés (api/product_cache.py)"""
+        reviews = ProductReview.objects.select_related('user').order_by('-created_at', '-id')
+        if reviews_limit is not None:
+            reviews = reviews[:reviews_limit]
+        return models.Prefetch('reviews', queryset=reviews, to_attr='prefetched_reviews')
+
+    def with_rating_avg(self):
+        """Annote la note moyenne calculée à partir des colonnes de synthèse (sans jointure)"""
+        return self.annotate(
+            rating_avg=models.Case(
+                models.When(rating_count=0, then=models.Value(0.0)),
+                default=models.ExpressionWrapper(
+                    models.F('rating_sum') * 1.0 / models.F('rating_count'),
+                    output_field=models.FloatField()
+                ),
+                output_field=models.FloatField()
+            )
+        )
+
+    def record_rating(self, product_id, rating):
+        """Ajoute atomiquement une note aux colonnes de synthèse d'un produit"""
+        return self.filter(pk=product_id).update(**{
+            'rating_sum': models.F('rating_sum') + rating,
+            'rating_count': models.F('rating_count') + 1,
+            f'rating_{rating}_count': models.F(f'rating_{rating}_count') + 1,
+            'updated_at': timezone.now(),
+        })
+
+    def take_stock(self, quantities, released=None):
+        """
+        Décrémente le stock de ``quantities`` (produit -> quantité) en un seul UPDATE
+        conditionnel, sans lecture préalable ni verrou explicite : une ligne n'est
+        modifiée que si son stock disponible suffit. ``released`` (produit -> quantité)
+        indique les réservations consommées par l'appelant, rendues disponibles et
+        retirées de reserved_stock dans le même UPDATE.
+        Lève InsufficientStockError si un produit manque de stock ; à appeler dans
+        une transaction pour annuler les écritures qui l'accompagnent.
+        """
+        released = released or {}
+        condition = models.Q()
+        for product_id, quantity in quantities.items():
+            condition |= models.Q(
+                pk=product_id,
+                stock__gte=models.F('reserved_stock') + (quantity - released.get(product_id, 0))
+            )
+        # Réservations sans quantité à prélever : simplement libérées
+        condition |= models.Q(pk__in=[pid for pid in released if pid not in quantities])
+        updated = self.filter(condition).update(
+            stock=models.Case(
+                *[models.When(pk=product_id, then=models.F('stock') - quantity)
+                  for product_id, quantity in quantities.items()],
+                default=models.F('stock')
+            ),
+            reserved_stock=models.Case(
+                *[models.When(pk=product_id, then=models.F('reserved_stock') - quantity)
+                  for product_id, quantity in released.items()],
+                default=models.F('reserved_stock'),
+                output_field=models.IntegerField()
+            ),
+            # Le stock disponible fait partie des représentations (ETag, api/http_cache.py)
+            updated_at=timezone.now(),
+        )
+        if updated != len(set(quantities) | set(released)):
+            missing = self.filter(pk__in=quantities).exclude(condition).first()
+            if missing is None:
+                raise Product.DoesNotExist("Produit introuvable")
+            raise InsufficientStockError(missing)
+        return updated
+
+    def rebuild_rating_summaries(self):
+        """Recalcule les colonnes de synthèse à partir de ProductReview en un seul UPDATE"""
+        reviews = ProductReview.objects.filter(product=models.OuterRef('pk')).order_by().values('product')
+
+        def aggregate(expression, **filters):
+            return Coalesce(
+                models.Subquery(reviews.filter(**filters).annotate(value=expression).values('value')),
+                0
+            )
+
+        columns = {
+            'rating_sum': aggregate(models.Sum('rating')),
+            'rating_count': aggregate(models.Count('id')),
+        }
+        for star in range(1, 6):
+            columns[f'rating_{star}_count'] = aggregate(models.Count('id'), rating=star)
+        return self.update(**columns, updated_at=timezone.now())
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     stock = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    # Somme des réservations des paniers (StockReservation), maintenue incrémentalement
+    reserved_stock = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
     is_ai_generated = models.BooleanField(default=False)
     ai_source = models.CharField(max_length=100, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Résumé des notes, maintenu incrémentalement (voir ProductQuerySet.record_rating)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def available_stock(self):
+        return max(self.stock - self.reserved_stock, 0)
+
     @property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if not reviews:
+        if not self.rating_count:
             return 0
-        return sum(review.rating for review in reviews) / len(reviews)
+        return self.rating_sum / self.rating_count
+
+    @property
+    def rating_histogram(self):
+        return {
+            star: getattr(self, f'rating_{star}_count')
+            for star in range(1, 6)
+        }
 
     @property
     def image_url(self):
@@ -96,6 +240,25 @@ class ProductReview(models.Model):
     def __str__(self):
         return f"{self.user.username}'s review of {self.product.name}"
 
+class OrderQuerySet(models.QuerySet):
+    def with_lines(self):
+        """Précharge les lignes et leurs produits : une seule requête supplémentaire"""
+        return self.prefetch_related(
+            models.Prefetch('lines', queryset=OrderLine.objects.select_related('product').order_by('id'))
+        )
+
+    def update_totals(self):
+        """Recalcule total_price à partir des lignes en un seul UPDATE"""
+        lines_total = (
+            OrderLine.objects.filter(order=models.OuterRef('pk')).order_by().values('order')
+            .annotate(total=models.Sum(models.F('unit_price') * models.F('quantity')))
+            .values('total')
+        )
+        return self.update(total_price=Coalesce(
+            models.Subquery(lines_total, output_field=models.DecimalField(max_digits=10, decimal_places=2)),
+            models.Value(0, output_field=models.DecimalField(max_digits=10, decimal_places=2))
+        ))
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'En attente'),
@@ -104,33 +267,137 @@ class Order(models.Model):
         ('delivered', 'Livré'),
         ('cancelled', 'Annulé'),
     ]
+    ACTIVE_STATUSES = ('pending', 'paid', 'shipped')
 
     user = models.ForeignKey(MobileUser, related_name='orders', on_delete=models.CASCADE)
-    product = models.ForeignKey(Product, related_name='orders', on_delete=models.PROTECT)
-    quantity = models.IntegerField(validators=[MinValueValidator(1)])
-    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
-    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        if not self.unit_price:
-            self.unit_price = self.product.price
-        self.total_price = self.unit_price * self.quantity
-        super().save(*args, **kwargs)
+    objects = OrderQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Statut lu en base : seules les transitions sont publiées aux abonnés (api/signals.py)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
 
     def __str__(self):
-        return f"Commande #{self.id} - {self.user.username} - {self.product.name}"
+        return f"Commande #{self.id} - {self.user.username}"
+
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, related_name='lines', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='order_lines', on_delete=models.PROTECT)
+    quantity = models.IntegerField(validators=[MinValueValidator(1)])
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    @property
+    def subtotal(self):
+        return self.unit_price * self.quantity
+
+    def __str__(self):
+        return f"{self.quantity}x {self.product.name}"
+
+class InsufficientStockError(Exception):
+    """Stock insuffisant pour valider un panier"""
+
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f"Stock insuffisant pour {product.name}")
+
+
+class CartItemQuerySet(models.QuerySet):
+    def with_subtotals(self):
+        """
+        Annote le sous-total de chaque article et le total de son panier (fonction
+        de fenêtre), calculés en SQL dans la même requête que les produits.
+        """
+        subtotal = models.ExpressionWrapper(
+            models.F('product__price') * models.F('quantity'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        )
+        return self.select_related('product').annotate(
+            line_subtotal=subtotal,
+            cart_total=models.Window(models.Sum(subtotal), partition_by=[models.F('cart_id')])
+        ).order_by('id')
+
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        return self.prefetch_related(Cart.items_prefetch())
 
 class Cart(models.Model):
     user = models.OneToOneField(MobileUser, related_name='cart', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
+    @staticmethod
+    def items_prefetch():
+        return models.Prefetch('items', queryset=CartItem.objects.with_subtotals())
+
+    def load_items(self):
+        """(Re)charge les articles, sous-totaux et total du panier en une seule requête"""
+        getattr(self, '_prefetched_objects_cache', {}).pop('items', None)
+        models.prefetch_related_objects([self], self.items_prefetch())
+        return self
+
     @property
     def total(self):
-        return sum(item.subtotal for item in self.items.all())
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            items = self.items.all()
+        else:
+            items = self.items.with_subtotals()
+        if not items:
+            return Decimal('0.00')
+        return items[0].cart_total
+
+    def checkout(self):
+        """
+        Transforme le panier en commande dans une seule transaction, en un nombre
+        de requêtes indépendant de la taille du panier, sans verrouiller les produits :
+        les réservations du panier sont consommées et le stock décrémenté par un UPDATE
+        conditionnel unique (stock disponible, réservations de ce panier comprises),
+        puis la commande et ses lignes sont insérées en bloc, le total calculé en SQL
+        et le panier vidé. Renvoie None si le panier est vide.
+        Lève InsufficientStockError (sans rien modifier) si un produit manque de stock.
+        """
+        with transaction.atomic():
+            quantities = {}
+            for product_id, quantity in self.items.values_list('product_id', 'quantity'):
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            if not quantities:
+                return None
+
+            # Verrouille les réservations du panier (pas les produits) : elles ne
+            # peuvent plus être libérées par reap_expired_reservations entre-temps
+            held = dict(
+                StockReservation.objects.select_for_update().filter(cart=self)
+                .values_list('product_id', 'quantity')
+            )
+
+            Product.objects.take_stock(quantities, released=held)
+
+            products = list(Product.objects.filter(pk__in=quantities).order_by('pk'))
+            order = Order.objects.create(user_id=self.user_id)
+            lines = OrderLine.objects.bulk_create([
+                OrderLine(
+                    order=order,
+                    product=product,
+                    quantity=quantities[product.pk],
+                    unit_price=product.price
+                )
+                for product in products
+            ])
+            Order.objects.filter(pk=order.pk).update_totals()
+            order.refresh_from_db(fields=['total_price'])
+            StockReservation.objects.filter(cart=self).delete()
+            self.items.all().delete()
+        # Les lignes créées servent directement à la sérialisation, sans relecture
+        order._prefetched_objects_cache = {'lines': lines}
+        return order
 
     def __str__(self):
         return f"Panier de {self.user.username}"
@@ -139,14 +406,37 @@ class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1, validators=[MinValueValidator(1)])
-    
+
+    objects = CartItemQuerySet.as_manager()
+
     @property
     def subtotal(self):
+        if hasattr(self, 'line_subtotal'):
+            return self.line_subtotal
         return self.product.price * self.quantity
 
     def __str__(self):
         return f"{self.quantity}x {self.product.name}"
 
+class StockReservation(models.Model):
+    """Réservation temporaire de stock par un panier (voir api/reservations.py)"""
+    cart = models.ForeignKey(Cart, related_name='reservations', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='reservations', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product_reservation'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity}x {self.product_id} réservés par le panier {self.cart_id}"
+
 class CartType(DjangoObjectType):
     total = graphene.Float()  # ou graphene.Decimal() si tu veux
 
@@ -0,0 +1,158 @@
+import base64
+import datetime
+import decimal
+import json
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from .search import get_max_results
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination par curseur (keyset) sur un tuple de colonnes.
+    Le curseur encode les valeurs de tri du dernier élément de la page, ce qui
+    permet de filtrer avec une clause WHERE indexée au lieu d'un OFFSET :
+    le coût d'une page reste constant quelle que soit sa position.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    # Le dernier champ doit être unique pour garantir un ordre total
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+
+        # Une ligne de plus pour savoir s'il existe une page suivante
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.get_position(self.page[-1])
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(position))
+
+    def get_position(self, instance):
+        return [getattr(instance, field.lstrip('-')) for field in self.ordering]
+
+    def get_position_filter(self, position):
+        """Comparaison lexicographique (a, b) < (x, y) exprimée avec des Q"""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, position):
+        # Précision complète : DjangoJSONEncoder tronque les datetimes à la milliseconde
+        position = [
+            value.isoformat() if isinstance(value, datetime.datetime)
+            else str(value) if isinstance(value, decimal.Decimal)
+            else value
+            for value in position
+        ]
+        raw = json.dumps(position)
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            return self.decode_position(encoded, model)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def decode_position(self, encoded, model):
+        """Valeurs de tri d'un curseur ; lève une exception si le curseur est invalide"""
+        position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise ValueError(encoded)
+        return [
+            self.to_python(model, field.lstrip('-'), value)
+            for field, value in zip(self.ordering, position)
+        ]
+
+    def to_python(self, model, name, value):
+        try:
+            return model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            # Champ annoté (ex: rang de recherche)
+            return value
+
+
+class ProductCursorPagination(KeysetPagination):
+    """Pagination du catalogue sur (created_at, id), du plus récent au plus ancien"""
+    ordering = ('-created_at', '-id')
+
+
+class ProductRatingCursorPagination(KeysetPagination):
+    """Pagination du catalogue par note moyenne décroissante (annotation rating_avg)"""
+    ordering = ('-rating_avg', '-id')
+
+
+class ProductSearchCursorPagination(KeysetPagination):
+    """
+    Pagination des résultats de recherche par rang de pertinence (annotation search_rank).
+    Seuls les PRODUCT_SEARCH_MAX_RESULTS premiers résultats sont classés : la borne est
+    indiquée dans ``max_results``.
+    """
+    ordering = ('search_rank', 'id')
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['max_results'] = get_max_results()
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['max_results'] = {'type': 'integer'}
+        return response_schema
+
+
+class OrderCursorPagination(KeysetPagination):
+    """Historique des commandes sur (created_at, id), de la plus récente à la plus ancienne"""
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,95 @@
+"""
+Hachage des mots de passe.
+
+Hacheurs dont le coût se règle dans les settings (PASSWORD_PBKDF2_ITERATIONS,
+PASSWORD_BCRYPT_ROUNDS, PASSWORD_ARGON2_*) ; on choisit l'algorithme par l'ordre de
+PASSWORD_HASHERS. Un mot de passe haché avec un autre algorithme ou un autre coût que
+le premier hacheur est re-haché à la connexion suivante (mécanisme must_update de
+Django), sans intervention de l'utilisateur.
+
+Sous ASGI, ``PooledModelBackend.aauthenticate`` (django.contrib.auth.aauthenticate)
+vérifie le mot de passe dans un pool de threads dédié : le hachage ne bloque pas la
+boucle d'événements et ne monopolise pas le thread unique des appels synchrones de
+Django (PBKDF2, bcrypt et Argon2 libèrent le GIL).
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, BCryptSHA256PasswordHasher, PBKDF2PasswordHasher,
+    make_password, verify_password,
+)
+
+DEFAULT_HASHING_THREADS = 4
+
+_executor = None
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+class ConfigurableBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+    @property
+    def rounds(self):
+        return getattr(settings, 'PASSWORD_BCRYPT_ROUNDS', BCryptSHA256PasswordHasher.rounds)
+
+
+class ConfigurableArgon2PasswordHasher(Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PASSWORD_ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'PASSWORD_HASHING_THREADS', DEFAULT_HASHING_THREADS),
+            thread_name_prefix='password-hashing'
+        )
+    return _executor
+
+
+async def run_hashing(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), func, *args)
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend dont la variante asynchrone interroge l'ORM asynchrone et hache dans
+    le pool, au lieu d'exécuter ``authenticate`` dans le thread synchrone de Django.
+    """
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await UserModel._default_manager.aget_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hachage factice : même durée qu'un utilisateur existant (#20760)
+            await run_hashing(make_password, password)
+            return None
+
+        is_correct, must_update = await run_hashing(verify_password, password, user.password)
+        if not is_correct or not self.user_can_authenticate(user):
+            return None
+        if must_update:
+            user.password = await run_hashing(make_password, password)
+            await user.asave(update_fields=['password'])
+        return user
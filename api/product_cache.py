@@ -0,0 +1,129 @@
+"""
+Cache des représentations sérialisées des produits (ProductSerializer) dans les listes.
+
+Une entrée par produit et variante de représentation :
+``product-repr:<id>:<version>:<updated_at>:<variante>``.
+- ``version`` : compteur du produit (``product-repr:version:<id>``), incrémenté après
+  le commit par api/signals.py (produit enregistré ou supprimé, avis, nom d'un auteur) ;
+- ``updated_at`` : avancé par les UPDATE du stock, des réservations et des notes,
+  qui ne déclenchent pas de signal ;
+- variante : nombre d'avis embarqués (reviews_limit) et hôte des URL absolues.
+Les anciennes entrées ne sont jamais relues et expirent (PRODUCT_REPRESENTATION_CACHE_TTL)
+ou sont évincées par le backend (LRU de LocMemCache, allkeys-lru sous Redis).
+
+Une page coûte deux lectures groupées (versions puis représentations) ; seuls les
+produits absents sont sérialisés, et leurs avis préchargés en une requête.
+Compteurs : hits, misses (``get_metrics``). PRODUCT_REPRESENTATION_CACHE = None
+désactive le cache.
+"""
+import hashlib
+import secrets
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import prefetch_related_objects
+from .models import Product
+
+DEFAULT_TTL = 60 * 60
+
+METRICS = ('hits', 'misses')
+
+
+def get_cache():
+    alias = getattr(settings, 'PRODUCT_REPRESENTATION_CACHE', 'default')
+    return caches[alias] if alias is not None else None
+
+
+def version_key(product_id):
+    return f'product-repr:version:{product_id}'
+
+
+def fragment_key(product, version, variant):
+    updated_at = int(product.updated_at.timestamp() * 1_000_000)
+    return f'product-repr:{product.pk}:{version}:{updated_at}:{variant}'
+
+
+def get_variant(context):
+    request = context.get('request')
+    host = request.build_absolute_uri('/') if request is not None else ''
+    raw = f"{context.get('reviews_limit')}|{host}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def increment(metric, delta=1):
+    cache = get_cache()
+    key = f'product-repr:metrics:{metric}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Clé évincée entre add() et incr()
+        cache.set(key, delta, timeout=None)
+
+
+def get_versions(cache, product_ids):
+    keys = {product_id: version_key(product_id) for product_id in product_ids}
+    found = cache.get_many(list(keys.values()))
+    versions = {}
+    for product_id, key in keys.items():
+        if key not in found:
+            # Version évincée : repartir d'une valeur aléatoire, jamais d'une valeur déjà servie
+            cache.add(key, secrets.randbits(48), timeout=None)
+            found[key] = cache.get(key)
+        versions[product_id] = found[key]
+    return versions
+
+
+def bump_version(product_id):
+    cache = get_cache()
+    if cache is None:
+        return
+    try:
+        cache.incr(version_key(product_id))
+    except ValueError:
+        cache.add(version_key(product_id), secrets.randbits(48), timeout=None)
+
+
+def prefetch_reviews(products, reviews_limit):
+    """Précharge les avis embarqués des produits qui ne les ont pas déjà"""
+    if reviews_limit == 0:
+        return
+    missing = [product for product in products if not hasattr(product, 'prefetched_reviews')]
+    if missing:
+        prefetch_related_objects(missing, Product.objects.reviews_prefetch(reviews_limit))
+
+
+def serialize_products(products, serializer):
+    """Représentations de ``products`` par ``serializer`` (ProductSerializer), depuis le cache si possible"""
+    reviews_limit = serializer.context.get('reviews_limit')
+    cache = get_cache()
+    if cache is None:
+        prefetch_reviews(products, reviews_limit)
+        return [serializer.to_representation(product) for product in products]
+
+    variant = get_variant(serializer.context)
+    versions = get_versions(cache, [product.pk for product in products])
+    keys = {product.pk: fragment_key(product, versions[product.pk], variant) for product in products}
+    cached = cache.get_many(list(keys.values()))
+
+    misses = [product for product in products if keys[product.pk] not in cached]
+    prefetch_reviews(misses, reviews_limit)
+    fresh = {keys[product.pk]: serializer.to_representation(product) for product in misses}
+    if fresh:
+        cache.set_many(fresh, getattr(settings, 'PRODUCT_REPRESENTATION_CACHE_TTL', DEFAULT_TTL))
+
+    if len(misses) < len(products):
+        increment('hits', len(products) - len(misses))
+    if misses:
+        increment('misses', len(misses))
+    return [cached.get(keys[product.pk]) or fresh[keys[product.pk]] for product in products]
+
+
+def get_metrics():
+    cache = get_cache()
+    if cache is None:
+        return {metric: 0 for metric in METRICS} | {'hit_ratio': 0.0}
+    values = cache.get_many([f'product-repr:metrics:{metric}' for metric in METRICS])
+    metrics = {metric: values.get(f'product-repr:metrics:{metric}', 0) for metric in METRICS}
+    lookups = metrics['hits'] + metrics['misses']
+    metrics['hit_ratio'] = metrics['hits'] / lookups if lookups else 0.0
+    return metrics
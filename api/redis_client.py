@@ -0,0 +1,30 @@
+"""
+Client Redis partagé (REDIS_URL), créé à la première utilisation.
+"""
+import threading
+import redis
+from django.conf import settings
+
+DEFAULT_REDIS_URL = 'redis://localhost:6379/0'
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(
+                    getattr(settings, 'REDIS_URL', DEFAULT_REDIS_URL),
+                    decode_responses=True
+                )
+    return _client
+
+
+def redis_available():
+    try:
+        return get_redis().ping()
+    except redis.RedisError:
+        return False
@@ -0,0 +1,160 @@
+"""
+Réservations de stock des paniers.
+
+Ajouter un produit au panier pose une réservation limitée dans le temps
+(STOCK_HOLD_TTL) : une ligne StockReservation par panier et produit.
+``Product.reserved_stock`` est la somme des réservations existantes ; il est
+incrémenté ou décrémenté dans la même transaction que ces lignes, si bien que le
+stock disponible (``stock - reserved_stock``) se lit sans agrégation. Chaque
+modification avance ``Product.updated_at`` (ETag des produits, api/http_cache.py).
+
+Les réservations expirées sont libérées par lots par la tâche périodique
+``reap_expired_reservations`` ; la validation du panier consomme les siennes
+(voir Cart.checkout).
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, When
+from django.utils import timezone
+from .models import Cart, Product, StockReservation, InsufficientStockError
+
+# Durée d'une réservation, prolongée à chaque modification du panier
+DEFAULT_HOLD_TTL = 15 * 60
+DEFAULT_REAP_BATCH = 1000
+
+
+def get_hold_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_HOLD_TTL', DEFAULT_HOLD_TTL))
+
+
+def lock_cart(cart):
+    """Verrouille le panier jusqu'à la fin de la transaction : sérialise ses modifications"""
+    Cart.objects.select_for_update().filter(pk=cart.pk).exists()
+
+
+def hold(cart, quantities):
+    """
+    Fixe les réservations du panier pour les produits de ``quantities``
+    (produit -> quantité, 0 pour libérer) en un seul UPDATE conditionnel des produits.
+    Lève InsufficientStockError si le stock disponible ne suffit pas : rien n'est modifié.
+    """
+    if not quantities:
+        return
+    with transaction.atomic():
+        lock_cart(cart)
+        current = dict(
+            StockReservation.objects.select_for_update()
+            .filter(cart=cart, product_id__in=quantities)
+            .values_list('product_id', 'quantity')
+        )
+        deltas = {
+            product_id: quantity - current.get(product_id, 0)
+            for product_id, quantity in quantities.items()
+            if quantity != current.get(product_id, 0)
+        }
+        if deltas:
+            condition = Q()
+            for product_id, delta in deltas.items():
+                if delta > 0:
+                    condition |= Q(pk=product_id, stock__gte=F('reserved_stock') + delta)
+                else:
+                    condition |= Q(pk=product_id)
+            updated = Product.objects.filter(condition).update(
+                reserved_stock=Case(
+                    *[When(pk=product_id, then=F('reserved_stock') + delta) for product_id, delta in deltas.items()],
+                    default=F('reserved_stock'),
+                    output_field=IntegerField()
+                ),
+                updated_at=timezone.now(),
+            )
+            if updated != len(deltas):
+                missing = Product.objects.filter(pk__in=deltas).exclude(condition).first()
+                if missing is None:
+                    raise Product.DoesNotExist("Produit introuvable")
+                raise InsufficientStockError(missing)
+
+        expires_at = timezone.now() + get_hold_ttl()
+        StockReservation.objects.bulk_create(
+            [
+                StockReservation(cart=cart, product_id=product_id, quantity=quantity, expires_at=expires_at)
+                for product_id, quantity in quantities.items() if quantity > 0
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity', 'expires_at'],
+        )
+        released = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+        if released:
+            StockReservation.objects.filter(cart=cart, product_id__in=released).delete()
+
+
+def add_to_cart(cart, store, product, quantity):
+    """
+    Ajoute ``quantity`` de ``product`` au panier (``store``, api/cart_store.py) et réserve
+    le nouveau total. La quantité est relue sous le verrou du panier : deux ajouts
+    simultanés réservent l'un après l'autre. Lève InsufficientStockError sans rien modifier.
+    """
+    with transaction.atomic():
+        lock_cart(cart)
+        current = store.get_items(cart).get(product.id, 0)
+        hold(cart, {product.id: current + quantity})
+        store.add_item(cart, product, quantity)
+
+
+def set_cart_quantity(cart, store, item_id, quantity):
+    """Fixe la quantité d'un article du panier et sa réservation, sous le verrou du panier"""
+    with transaction.atomic():
+        lock_cart(cart)
+        product = store.get_item_product(cart, item_id)
+        hold(cart, {product.id: quantity})
+        store.set_quantity(cart, item_id, quantity)
+
+
+def remove_from_cart(cart, store, item_id):
+    """Retire un article du panier et libère sa réservation, sous le verrou du panier"""
+    with transaction.atomic():
+        lock_cart(cart)
+        product = store.get_item_product(cart, item_id)
+        release(cart, [product.id])
+        store.remove_item(cart, item_id)
+
+
+def release(cart, product_ids):
+    hold(cart, {product_id: 0 for product_id in product_ids})
+
+
+def release_cart(cart):
+    """Libère toutes les réservations d'un panier"""
+    release(cart, list(cart.reservations.values_list('product_id', flat=True)))
+
+
+def reap_expired(batch=None):
+    """
+    Libère un lot de réservations expirées : un UPDATE des produits et un DELETE.
+    Les réservations verrouillées par une validation en cours sont ignorées.
+    Renvoie le nombre de réservations libérées.
+    """
+    batch = batch or getattr(settings, 'STOCK_REAP_BATCH', DEFAULT_REAP_BATCH)
+    with transaction.atomic():
+        expired = list(
+            StockReservation.objects.select_for_update(skip_locked=True)
+            .filter(expires_at__lte=timezone.now())
+            .order_by('expires_at')
+            .values_list('id', 'product_id', 'quantity')[:batch]
+        )
+        if not expired:
+            return 0
+        released = {}
+        for _, product_id, quantity in expired:
+            released[product_id] = released.get(product_id, 0) + quantity
+        Product.objects.filter(pk__in=released).update(
+            reserved_stock=Case(
+                *[When(pk=product_id, then=F('reserved_stock') - quantity) for product_id, quantity in released.items()],
+                default=F('reserved_stock'),
+                output_field=IntegerField()
+            ),
+            updated_at=timezone.now(),
+        )
+        StockReservation.objects.filter(id__in=[reservation_id for reservation_id, _, _ in expired]).delete()
+    return len(expired)
@@ -0,0 +1,47 @@
+"""
+Révocation des jetons JWT, partagée par tous les workers via Redis :
+- ``auth:revoked`` : ensemble trié jti -> expiration des jetons révoqués un par un
+  (déconnexion), purgé des jetons expirés à chaque ajout ;
+- ``auth:revoked-before:<user_id>`` : horodatage avant lequel tous les jetons de
+  l'utilisateur sont refusés (compte désactivé ou supprimé), conservé le temps de
+  vie d'un jeton.
+"""
+import time
+from rest_framework_simplejwt.settings import api_settings
+from .redis_client import get_redis
+
+REVOKED_KEY = 'auth:revoked'
+
+
+def user_key(user_id):
+    return f'auth:revoked-before:{user_id}'
+
+
+def token_lifetime():
+    return int(max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME).total_seconds())
+
+
+def revoke_token(token):
+    """Révoque un jeton validé (AccessToken ou RefreshToken) jusqu'à son expiration"""
+    client = get_redis()
+    with client.pipeline() as pipe:
+        pipe.zadd(REVOKED_KEY, {token[api_settings.JTI_CLAIM]: token['exp']})
+        pipe.zremrangebyscore(REVOKED_KEY, '-inf', time.time())
+        pipe.execute()
+
+
+def revoke_user(user_id):
+    """Révoque tous les jetons déjà émis pour l'utilisateur"""
+    get_redis().set(user_key(user_id), int(time.time()), ex=token_lifetime())
+
+
+def is_revoked(token):
+    """Un seul aller-retour Redis ; lève redis.RedisError si Redis est indisponible"""
+    with get_redis().pipeline(transaction=False) as pipe:
+        pipe.zscore(REVOKED_KEY, token[api_settings.JTI_CLAIM])
+        pipe.get(user_key(token[api_settings.USER_ID_CLAIM]))
+        revoked_at, revoked_before = pipe.execute()
+    if revoked_at is not None:
+        return True
+    # iat est à la seconde : un jeton émis dans la seconde de la révocation est refusé aussi
+    return revoked_before is not None and token.get('iat', 0) <= int(revoked_before)
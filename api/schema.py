@@ -1,42 +1,157 @@
 import graphene
+from graphene import relay
 from graphene_django import DjangoObjectType
-from .models import Product, Order, Cart, ProductReview, MobileUser
+from graphql import GraphQLError
+from .models import Product, Order, OrderLine, Cart, CartItem, ProductReview, MobileUser, InsufficientStockError
+from .loaders import get_loaders
+from .pagination import OrderCursorPagination, ProductCursorPagination
+from . import reservations, subscriptions
+from .cart_store import get_cart_store
 from graphql_jwt.decorators import login_required
 from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from decimal import Decimal
 
 class UserType(DjangoObjectType):
     class Meta:
         model = MobileUser
         fields = ('id', 'username', 'email', 'is_staff')
 
+class ReviewerType(DjangoObjectType):
+    """Auteur d'un avis, visible de tous (allProducts est public) : ni email ni statut"""
+    class Meta:
+        model = MobileUser
+        fields = ('id', 'username')
+        skip_registry = True
+
 class ProductType(DjangoObjectType):
+    reviews = graphene.List(graphene.NonNull(lambda: ProductReviewType))
+
     class Meta:
         model = Product
-        fields = ("id", "name", "description", "price", "stock", "image", "is_ai_generated")
+        fields = ("id", "name", "description", "price", "stock", "image", "is_ai_generated", "reviews")
+
+    def resolve_reviews(self, info):
+        return get_loaders(info).reviews_by_product.load(self.id)
+
+class OrderLineType(DjangoObjectType):
+    class Meta:
+        model = OrderLine
+        fields = ('id', 'product', 'quantity', 'unit_price')
 
 class OrderType(DjangoObjectType):
     class Meta:
         model = Order
-        fields = ('id', 'user', 'product', 'quantity', 'unit_price', 'total_price', 'status', 'created_at')
+        fields = ('id', 'user', 'lines', 'total_price', 'status', 'created_at')
+
+    def resolve_user(self, info):
+        return get_loaders(info).users.load(self.user_id)
+
+class CartItemType(DjangoObjectType):
+    subtotal = graphene.Decimal()
+
+    class Meta:
+        model = CartItem
+        fields = ('id', 'product', 'quantity', 'subtotal')
+
+    def resolve_product(self, info):
+        return get_loaders(info).products.load(self.product_id)
 
 class CartType(DjangoObjectType):
+    items = graphene.List(graphene.NonNull(CartItemType))
+    total = graphene.Decimal()
+
     class Meta:
         model = Cart
         fields = ('id', 'user', 'items', 'total')
 
+    def resolve_user(self, info):
+        return get_loaders(info).users.load(self.user_id)
+
+    def resolve_items(self, info):
+        return get_loaders(info).cart_items_by_cart.load(self.id)
+
+    def resolve_total(self, info):
+        items = get_loaders(info).cart_items_by_cart.load(self.id)
+        return items[0].cart_total if items else Decimal('0.00')
+
 class ProductReviewType(DjangoObjectType):
+    user = graphene.Field(graphene.NonNull(ReviewerType))
+
     class Meta:
         model = ProductReview
         fields = ('id', 'product', 'user', 'rating', 'comment', 'created_at')
 
+    def resolve_product(self, info):
+        return get_loaders(info).products.load(self.product_id)
+
+    def resolve_user(self, info):
+        return get_loaders(info).users.load(self.user_id)
+
+class CountableConnection(relay.Connection):
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(root, info):
+        # COUNT exécuté seulement si le champ est demandé
+        return root.total_queryset.count()
+
+class ProductConnection(CountableConnection):
+    class Meta:
+        node = ProductType
+
+class OrderConnection(CountableConnection):
+    class Meta:
+        node = OrderType
+
+def keyset_connection(connection_type, queryset, pagination, first=None, after=None):
+    """
+    Page d'une connexion Relay paginée par curseur (keyset, voir api/pagination.py) :
+    au plus ``pagination.max_page_size`` éléments, sans OFFSET ni COUNT.
+    """
+    if first is None:
+        page_size = pagination.page_size
+    elif first < 0:
+        raise GraphQLError("first must be positive")
+    else:
+        page_size = min(first, pagination.max_page_size)
+
+    page = queryset.order_by(*pagination.ordering)
+    if after:
+        try:
+            position = pagination.decode_position(after, queryset.model)
+        except Exception:
+            raise GraphQLError(pagination.invalid_cursor_message)
+        page = page.filter(pagination.get_position_filter(position))
+
+    # Une ligne de plus pour savoir s'il existe une page suivante
+    rows = list(page[:page_size + 1])
+    edges = [
+        connection_type.Edge(node=row, cursor=pagination.encode_cursor(pagination.get_position(row)))
+        for row in rows[:page_size]
+    ]
+    connection = connection_type(
+        edges=edges,
+        page_info=relay.PageInfo(
+            has_next_page=len(rows) > page_size,
+            has_previous_page=bool(after),
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+        )
+    )
+    connection.total_queryset = queryset
+    return connection
+
 class Query(graphene.ObjectType):
     # Product queries
-    products = graphene.List(ProductType)
+    products = graphene.Field(ProductConnection, first=graphene.Int(), after=graphene.String())
     product = graphene.Field(ProductType, id=graphene.Int(required=True))
-    all_products = graphene.List(ProductType)
+    all_products = graphene.Field(ProductConnection, first=graphene.Int(), after=graphene.String())
 
     # Order queries
-    orders = graphene.List(OrderType)
+    orders = graphene.Field(OrderConnection, first=graphene.Int(), after=graphene.String())
     order = graphene.Field(OrderType, id=graphene.Int(required=True))
     
     # Cart query
@@ -46,19 +161,22 @@ class Query(graphene.ObjectType):
     product_reviews = graphene.List(ProductReviewType, product_id=graphene.Int(required=True))
 
     @login_required
-    def resolve_products(self, info):
-        return Product.objects.all()
+    def resolve_products(self, info, first=None, after=None):
+        return product_connection(info, first, after)
 
     @login_required
     def resolve_product(self, info, id):
         return Product.objects.get(pk=id)
 
     @login_required
-    def resolve_orders(self, info):
+    def resolve_orders(self, info, first=None, after=None):
         user = info.context.user
-        if user.is_staff:
-            return Order.objects.all()
-        return Order.objects.filter(user=user)
+        orders = Order.objects.with_lines()
+        if not user.is_staff:
+            orders = orders.filter(user=user)
+        connection = keyset_connection(OrderConnection, orders, OrderCursorPagination(), first, after)
+        get_loaders(info).users.prime(edge.node.user_id for edge in connection.edges)
+        return connection
 
     @login_required
     def resolve_order(self, info, id):
@@ -70,14 +188,28 @@ class Query(graphene.ObjectType):
 
     @login_required
     def resolve_cart(self, info):
-        return Cart.objects.get(user=info.context.user)
+        # Création paresseuse, comme CartViewSet.list
+        cart, _ = Cart.objects.get_or_create(user=info.context.user)
+        return cart
 
     @login_required
     def resolve_product_reviews(self, info, product_id):
-        return ProductReview.objects.filter(product_id=product_id)
+        reviews = list(ProductReview.objects.filter(product_id=product_id))
+        loaders = get_loaders(info)
+        loaders.users.prime(review.user_id for review in reviews)
+        loaders.products.prime(review.product_id for review in reviews)
+        return reviews
+
+    def resolve_all_products(root, info, first=None, after=None):
+        # Sans authentification : la taille de page bornée empêche d'extraire tout le catalogue d'un coup
+        return product_connection(info, first, after)
 
-    def resolve_all_products(root, info):
-        return Product.objects.all()
+def product_connection(info, first, after):
+    connection = keyset_connection(
+        ProductConnection, Product.objects.all(), ProductCursorPagination(), first, after
+    )
+    get_loaders(info).reviews_by_product.prime(edge.node.id for edge in connection.edges)
+    return connection
 
 class CreateProductInput(graphene.InputObjectType):
     name = graphene.String(required=True)
@@ -122,13 +254,18 @@ class CreateReview(graphene.Mutation):
         
         if ProductReview.objects.filter(user=user, product=product).exists():
             raise Exception("You have already reviewed this product")
+
+        if not 1 <= input.rating <= 5:
+            raise Exception("Rating must be between 1 and 5")
         
-        review = ProductReview.objects.create(
-            user=user,
-            product=product,
-            rating=input.rating,
-            comment=input.comment
-        )
+        with transaction.atomic():
+            review = ProductReview.objects.create(
+                user=user,
+                product=product,
+                rating=input.rating,
+                comment=input.comment
+            )
+            Product.objects.record_rating(product.id, review.rating)
         return CreateReview(review=review)
 
 class AddToCartInput(graphene.InputObjectType):
@@ -144,21 +281,18 @@ class AddToCart(graphene.Mutation):
     @login_required
     def mutate(self, info, input):
         user = info.context.user
-        cart = Cart.objects.get(user=user)
+        if input.quantity < 1:
+            raise GraphQLError("Quantity must be positive")
+        cart, _ = Cart.objects.get_or_create(user=user)
         product = Product.objects.get(pk=input.product_id)
-        
-        if product.stock < input.quantity:
-            raise Exception("Insufficient stock")
-        
-        cart_item, created = cart.items.get_or_create(
-            product=product,
-            defaults={'quantity': input.quantity}
-        )
-        
-        if not created:
-            cart_item.quantity += input.quantity
-            cart_item.save()
-        
+
+        # Même chemin que CartViewSet.add_item : stock réservé, panier du magasin configuré
+        try:
+            reservations.add_to_cart(cart, get_cart_store(), product, input.quantity)
+        except InsufficientStockError:
+            raise GraphQLError("Insufficient stock")
+
+        subscriptions.publish_cart_changed(cart)
         return AddToCart(cart=cart)
 
 class Mutation(graphene.ObjectType):
@@ -166,4 +300,35 @@ class Mutation(graphene.ObjectType):
     create_review = CreateReview.Field()
     add_to_cart = AddToCart.Field()
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
+class Subscription(graphene.ObjectType):
+    """
+    Poussés par api/graphql_ws.py. Les ``subscribe_*`` vérifient l'utilisateur puis
+    renvoient le flux des messages de api/subscriptions.py ; les ``resolve_*`` relisent,
+    pour chaque événement, la commande (en base) ou le panier (dans son magasin) concerné.
+    """
+    order_status_changed = graphene.Field(OrderType)
+    cart_changed = graphene.Field(CartType)
+
+    def subscribe_order_status_changed(root, info):
+        user = info.context.user
+        if not user.is_authenticated:
+            raise GraphQLError("You do not have permission to perform this action")
+        channel = subscriptions.ORDERS_CHANNEL if user.is_staff else subscriptions.user_orders_channel(user.pk)
+        return subscriptions.get_broker().subscribe(channel)
+
+    def resolve_order_status_changed(root, info):
+        order = Order.objects.with_lines().filter(pk=root['order_id']).first()
+        if order is not None:
+            get_loaders(info).users.prime([order.user_id])
+        return order
+
+    def subscribe_cart_changed(root, info):
+        user = info.context.user
+        if not user.is_authenticated:
+            raise GraphQLError("You do not have permission to perform this action")
+        return subscriptions.get_broker().subscribe(subscriptions.user_cart_channel(user.pk))
+
+    def resolve_cart_changed(root, info):
+        return Cart.objects.filter(pk=root['cart_id']).first()
+
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
\ No newline at end of file
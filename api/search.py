@@ -0,0 +1,215 @@
+"""
+Recherche plein texte des produits.
+
+Deux chemins selon la base de données :
+- PostgreSQL : colonne générée ``search_vector`` (tsvector pondéré nom > description)
+  indexée en GIN, et index trigramme (pg_trgm) sur le nom pour tolérer les fautes de frappe.
+  Textes et requêtes passent par ``api_unaccent`` (extension unaccent) : insensible aux
+  accents, comme ``remove_diacritics`` de SQLite.
+- SQLite : tables virtuelles FTS5 ``api_product_fts`` (unicode61, préfixes indexés)
+  et ``api_product_trigram`` (tokenizer trigram), maintenues par les signaux de Product.
+
+Les tables et index sont créés par les migrations 0005_product_search_index et
+0008_product_search_unaccent.
+"""
+import re
+import sqlite3
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+
+# Nombre maximal de résultats classés renvoyés par une recherche
+DEFAULT_MAX_RESULTS = 200
+# Seuil de similarité de mots trigramme (word_similarity de pg_trgm)
+WORD_SIMILARITY_THRESHOLD = 0.5
+# Le tokenizer trigram de FTS5 est disponible à partir de SQLite 3.34
+SQLITE_HAS_TRIGRAM = sqlite3.sqlite_version_info >= (3, 34, 0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())
+
+
+def trigrams(text):
+    """Trigrammes d'un texte, mot par mot, avec le même padding que pg_trgm"""
+    result = set()
+    for word in tokenize(text):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def word_similarity(query, text):
+    """Part des trigrammes de la requête présents dans le texte (cf. word_similarity de pg_trgm)"""
+    query_grams = trigrams(query)
+    if not query_grams:
+        return 0.0
+    return len(query_grams & trigrams(text)) / len(query_grams)
+
+
+class SQLiteSearchBackend:
+    """Recherche via FTS5 : correspondance par préfixe, classement bm25"""
+
+    # Poids bm25 des colonnes (name, description)
+    rank_expression = 'bm25(api_product_fts, 10.0, 1.0)'
+
+    def search(self, query, limit):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM api_product_fts WHERE api_product_fts MATCH %s "
+                f"ORDER BY {self.rank_expression}, rowid DESC LIMIT %s",
+                [match, limit]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        if ids or not SQLITE_HAS_TRIGRAM:
+            return ids
+        return self.fuzzy_search(query, limit)
+
+    def fuzzy_search(self, query, limit):
+        """Repli tolérant aux fautes : candidats trigrammes, filtrés par similarité"""
+        grams = {
+            token[i:i + 3]
+            for token in tokenize(query) if len(token) >= 3
+            for i in range(len(token) - 2)
+        }
+        if not grams:
+            return []
+        match = ' OR '.join(f'"{gram}"' for gram in sorted(grams))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT rowid, name FROM api_product_trigram WHERE api_product_trigram MATCH %s "
+                "ORDER BY bm25(api_product_trigram) LIMIT %s",
+                [match, limit * 5]
+            )
+            candidates = cursor.fetchall()
+        scored = [
+            (word_similarity(query, name), product_id)
+            for product_id, name in candidates
+        ]
+        scored = [item for item in scored if item[0] >= WORD_SIMILARITY_THRESHOLD]
+        scored.sort(key=lambda item: (-item[0], -item[1]))
+        return [product_id for _, product_id in scored[:limit]]
+
+    def index(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM api_product_fts WHERE rowid = %s", [product.pk])
+            cursor.execute(
+                "INSERT INTO api_product_fts(rowid, name, description) VALUES (%s, %s, %s)",
+                [product.pk, product.name, product.description]
+            )
+            if SQLITE_HAS_TRIGRAM:
+                cursor.execute("DELETE FROM api_product_trigram WHERE rowid = %s", [product.pk])
+                cursor.execute(
+                    "INSERT INTO api_product_trigram(rowid, name) VALUES (%s, %s)",
+                    [product.pk, product.name]
+                )
+
+    def remove(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM api_product_fts WHERE rowid = %s", [product_id])
+            if SQLITE_HAS_TRIGRAM:
+                cursor.execute("DELETE FROM api_product_trigram WHERE rowid = %s", [product_id])
+
+
+class PostgresSearchBackend:
+    """Recherche via tsvector/GIN avec repli trigramme (pg_trgm)"""
+
+    def search(self, query, limit):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM api_product "
+                "WHERE search_vector @@ to_tsquery('simple', api_unaccent(%s)) "
+                "ORDER BY ts_rank(search_vector, to_tsquery('simple', api_unaccent(%s))) DESC, id DESC "
+                "LIMIT %s",
+                [tsquery, tsquery, limit]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if ids:
+                return ids
+        # L'opérateur <% utilise l'index GIN gin_trgm_ops sur api_unaccent(name). Seuil local
+        # à la transaction (is_local) : la connexion, réutilisée par d'autres requêtes, garde le sien
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                [str(WORD_SIMILARITY_THRESHOLD)]
+            )
+            cursor.execute(
+                "SELECT id FROM api_product WHERE api_unaccent(%s) <%% api_unaccent(name) "
+                "ORDER BY word_similarity(api_unaccent(%s), api_unaccent(name)) DESC, id DESC LIMIT %s",
+                [query, query, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, product):
+        # search_vector est une colonne générée, mise à jour par PostgreSQL
+        pass
+
+    def remove(self, product_id):
+        pass
+
+
+class BasicSearchBackend:
+    """Repli pour les autres bases : recherche par sous-chaîne sur le nom et la description"""
+
+    def search(self, query, limit):
+        from .models import Product
+        return list(
+            Product.objects.filter(Q(name__icontains=query) | Q(description__icontains=query))
+            .order_by('-created_at', '-id')
+            .values_list('id', flat=True)[:limit]
+        )
+
+    def index(self, product):
+        pass
+
+    def remove(self, product_id):
+        pass
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend():
+    return BACKENDS.get(connection.vendor, BasicSearchBackend)()
+
+
+def get_max_results():
+    return getattr(settings, 'PRODUCT_SEARCH_MAX_RESULTS', DEFAULT_MAX_RESULTS)
+
+
+def search_products(queryset, query, limit=None):
+    """
+    Filtre ``queryset`` sur les ``limit`` (PRODUCT_SEARCH_MAX_RESULTS) produits les mieux
+    classés pour ``query`` et annote ``search_rank`` (0 = meilleur résultat) pour la
+    pagination par rang. La borne est renvoyée aux clients (``max_results``).
+    """
+    limit = limit or get_max_results()
+    ids = get_search_backend().search(query, limit)
+    if not ids:
+        return queryset.none()
+    rank = Case(
+        *[When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)],
+        output_field=IntegerField()
+    )
+    return queryset.filter(pk__in=ids).annotate(search_rank=rank)
+
+
+def index_product(product):
+    get_search_backend().index(product)
+
+
+def remove_product(product_id):
+    get_search_backend().remove(product_id)
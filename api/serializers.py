@@ -1,10 +1,13 @@
 from rest_framework import serializers
-from .models import MobileUser, DeviceToken, GestureData, Product, Order, CartItem, Cart, ProductReview
+from .models import MobileUser, DeviceToken, GestureData, Product, Order, OrderLine, CartItem, Cart, ProductReview
 from django.core.validators import RegexValidator
+from . import product_cache
 import re
 
 class MobileUserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
+    # Le champ IP généré par DRF 3.14 n'est pas compatible avec Django 5.2
+    last_login_ip = serializers.CharField(read_only=True)
     
     class Meta:
         model = MobileUser
@@ -66,18 +69,30 @@ class ProductReviewSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'user_username', 'rating', 'comment', 'created_at')
         read_only_fields = ('user',)
 
+class CachedProductListSerializer(serializers.ListSerializer):
+    """Listes de produits : représentations reprises du cache par produit (api/product_cache.py)"""
+
+    def to_representation(self, data):
+        products = list(data.all() if hasattr(data, 'all') else data)
+        return product_cache.serialize_products(products, self.child)
+
 class ProductSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
     absolute_image_url = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
+    review_count = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
     reviews = serializers.SerializerMethodField()
+    available_stock = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Product
         fields = [
-            'id', 'name', 'description', 'price', 'stock', 'image',
-            'image_url', 'absolute_image_url', 'average_rating', 'reviews', 'is_ai_generated'
+            'id', 'name', 'description', 'price', 'stock', 'available_stock', 'image',
+            'image_url', 'absolute_image_url', 'average_rating', 'review_count',
+            'rating_histogram', 'reviews', 'is_ai_generated'
         ]
+        list_serializer_class = CachedProductListSerializer
         extra_kwargs = {
             'image': {'write_only': True, 'required': False}
         }
@@ -92,13 +107,21 @@ class ProductSerializer(serializers.ModelSerializer):
         return ""
 
     def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if not reviews:
-            return 0.0
-        return sum(review.rating for review in reviews) / len(reviews)
+        return float(obj.average_rating)
+
+    def get_review_count(self, obj):
+        return obj.rating_count
+
+    def get_rating_histogram(self, obj):
+        return obj.rating_histogram
 
     def get_reviews(self, obj):
-        reviews = obj.reviews.all()
+        # reviews_limit=0 : le listing n'embarque aucun avis
+        if self.context.get('reviews_limit') == 0:
+            return []
+        reviews = getattr(obj, 'prefetched_reviews', None)
+        if reviews is None:
+            reviews = obj.reviews.all()
         return [
             {
                 'id': review.id,
@@ -111,13 +134,47 @@ class ProductSerializer(serializers.ModelSerializer):
             for review in reviews
         ]
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderLineSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
-    
+    subtotal = serializers.DecimalField(read_only=True, max_digits=10, decimal_places=2)
+
+    class Meta:
+        model = OrderLine
+        fields = ('id', 'product', 'product_name', 'quantity', 'unit_price', 'subtotal')
+        read_only_fields = ('unit_price',)
+
+class OrderSerializer(serializers.ModelSerializer):
+    lines = OrderLineSerializer(many=True)
+
     class Meta:
         model = Order
-        fields = ('id', 'product', 'product_name', 'quantity', 'unit_price', 'total_price', 'status', 'created_at')
-        read_only_fields = ('unit_price', 'total_price', 'status')
+        fields = ('id', 'lines', 'total_price', 'status', 'created_at')
+        read_only_fields = ('total_price', 'status')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # Les lignes d'une commande existante ne se modifient pas (PUT/PATCH) :
+        # le stock a été prélevé à la création
+        if self.instance is not None:
+            fields['lines'] = OrderLineSerializer(many=True, read_only=True)
+        return fields
+
+    def validate_lines(self, value):
+        if not value:
+            raise serializers.ValidationError("La commande doit contenir au moins un produit")
+        return value
+
+    def create(self, validated_data):
+        lines = validated_data.pop('lines')
+        order = Order.objects.create(**validated_data)
+        order_lines = OrderLine.objects.bulk_create([
+            OrderLine(order=order, unit_price=line['product'].price, **line)
+            for line in lines
+        ])
+        Order.objects.filter(pk=order.pk).update_totals()
+        order.refresh_from_db(fields=['total_price'])
+        order._prefetched_objects_cache = {'lines': order_lines}
+        return order
 
 class CartItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
@@ -128,6 +185,32 @@ class CartItemSerializer(serializers.ModelSerializer):
         model = CartItem
         fields = ('id', 'product', 'product_name', 'product_price', 'quantity', 'subtotal')
 
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=('add', 'update', 'remove'))
+    product = serializers.IntegerField(required=False)
+    item = serializers.IntegerField(required=False)
+    quantity = serializers.IntegerField(required=False, default=1)
+
+    def validate(self, data):
+        if data['op'] == 'add':
+            if 'product' not in data:
+                raise serializers.ValidationError({'product': "Ce champ est obligatoire pour 'add'."})
+            if data['quantity'] < 1:
+                raise serializers.ValidationError({'quantity': "La quantité doit être positive."})
+        elif 'item' not in data:
+            raise serializers.ValidationError({'item': f"Ce champ est obligatoire pour '{data['op']}'."})
+        return data
+
+class CartBatchSerializer(serializers.Serializer):
+    MAX_OPERATIONS = 100
+
+    operations = CartOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, value):
+        if len(value) > self.MAX_OPERATIONS:
+            raise serializers.ValidationError(f"{self.MAX_OPERATIONS} opérations au maximum par lot.")
+        return value
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total = serializers.DecimalField(read_only=True, max_digits=10, decimal_places=2)
@@ -0,0 +1,113 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from redis.exceptions import RedisError
+import logging
+from .models import Product, ProductReview, Cart, MobileUser, Order
+from . import http_cache, product_cache, reservations, revocation, search, subscriptions
+
+logger = logging.getLogger(__name__)
+
+# Colonnes couvertes par l'index de recherche
+SEARCH_FIELDS = {'name', 'description'}
+
+
+@receiver(post_save, sender=Product)
+def index_product_for_search(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_search(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+
+@receiver(pre_delete, sender=Cart)
+def release_cart_reservations(sender, instance, **kwargs):
+    # La suppression en cascade des réservations ne décrémenterait pas reserved_stock
+    reservations.release_cart(instance)
+
+
+def revoke_user_tokens(user_id):
+    # Les jetons déjà émis restent valides, et en cache, sans révocation explicite
+    try:
+        revocation.revoke_user(user_id)
+    except RedisError as e:
+        logger.warning(f"Révocation des jetons de l'utilisateur {user_id} impossible : {e}")
+
+
+@receiver(post_save, sender=MobileUser)
+def revoke_inactive_user_tokens(sender, instance, update_fields=None, **kwargs):
+    if instance.is_active or (update_fields is not None and 'is_active' not in update_fields):
+        return
+    revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=MobileUser)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def publish_order_status(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    if not created and instance.status == getattr(instance, '_loaded_status', None):
+        return
+    instance._loaded_status = instance.status
+    subscriptions.publish_order_status(instance)
+
+
+# Version du catalogue (api/http_cache.py) : incrémentée après le commit, pour qu'un
+# ETag calculé sur la nouvelle version ne puisse pas accompagner les anciennes données
+
+@receiver(post_save, sender=Product)
+def bump_catalog_on_product_save(sender, instance, update_fields=None, **kwargs):
+    # Une sauvegarde qui avance updated_at change déjà les ETag du produit
+    if update_fields is not None and 'updated_at' not in update_fields:
+        transaction.on_commit(http_cache.bump_catalog_version)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def bump_catalog_version(sender, **kwargs):
+    transaction.on_commit(http_cache.bump_catalog_version)
+
+
+
+# Représentations en cache (api/product_cache.py) : nouvelle version du produit après le commit
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_product_representation(sender, instance, **kwargs):
+    transaction.on_commit(partial(product_cache.bump_version, instance.pk))
+
+
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def bump_reviewed_product_representation(sender, instance, **kwargs):
+    transaction.on_commit(partial(product_cache.bump_version, instance.product_id))
+
+
+def bump_products_reviewed_by(user_id):
+    product_ids = ProductReview.objects.filter(user_id=user_id).values_list('product_id', flat=True).distinct()
+    for product_id in product_ids:
+        product_cache.bump_version(product_id)
+
+
+@receiver(post_save, sender=MobileUser)
+def bump_caches_on_username_change(sender, instance, created, update_fields=None, **kwargs):
+    # Le nom d'utilisateur est embarqué dans les avis : catalogue et représentations des
+    # produits commentés, seulement s'il a changé depuis la lecture en base
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    changed = not created and instance.username != getattr(instance, '_loaded_username', None)
+    instance._loaded_username = instance.username
+    if not changed:
+        return
+    transaction.on_commit(http_cache.bump_catalog_version)
+    transaction.on_commit(partial(bump_products_reviewed_by, instance.pk))
@@ -0,0 +1,171 @@
+"""
+Diffusion des événements des abonnements GraphQL (api/schema.py, Subscription).
+
+Les écritures publient un message minimal (identifiants) sur un canal, après le commit :
+- ``graphql:orders:<user_id>`` et ``graphql:orders`` (staff) : changement de statut
+  d'une commande, création comprise ;
+- ``graphql:cart:<user_id>`` : modification du panier.
+Chaque événement est ensuite résolu comme une requête (commande ou panier relu en base)
+pour la sélection demandée par l'abonné.
+
+Courtier choisi par GRAPHQL_SUBSCRIPTION_BROKER :
+- ``memory`` (défaut) : diffusion dans le processus, pour un seul worker ASGI ;
+- ``redis`` : publication Redis (PUBLISH) ; chaque processus ASGI maintient une seule
+  connexion abonnée à ``graphql:*`` qui redistribue localement, quel que soit le
+  nombre de sockets ouvertes.
+Chaque abonné a une file bornée (GRAPHQL_SUBSCRIPTION_QUEUE_SIZE) : un client trop
+lent perd les événements en excès plutôt que de faire grossir la mémoire du worker.
+"""
+import asyncio
+import json
+import logging
+import threading
+from functools import partial
+from django.conf import settings
+from django.db import transaction
+from redis.exceptions import RedisError
+from .redis_client import DEFAULT_REDIS_URL, get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'graphql:'
+ORDERS_CHANNEL = f'{CHANNEL_PREFIX}orders'
+
+DEFAULT_QUEUE_SIZE = 100
+# Attente avant reconnexion de l'écoute Redis (secondes)
+RECONNECT_DELAY = 1
+
+
+def user_orders_channel(user_id):
+    return f'{ORDERS_CHANNEL}:{user_id}'
+
+
+def user_cart_channel(user_id):
+    return f'{CHANNEL_PREFIX}cart:{user_id}'
+
+
+class InProcessBroker:
+
+    def __init__(self):
+        # canal -> {(boucle, file)} ; publish peut venir d'un autre thread que la boucle
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self.lock:
+            targets = list(self.subscribers.get(channel, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(self.deliver, channel, queue, message)
+            except RuntimeError:
+                # Boucle fermée : l'abonné est parti
+                pass
+
+    @staticmethod
+    def deliver(channel, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            logger.warning(f"Abonné trop lent sur {channel}, événement abandonné")
+
+    async def subscribe(self, channel):
+        """Générateur asynchrone des messages publiés sur ``channel``"""
+        queue = asyncio.Queue(maxsize=getattr(settings, 'GRAPHQL_SUBSCRIPTION_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(subscriber)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            with self.lock:
+                channel_subscribers = self.subscribers.get(channel)
+                if channel_subscribers is not None:
+                    channel_subscribers.discard(subscriber)
+                    if not channel_subscribers:
+                        del self.subscribers[channel]
+
+
+class RedisBroker(InProcessBroker):
+
+    def __init__(self):
+        super().__init__()
+        self.listener = None
+        self.ready = None
+
+    def publish(self, channel, message):
+        get_redis().publish(channel, json.dumps(message))
+
+    async def subscribe(self, channel):
+        # Un événement publié avant l'abonnement Redis du processus serait perdu
+        await asyncio.shield(self.ensure_listener())
+        async for message in super().subscribe(channel):
+            yield message
+
+    def ensure_listener(self):
+        """Démarre l'écoute Redis du processus ; renvoie un futur résolu une fois abonné"""
+        loop = asyncio.get_running_loop()
+        if self.listener is None or self.listener.done() or self.listener.get_loop() is not loop:
+            self.ready = loop.create_future()
+            self.listener = loop.create_task(self.listen(self.ready))
+        return self.ready
+
+    async def listen(self, ready):
+        """Relaie vers les abonnés locaux tout ce qui est publié sur ``graphql:*``"""
+        import redis.asyncio
+
+        while True:
+            client = redis.asyncio.Redis.from_url(
+                getattr(settings, 'REDIS_URL', DEFAULT_REDIS_URL), decode_responses=True
+            )
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+                    if not ready.done():
+                        ready.set_result(True)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'pmessage':
+                            InProcessBroker.publish(self, message['channel'], json.loads(message['data']))
+            except RedisError as e:
+                logger.warning(f"Écoute Redis des abonnements GraphQL interrompue : {e}")
+            finally:
+                await client.aclose()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+BROKERS = {
+    'memory': InProcessBroker,
+    'redis': RedisBroker,
+}
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    """Courtier du processus : les abonnés et les publications doivent partager la même instance"""
+    name = getattr(settings, 'GRAPHQL_SUBSCRIPTION_BROKER', 'memory')
+    with _brokers_lock:
+        if name not in _brokers:
+            _brokers[name] = BROKERS[name]()
+        return _brokers[name]
+
+
+def publish(channels, message):
+    broker = get_broker()
+    for channel in channels:
+        try:
+            broker.publish(channel, message)
+        except RedisError as e:
+            logger.warning(f"Événement {channel} non publié : {e}")
+
+
+def publish_order_status(order):
+    message = {'order_id': order.pk, 'status': order.status}
+    channels = [user_orders_channel(order.user_id), ORDERS_CHANNEL]
+    transaction.on_commit(partial(publish, channels, message))
+
+
+def publish_cart_changed(cart):
+    message = {'cart_id': cart.pk}
+    transaction.on_commit(partial(publish, [user_cart_channel(cart.user_id)], message))
@@ -1,41 +1,74 @@
-import openai
 from django.conf import settings
-from .models import Product
+from django.utils import timezone
+from .models import Product, GestureData, DeviceToken
+from . import ai_cache
+from .llm import get_llm_provider, LLMError, LLMRateLimitError
 from celery import shared_task
 import json
+import requests
 import time
 
-openai_client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+def ai_generation_enabled():
+    """La génération IA n'est possible qu'avec un fournisseur LLM configuré"""
+    return get_llm_provider().is_available()
 
-@shared_task
-def generate_product_with_ai(prompt="Génère un produit e-commerce réaliste au format JSON."):
+def build_search_prompt(query):
+    """Prompt de génération d'un produit à partir d'une recherche sans résultat"""
+    return f"""Generate a product based on this search: {query}
+    Format the response as JSON with these fields:
+    {{
+        "name": "product name",
+        "description": "detailed description",
+        "price": decimal number between 10 and 1000,
+        "stock": integer between 1 and 100
+    }}"""
+
+@shared_task(bind=True, max_retries=3)
+def generate_product_with_ai(self, prompt="Génère un produit e-commerce réaliste au format JSON.", cache_key=None):
+    """
+    Génère un produit avec l'IA. Les 429 sont retentés avec un délai exponentiel.
+    Avec cache_key (recherche sans résultat), le produit est mémorisé dans le cache
+    des générations et la réservation en vol est libérée une fois la tâche terminée.
+    """
+    try:
+        product_id = _generate_product(prompt)
+    except LLMRateLimitError as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        print("Erreur IA : quota dépassé (429), abandon après plusieurs tentatives.")
+        product_id = None
+    if cache_key:
+        ai_cache.record_result(cache_key, product_id)
+    return product_id
+
+def _generate_product(prompt):
+    provider = get_llm_provider()
+    ai_cache.increment('upstream_calls')
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
+        content = provider.complete(
+            [
                 {"role": "system", "content": "Tu es un assistant qui génère des produits e-commerce réalistes au format JSON."},
                 {"role": "user", "content": prompt}
             ],
+            task='product_generation',
             max_tokens=300,
             temperature=0.7,
         )
-        data = json.loads(response.choices[0].message.content)
+        data = json.loads(content)
         product = Product.objects.create(
             name=data["name"],
             description=data.get("description", ""),
             price=data.get("price", 10.0),
             stock=data.get("stock", 10),
             is_ai_generated=True,
-            ai_source="openai-gpt-3.5-turbo"
+            ai_source=provider.name
         )
         return product.id
 
-    except openai.OpenAIError as e:
-        # Gestion spécifique des erreurs OpenAI
-        if hasattr(e, 'status_code') and e.status_code == 429:
-            print("Erreur OpenAI : quota dépassé (429).")
-        else:
-            print(f"Erreur OpenAI : {e}")
+    except LLMRateLimitError:
+        raise
+    except LLMError as e:
+        print(f"Erreur IA : {e}")
         return None
     except Exception as e:
         print("Erreur parsing ou création produit IA :", e)
@@ -64,6 +97,46 @@ def generate_product_image(prompt):
         print(f"Error generating image: {str(e)}")
         return ""
 
+@shared_task
+def flush_login_tracking():
+    """
+    Écriture par lots des connexions notées dans Redis (LOGIN_TRACKING = 'redis'),
+    planifiée par Celery beat
+    """
+    from .login_tracking import get_login_tracker
+    tracker = get_login_tracker()
+    if not tracker.write_behind:
+        return 0
+    return tracker.flush()
+
+@shared_task
+def flush_cart_store():
+    """
+    Écriture différée des paniers Redis (CART_STORE = 'redis') vers CartItem,
+    planifiée par Celery beat
+    """
+    from .cart_store import get_cart_store
+    store = get_cart_store()
+    if not store.write_behind:
+        return 0
+    flushed = 0
+    while True:
+        count = store.flush()
+        if not count:
+            return flushed
+        flushed += count
+
+@shared_task
+def reap_expired_reservations():
+    """Libère par lots les réservations de stock expirées, planifiée par Celery beat"""
+    from .reservations import reap_expired
+    released = 0
+    while True:
+        count = reap_expired()
+        if not count:
+            return released
+        released += count
+
 @shared_task
 def cleanup_unused_ai_products():
     """
@@ -74,11 +147,12 @@ def cleanup_unused_ai_products():
     Product.objects.filter(
         is_ai_generated=True,
         created_at__lt=threshold,
-        orders__isnull=True
+        order_lines__isnull=True
     ).delete()
 
-@shared_task
-def process_gesture_data(gesture_data_id):
+@shared_task(bind=True, max_retries=3)
+def process_gesture_data(self, gesture_data_id):
+    import numpy as np  # Dépendance du Pipfile, chargée seulement par le traitement des gestes
     try:
         gesture_data = GestureData.objects.get(id=gesture_data_id)
         
@@ -91,36 +165,39 @@ def process_gesture_data(gesture_data_id):
         # Preprocess data
         normalized_data = preprocess_gesture_data(data_points)
         
-        # Use LangChain for gesture classification
-        llm = OpenAI(api_key=settings.OPENAI_API_KEY)
-        prompt = PromptTemplate(
-            input_variables=["gesture_data"],
-            template="""
+        # Use the configured LLM provider for gesture classification
+        prompt = f"""
             Analyze the following gesture data points and classify the gesture type:
-            {gesture_data}
+            {normalized_data.tolist()}
             Provide the classification and confidence score.
             """
+        result = get_llm_provider().complete(
+            [{"role": "user", "content": prompt}],
+            task='gesture_classification'
         )
         
-        result = llm(prompt.format(gesture_data=normalized_data.tolist()))
-        
         # Parse LLM response and update gesture data
         classification = parse_llm_response(result)
         
         gesture_data.gesture_type = classification['type']
         gesture_data.confidence_score = classification['confidence']
         gesture_data.processed = True
-        gesture_data.save()
+        gesture_data.save(update_fields=['gesture_type', 'confidence_score', 'processed'])
         
         # Notify user about processed gesture
         notify_user_about_gesture.delay(gesture_data.id)
         
     except GestureData.DoesNotExist:
         print(f"GestureData with id {gesture_data_id} not found")
+    except LLMRateLimitError as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        print(f"Error processing gesture data: {str(e)}")
     except Exception as e:
         print(f"Error processing gesture data: {str(e)}")
 
 def preprocess_gesture_data(data_points):
+    import numpy as np
     # Normalize the data
     mean = np.mean(data_points, axis=0)
     std = np.std(data_points, axis=0)
@@ -175,8 +252,7 @@ def send_push_notification(device_token_id, title, message):
             # Implement APN logic here
             pass
             
-        device_token.last_used = timezone.now()
-        device_token.save()
+        DeviceToken.objects.filter(pk=device_token.pk).update(last_used=timezone.now())
         
     except DeviceToken.DoesNotExist:
         print(f"DeviceToken with id {device_token_id} not found")
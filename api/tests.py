@@ -1,13 +1,62 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
 from rest_framework.test import APIClient
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
-from .models import Product, MobileUser
+from .models import (
+    Product, MobileUser, ProductReview, Order, OrderLine, Cart, CartItem, InsufficientStockError,
+    StockReservation
+)
+from . import ai_cache, graphql_documents, product_cache, reservations, revocation, subscriptions
+from .serializers import ProductSerializer
 import os
 import magic
 from django.conf import settings
+from django.core.management import call_command
+from django.test import override_settings
+from django.core.cache import caches
+from io import StringIO
+from unittest import mock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import threading
+import unittest
+from decimal import Decimal
+from django.utils import timezone
+from django.apps import apps
+import asyncio
+import datetime
+import contextlib
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.tokens import AccessToken
+import importlib.util
+import json
+import re
 
-class ProductImageUploadTests(TestCase):
+
+UPDATE_PATTERN = re.compile(r'^UPDATE\s+"?(\w+)"?\s+SET\s+(.*?)\s+WHERE\s', re.IGNORECASE | re.DOTALL)
+
+
+class NarrowWriteAssertions:
+    """Vérifie que les chemins critiques n'écrivent que les colonnes modifiées"""
+
+    @contextlib.contextmanager
+    def assertNoFullRowUpdates(self):
+        columns_by_table = {
+            model._meta.db_table: {field.column for field in model._meta.concrete_fields if not field.primary_key}
+            for model in apps.get_models()
+        }
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        for query in context.captured_queries:
+            match = UPDATE_PATTERN.match(query['sql'])
+            if not match or match.group(1) not in columns_by_table:
+                continue
+            written = set(re.findall(r'"(\w+)"\s*=', match.group(2)))
+            columns = columns_by_table[match.group(1)]
+            if len(columns) > 1 and written >= columns:
+                self.fail(f"UPDATE de toutes les colonnes de {match.group(1)} : {query['sql']}")
+
+class ProductImageUploadTests(NarrowWriteAssertions, TestCase):
     def setUp(self):
         # Créer un utilisateur de test
         self.user = MobileUser.objects.create_user(
@@ -54,7 +103,7 @@ class ProductImageUploadTests(TestCase):
     
     def test_upload_jpeg_success(self):
         """Test l'upload d'une image JPEG valide"""
-        with open(self.jpeg_path, 'rb') as image_file:
+        with open(self.jpeg_path, 'rb') as image_file, self.assertNoFullRowUpdates():
             response = self.client.post(
                 self.upload_url,
                 {
@@ -73,6 +122,27 @@ class ProductImageUploadTests(TestCase):
         self.product.refresh_from_db()
         self.assertTrue(self.product.image)
     
+    def test_upload_updates_product_fields(self):
+        """Test que les champs envoyés avec l'image sont enregistrés"""
+        with open(self.jpeg_path, 'rb') as image_file, self.assertNoFullRowUpdates():
+            response = self.client.post(
+                self.upload_url,
+                {
+                    'image': image_file,
+                    'product_id': self.product.id,
+                    'name': 'Nouveau nom',
+                    'stock': 7
+                },
+                format='multipart'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.stock), ('Nouveau nom', 7))
+        self.assertTrue(self.product.image)
+        search = self.client.get('/api/v1/products/search/?query=Nouveau')
+        self.assertEqual([product['id'] for product in search.data['results']], [self.product.id])
+
     def test_upload_png_success(self):
         """Test l'upload d'une image PNG valide"""
         with open(self.png_path, 'rb') as image_file:
@@ -172,3 +242,2091 @@ class ProductImageUploadTests(TestCase):
         
         self.assertEqual(response.status_code, 400)
         self.assertIn('error', response.data)
+
+class ProductListingQueryCountTests(TestCase):
+    """Le listing des produits doit émettre un nombre constant de requêtes"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(
+            username='listinguser',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.reviewers = [
+            MobileUser.objects.create_user(username=f'reviewer{i}', password='testpass123')
+            for i in range(3)
+        ]
+
+    def create_catalog(self, size):
+        for i in range(size):
+            product = Product.objects.create(
+                name=f'Catalog Product {Product.objects.count()}',
+                price=10,
+                stock=5,
+                is_ai_generated=True
+            )
+            for rating, reviewer in enumerate(self.reviewers, start=3):
+                ProductReview.objects.create(
+                    product=product,
+                    user=reviewer,
+                    rating=rating,
+                    comment='Bien'
+                )
+                Product.objects.record_rating(product.id, rating)
+
+    def assertConstantQueries(self, url, num):
+        for size in (1, 10):
+            self.create_catalog(size)
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_list_query_count(self):
+        """Test le nombre de requêtes du listing"""
+        self.assertConstantQueries('/api/v1/products/', 2)
+
+    def test_retrieve_query_count(self):
+        """Test le nombre de requêtes du détail d'un produit"""
+        self.create_catalog(1)
+        product = Product.objects.first()
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/v1/products/{product.id}/')
+        self.assertEqual(response.data['average_rating'], 4.0)
+        self.assertEqual(response.data['review_count'], 3)
+        self.assertEqual(len(response.data['reviews']), 3)
+
+    def test_search_query_count(self):
+        """Test le nombre de requêtes de la recherche"""
+        self.assertConstantQueries('/api/v1/products/search/?query=Catalog', 4)
+
+    def test_ai_generated_query_count(self):
+        """Test le nombre de requêtes des produits générés par IA"""
+        self.assertConstantQueries('/api/v1/products/ai_generated/', 2)
+
+    def test_listing_rating_summary(self):
+        """Test la note moyenne et le nombre d'avis exposés par le listing"""
+        self.create_catalog(2)
+        response = self.client.get('/api/v1/products/')
+        for product in response.data['results']:
+            self.assertEqual(product['average_rating'], 4.0)
+            self.assertEqual(product['review_count'], 3)
+            self.assertCountEqual(
+                [review['user_username'] for review in product['reviews']],
+                ['reviewer0', 'reviewer1', 'reviewer2']
+            )
+
+class ProductCursorPaginationTests(TestCase):
+    """Pagination par curseur du catalogue et troncature des avis embarqués"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(
+            username='pageuser',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.products = [
+            Product.objects.create(name=f'Paged Product {i}', price=10, stock=5)
+            for i in range(5)
+        ]
+        # Dates identiques : l'id doit départager les produits
+        Product.objects.filter(id__in=[p.id for p in self.products[1:4]]).update(
+            created_at=self.products[1].created_at
+        )
+
+    def test_walk_all_pages(self):
+        """Test le parcours complet du catalogue page par page"""
+        url = '/api/v1/products/?page_size=2'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(product['id'] for product in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), len(self.products))
+        self.assertCountEqual(seen, [p.id for p in self.products])
+        self.assertEqual(
+            seen,
+            list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        )
+
+    def test_invalid_cursor(self):
+        """Test un curseur invalide"""
+        response = self.client.get('/api/v1/products/?cursor=invalide')
+        self.assertEqual(response.status_code, 404)
+
+    def test_reviews_limit(self):
+        """Test la troncature des avis embarqués dans le listing"""
+        product = self.products[0]
+        for i in range(3):
+            reviewer = MobileUser.objects.create_user(username=f'limit{i}', password='testpass123')
+            ProductReview.objects.create(product=product, user=reviewer, rating=5, comment='Top')
+            Product.objects.record_rating(product.id, 5)
+
+        response = self.client.get('/api/v1/products/?reviews_limit=1')
+        data = {p['id']: p for p in response.data['results']}[product.id]
+        self.assertEqual(len(data['reviews']), 1)
+        self.assertEqual(data['reviews'][0]['user_username'], 'limit2')
+        self.assertEqual(data['review_count'], 3)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/products/?reviews_limit=0')
+        data = {p['id']: p for p in response.data['results']}[product.id]
+        self.assertEqual(data['reviews'], [])
+        self.assertEqual(data['review_count'], 3)
+
+        response = self.client.get(f'/api/v1/products/{product.id}/')
+        self.assertEqual(len(response.data['reviews']), 3)
+
+class ProductRatingSummaryTests(TestCase):
+    """Colonnes de résumé des notes maintenues incrémentalement"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(
+            username='rater',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(name='Rated Product', price=10, stock=5)
+        self.other = Product.objects.create(name='Other Product', price=10, stock=5)
+
+    def test_review_updates_summary(self):
+        """Test la mise à jour du résumé lors de la création d'un avis"""
+        response = self.client.post(
+            f'/api/v1/products/{self.product.id}/review/',
+            {'rating': 4, 'comment': 'Bien'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_sum, 4)
+        self.assertEqual(self.product.rating_count, 1)
+        self.assertEqual(self.product.rating_histogram, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0})
+        self.assertEqual(self.product.average_rating, 4)
+
+    def test_rebuild_command(self):
+        """Test le recalcul en masse des résumés"""
+        for i, rating in enumerate([5, 5, 2]):
+            reviewer = MobileUser.objects.create_user(username=f'bulk{i}', password='testpass123')
+            ProductReview.objects.create(product=self.product, user=reviewer, rating=rating, comment='Ok')
+        Product.objects.filter(id=self.other.id).update(rating_sum=9, rating_count=2)
+
+        out = StringIO()
+        call_command('rebuild_rating_summaries', stdout=out)
+
+        self.product.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (12, 3))
+        self.assertEqual(self.product.rating_histogram, {1: 0, 2: 1, 3: 0, 4: 0, 5: 2})
+        self.assertEqual((self.other.rating_sum, self.other.rating_count), (0, 0))
+
+    def test_filter_and_sort_by_rating(self):
+        """Test le filtre et le tri par note en SQL"""
+        Product.objects.record_rating(self.product.id, 5)
+        Product.objects.record_rating(self.other.id, 2)
+        third = Product.objects.create(name='Third Product', price=10, stock=5)
+        Product.objects.record_rating(third.id, 4)
+
+        response = self.client.get('/api/v1/products/?min_rating=4')
+        self.assertCountEqual(
+            [p['id'] for p in response.data['results']],
+            [self.product.id, third.id]
+        )
+
+        url = '/api/v1/products/?ordering=-rating&page_size=1'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            seen.extend(p['id'] for p in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [self.product.id, third.id, self.other.id])
+
+# Sans fournisseur IA disponible, une recherche sans résultat renvoie une page vide (200)
+@override_settings(LLM_PROVIDER='openai', OPENAI_API_KEY='')
+class ProductFullTextSearchTests(TestCase):
+    """Recherche plein texte : classement, préfixes, fautes de frappe et mise à jour de l'index"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(
+            username='searcher',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.headset = Product.objects.create(
+            name='Casque Bluetooth',
+            description='Réduction de bruit active',
+            price=120,
+            stock=5
+        )
+        self.speaker = Product.objects.create(
+            name='Enceinte portable',
+            description='Idéale avec un casque ou seule',
+            price=80,
+            stock=5
+        )
+        self.mouse = Product.objects.create(name='Souris sans fil', price=20, stock=5)
+
+    def search(self, query):
+        response = self.client.get('/api/v1/products/search/', {'query': query})
+        self.assertEqual(response.status_code, 200)
+        if not response.data:
+            return []
+        return [product['id'] for product in response.data['results']]
+
+    def test_name_ranked_before_description(self):
+        """Test que le nom pèse plus que la description dans le classement"""
+        self.assertEqual(self.search('casque'), [self.headset.id, self.speaker.id])
+
+    def test_description_and_accents(self):
+        """Test la recherche dans la description sans tenir compte des accents"""
+        self.assertEqual(self.search('reduction bruit'), [self.headset.id])
+
+    def test_prefix_matching(self):
+        """Test la correspondance par préfixe"""
+        self.assertEqual(self.search('sour'), [self.mouse.id])
+
+    def test_typo_fallback(self):
+        """Test le repli trigramme pour les fautes de frappe"""
+        self.assertEqual(self.search('casqeu'), [self.headset.id])
+
+    def test_index_updates_on_save_and_delete(self):
+        """Test la mise à jour de l'index à l'enregistrement et à la suppression"""
+        self.mouse.name = 'Clavier mécanique'
+        self.mouse.save()
+        self.assertEqual(self.search('clavier'), [self.mouse.id])
+        self.assertEqual(self.search('souris'), [])
+
+        self.mouse.delete()
+        self.assertEqual(self.search('clavier'), [])
+
+    def test_list_search_param_paginates_by_rank(self):
+        """Test la pagination des résultats classés via ?search="""
+        url = '/api/v1/products/?search=casque&page_size=1'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            seen.extend(product['id'] for product in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [self.headset.id, self.speaker.id])
+
+    @override_settings(PRODUCT_SEARCH_MAX_RESULTS=1)
+    def test_max_results_in_response(self):
+        """Test que la borne des résultats classés est indiquée au client"""
+        response = self.client.get('/api/v1/products/search/', {'query': 'casque'})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.headset.id])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(response.data['max_results'], 1)
+
+@override_settings(OPENAI_API_KEY='sk-test-key')
+class ProductGenerationJobTests(TestCase):
+    """Une recherche sans résultat renvoie immédiatement un job de génération IA"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(
+            username='jobuser',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        caches['default'].clear()
+
+    @mock.patch('api.views.generate_product_with_ai.apply_async')
+    def test_search_miss_returns_job(self, apply_async):
+        """Test la réponse 202 avec un identifiant de job partagé par les recherches concurrentes"""
+        task_ids = set()
+        for url in ('/api/v1/products/search/?query=licorne', '/api/v1/products/?search=Licornes'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data['results'], [])
+            task_id = response.data['generation']['task_id']
+            task_ids.add(task_id)
+            self.assertTrue(
+                response.data['generation']['status_url'].endswith(f'/api/v1/products/generation-jobs/{task_id}/')
+            )
+        # Une seule génération pour deux recherches équivalentes
+        self.assertEqual(len(task_ids), 1)
+        apply_async.assert_called_once()
+        self.assertIn('licorne', apply_async.call_args.kwargs['args'][0])
+        self.assertEqual(apply_async.call_args.kwargs['task_id'], task_ids.pop())
+
+    @override_settings(OPENAI_API_KEY='sk-xxxxxxx')
+    @mock.patch('api.views.generate_product_with_ai.apply_async')
+    def test_search_miss_without_api_key(self, apply_async):
+        """Test qu'aucun job n'est lancé sans clé OpenAI"""
+        response = self.client.get('/api/v1/products/search/?query=licorne')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+        apply_async.assert_not_called()
+
+    @mock.patch('api.views.generate_product_with_ai.apply_async')
+    def test_generation_cache_hit(self, apply_async):
+        """Test qu'une recherche équivalente réutilise le produit déjà généré"""
+        product = Product.objects.create(name='Peluche unicorne', price=15, stock=3, is_ai_generated=True)
+        self.client.get('/api/v1/products/search/?query=licorne rose')
+        cache_key = apply_async.call_args.kwargs['kwargs']['cache_key']
+        ai_cache.record_result(cache_key, product.id)
+
+        response = self.client.get('/api/v1/products/search/?query=Rose  LICORNE')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['id'] for p in response.data['results']], [product.id])
+        apply_async.assert_called_once()
+
+        admin = MobileUser.objects.create_user(username='jobadmin', password='testpass123', is_staff=True)
+        self.client.force_authenticate(user=admin)
+        metrics = self.client.get('/api/v1/products/generation-metrics/').data
+        self.assertEqual(metrics['hits'], 1)
+        self.assertEqual(metrics['misses'], 1)
+        self.assertEqual(metrics['saved_upstream_calls'], 1)
+        self.assertEqual(metrics['hit_ratio'], 0.5)
+
+    def test_normalize_prompt(self):
+        """Test la normalisation des requêtes"""
+        self.assertEqual(
+            ai_cache.normalize_prompt('Chaussures  ROUGES été'),
+            ai_cache.normalize_prompt('rouge chaussure ete')
+        )
+        self.assertNotEqual(
+            ai_cache.get_cache_key('chaussure rouge'),
+            ai_cache.get_cache_key('chaussure bleue')
+        )
+
+    @mock.patch('api.views.AsyncResult')
+    def test_job_status(self, async_result):
+        """Test le suivi d'un job en attente puis terminé"""
+        result = async_result.return_value
+        result.ready.return_value = False
+        result.successful.return_value = False
+        result.failed.return_value = False
+        ai_cache.record_job('job-1')
+        response = self.client.get('/api/v1/products/generation-jobs/job-1/')
+        self.assertEqual(response.data['status'], 'pending')
+        result.get.assert_not_called()
+
+        product = Product.objects.create(name='Licorne gonflable', price=15, stock=3, is_ai_generated=True)
+        result.successful.return_value = True
+        result.result = product.id
+        response = self.client.get('/api/v1/products/generation-jobs/job-1/?wait=30')
+        self.assertEqual(response.data['status'], 'success')
+        self.assertEqual(response.data['product']['id'], product.id)
+        result.get.assert_called_once_with(timeout=10, propagate=False)
+
+    @mock.patch('api.views.AsyncResult')
+    def test_job_failed(self, async_result):
+        """Test un job terminé sans produit"""
+        result = async_result.return_value
+        result.successful.return_value = True
+        result.result = None
+        ai_cache.record_job('job-2')
+        response = self.client.get('/api/v1/products/generation-jobs/job-2/')
+        self.assertEqual(response.data['status'], 'failed')
+
+    @mock.patch('api.views.AsyncResult')
+    def test_job_rejects_other_tasks(self, async_result):
+        """Test que seules les tâches de génération lancées par l'API sont consultables"""
+        result = async_result.return_value
+        result.successful.return_value = True
+        result.result = 'terminé'
+        response = self.client.get('/api/v1/products/generation-jobs/demo-task/')
+        self.assertEqual(response.status_code, 404)
+        async_result.assert_not_called()
+
+        # Résultat inattendu d'une tâche de génération : échec, pas d'erreur 500
+        ai_cache.record_job('demo-task')
+        response = self.client.get('/api/v1/products/generation-jobs/demo-task/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'failed')
+
+    @mock.patch('api.views.generate_product_with_ai.apply_async')
+    def test_generate_ai_records_job(self, apply_async):
+        """Test que le job lancé par generate-ai est consultable"""
+        response = self.client.post('/api/v1/products/generate-ai/', {'prompt': 'Une lampe'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        task_id = response.data['task_id']
+        self.assertEqual(apply_async.call_args.kwargs['task_id'], task_id)
+        self.assertTrue(ai_cache.is_generation_job(task_id))
+
+
+@override_settings(LLM_PROVIDER='fake', LLM_FAKE_LATENCY=0)
+class FakeLLMProviderTests(TestCase):
+    """Les tâches IA tournent hors ligne avec le fournisseur LLM local"""
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_generation_is_deterministic(self):
+        """Test qu'un même prompt produit le même produit, sans clé OpenAI"""
+        from .tasks import ai_generation_enabled, generate_product_with_ai
+        self.assertTrue(ai_generation_enabled())
+        first = Product.objects.get(id=generate_product_with_ai.apply(args=['licorne']).result)
+        second = Product.objects.get(id=generate_product_with_ai.apply(args=['licorne']).result)
+        self.assertEqual(first.ai_source, 'fake-llm')
+        self.assertTrue(first.is_ai_generated)
+        self.assertEqual((first.name, first.price, first.stock), (second.name, second.price, second.stock))
+        self.assertEqual(ai_cache.get_metrics()['upstream_calls'], 2)
+
+    @override_settings(LLM_FAKE_RATE_LIMIT_RATE=1.0, LLM_FAKE_SEED=7)
+    def test_rate_limit_is_retried(self):
+        """Test que les 429 sont retentés puis abandonnés en libérant la réservation en vol"""
+        from .llm import get_llm_provider
+        from .tasks import generate_product_with_ai
+        provider = get_llm_provider()
+        provider.stats.update(calls=0, rate_limited=0, errors=0)
+        caches['default'].set(ai_cache.inflight_key('k'), 'task-1')
+
+        result = generate_product_with_ai.apply(args=['licorne'], kwargs={'cache_key': 'k'})
+        self.assertIsNone(result.result)
+        self.assertEqual(provider.stats['calls'], generate_product_with_ai.max_retries + 1)
+        self.assertEqual(provider.stats['rate_limited'], provider.stats['calls'])
+        self.assertIsNone(caches['default'].get(ai_cache.inflight_key('k')))
+        self.assertFalse(Product.objects.exists())
+
+    @mock.patch('api.tasks.notify_user_about_gesture.delay')
+    def test_gesture_classification(self, notify):
+        """Test la classification d'un geste par le fournisseur local"""
+        from .models import GestureData
+        from .tasks import process_gesture_data
+        user = MobileUser.objects.create_user(username='gestureuser', password='testpass123')
+        gesture = GestureData.objects.create(
+            user=user,
+            gesture_type='unknown',
+            confidence_score=0,
+            data_points=[{'x': i, 'y': i * 2 % 7, 'z': i % 3} for i in range(10)]
+        )
+        process_gesture_data.apply(args=[gesture.id])
+        gesture.refresh_from_db()
+        self.assertTrue(gesture.processed)
+        self.assertIn(gesture.gesture_type, ('swipe_left', 'swipe_right', 'tap', 'circle', 'shake'))
+        self.assertGreaterEqual(gesture.confidence_score, 0.5)
+        notify.assert_called_once_with(gesture.id)
+
+
+class HotPathWriteTests(NarrowWriteAssertions, TestCase):
+    """Les écritures fréquentes ne réécrivent pas toute la ligne"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(username='hotpath', password='testpass123')
+        self.client = APIClient()
+
+    def test_harness_detects_full_row_update(self):
+        product = Product.objects.create(name='Lampe', price=15, stock=4)
+        with self.assertRaises(AssertionError):
+            with self.assertNoFullRowUpdates():
+                product.save()
+
+    def test_login_writes_tracking_columns_only(self):
+        """Test que la connexion n'écrit que last_login et last_login_ip"""
+        credentials = {'username': 'hotpath', 'password': 'testpass123'}
+        with self.assertNoFullRowUpdates():
+            response = self.client.post('/api/v1/users/login/', credentials, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_login_ip, '127.0.0.1')
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_viewset_login(self):
+        from rest_framework.test import APIRequestFactory
+        from .views import MobileUserViewSet
+        request = APIRequestFactory().post(
+            '/api/v1/users/login/', {'username': 'hotpath', 'password': 'testpass123'},
+            format='json', REMOTE_ADDR='10.0.0.7'
+        )
+        with self.assertNoFullRowUpdates():
+            response = MobileUserViewSet.as_view({'post': 'login'})(request)
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_login_ip, '10.0.0.7')
+
+    def test_approve(self):
+        product = Product.objects.create(name='Généré', price=12, stock=3, is_ai_generated=True)
+        self.client.force_authenticate(user=self.user)
+        with self.assertNoFullRowUpdates():
+            response = self.client.post(f'/api/v1/products/{product.id}/approve/')
+        self.assertEqual(response.status_code, 200)
+        product.refresh_from_db()
+        self.assertFalse(product.is_ai_generated)
+
+    def test_add_item_twice(self):
+        product = Product.objects.create(name='Tasse', price=6, stock=10)
+        cart = Cart.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.client.post(f'/api/v1/carts/{cart.id}/add_item/', {'product': product.id, 'quantity': 1}, format='json')
+        with self.assertNoFullRowUpdates():
+            response = self.client.post(
+                f'/api/v1/carts/{cart.id}/add_item/', {'product': product.id, 'quantity': 2}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CartItem.objects.get(cart=cart).quantity, 3)
+
+    def test_push_notification_bumps_last_used(self):
+        from .models import DeviceToken
+        from .tasks import send_push_notification
+        token = DeviceToken.objects.create(user=self.user, token='apn-token', token_type='APN')
+        before = token.last_used
+        with self.assertNoFullRowUpdates():
+            send_push_notification.apply(args=[token.id, 'Titre', 'Message'])
+        token.refresh_from_db()
+        self.assertGreater(token.last_used, before)
+
+    @override_settings(LLM_PROVIDER='fake', LLM_FAKE_LATENCY=0)
+    @mock.patch('api.tasks.notify_user_about_gesture.delay')
+    def test_gesture_processing(self, notify):
+        from .models import GestureData
+        from .tasks import process_gesture_data
+        gesture = GestureData.objects.create(
+            user=self.user,
+            gesture_type='unknown',
+            confidence_score=0,
+            data_points=[{'x': i, 'y': i % 4, 'z': i % 3} for i in range(10)]
+        )
+        with self.assertNoFullRowUpdates():
+            process_gesture_data.apply(args=[gesture.id])
+        gesture.refresh_from_db()
+        self.assertTrue(gesture.processed)
+
+class LoginTrackingTests(TestCase):
+    """La connexion n'écrit ni panier ni, en mode Redis, utilisateur"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(username='storm', password='testpass123')
+        self.client = APIClient()
+
+    def login(self, username='storm'):
+        return self.client.post(
+            '/api/v1/users/login/', {'username': username, 'password': 'testpass123'}, format='json'
+        )
+
+    def test_cart_created_lazily(self):
+        """Test que le panier est créé à la première consultation, pas à la connexion"""
+        self.assertEqual(self.login().status_code, 200)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/api/v1/carts/')
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['items'], [])
+        response = self.client.get('/api/v1/carts/')
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 1)
+
+    def test_registration_creates_cart(self):
+        response = self.client.post('/api/v1/users/register/', {
+            'username': 'newcomer', 'password': 'testpass123', 'phone_number': '+33612345678'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Cart.objects.filter(user__username='newcomer').exists())
+
+
+    @override_settings(LOGIN_TRACKING='redis')
+    def test_redis_outage_falls_back_to_database(self):
+        """Test qu'une panne Redis n'empêche pas la connexion : elle est notée en base"""
+        from redis.exceptions import ConnectionError as RedisConnectionError
+        with mock.patch('redis.Redis.hset', side_effect=RedisConnectionError('down')):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+@override_settings(LOGIN_TRACKING='redis')
+class RedisLoginTrackingTests(TestCase):
+    """Connexions notées dans Redis puis écrites par lots (nécessite un serveur Redis)"""
+
+    @classmethod
+    def setUpClass(cls):
+        from .redis_client import redis_available
+        if not redis_available():
+            raise unittest.SkipTest("Serveur Redis indisponible")
+        super().setUpClass()
+
+    def setUp(self):
+        from .login_tracking import RedisLoginTracker, PENDING_KEY, FLUSHING_KEY
+        self.tracker = RedisLoginTracker()
+        self.tracker.client.delete(PENDING_KEY, FLUSHING_KEY)
+        self.addCleanup(self.tracker.client.delete, PENDING_KEY, FLUSHING_KEY)
+        self.users = [
+            MobileUser.objects.create_user(username=f'storm{i}', password='testpass123') for i in range(5)
+        ]
+        self.client = APIClient()
+
+    def test_login_skips_user_update(self):
+        """Test que la connexion n'écrit pas la table des utilisateurs"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                '/api/v1/users/login/', {'username': 'storm0', 'password': 'testpass123'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in context.captured_queries if q['sql'].startswith('UPDATE')])
+        self.users[0].refresh_from_db()
+        self.assertIsNone(self.users[0].last_login)
+
+    def test_flush_in_batches(self):
+        """Test que la tâche écrit les connexions en attente par lots de bulk_update"""
+        from .tasks import flush_login_tracking
+        for i, user in enumerate(self.users):
+            self.tracker.record(user, f'10.0.0.{i}')
+        self.tracker.record(self.users[0], '10.0.0.99')
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.tracker.flush(batch=3), 5)
+        for i, user in enumerate(self.users):
+            user.refresh_from_db()
+            self.assertIsNotNone(user.last_login)
+            self.assertEqual(user.last_login_ip, '10.0.0.99' if i == 0 else f'10.0.0.{i}')
+        self.assertEqual(flush_login_tracking.apply().get(), 0)
+
+PBKDF2_HASHER = 'api.passwords.ConfigurablePBKDF2PasswordHasher'
+
+
+@override_settings(PASSWORD_HASHERS=[PBKDF2_HASHER], PASSWORD_PBKDF2_ITERATIONS=1000)
+class PasswordHashingTests(TestCase):
+    """Coût de hachage configurable, re-hachage transparent et connexion asynchrone"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(username='hasher', password='testpass123')
+        self.client = APIClient()
+
+    def login(self):
+        return self.client.post(
+            '/api/v1/users/login/', {'username': 'hasher', 'password': 'testpass123'}, format='json'
+        )
+
+    def test_cost_from_settings(self):
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_rehash_on_login(self):
+        """Test qu'un changement de coût ou d'algorithme est appliqué à la connexion"""
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+        with self.settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher', PBKDF2_HASHER]):
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('md5$'))
+
+    @unittest.skipUnless(importlib.util.find_spec('bcrypt'), "bcrypt non installé")
+    def test_bcrypt_rounds(self):
+        with self.settings(
+            PASSWORD_HASHERS=['api.passwords.ConfigurableBCryptSHA256PasswordHasher', PBKDF2_HASHER],
+            PASSWORD_BCRYPT_ROUNDS=4
+        ):
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('bcrypt_sha256$$2b$04$'))
+
+    @override_settings(AUTHENTICATION_BACKENDS=['api.passwords.PooledModelBackend'])
+    async def test_async_login_hashes_in_pool(self):
+        """Test que la connexion asynchrone vérifie le mot de passe hors de la boucle"""
+        from django.contrib.auth.hashers import verify_password
+        from django.contrib.auth.signals import user_login_failed
+        from django.test.client import AsyncRequestFactory
+        from . import passwords
+        from .views import async_login
+
+        threads = []
+        failures = []
+
+        def recording_verify(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return verify_password(*args, **kwargs)
+
+        def record_failure(**kwargs):
+            failures.append(kwargs['credentials']['username'])
+
+        user_login_failed.connect(record_failure)
+        self.addCleanup(user_login_failed.disconnect, record_failure)
+        factory = AsyncRequestFactory()
+        with mock.patch.object(passwords, 'verify_password', recording_verify), \
+                self.settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            response = await async_login(factory.post(
+                '/api/v1/users/login/', {'username': 'hasher', 'password': 'testpass123'},
+                content_type='application/json'
+            ))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('access', json.loads(response.content))
+            response = await async_login(factory.post(
+                '/api/v1/users/login/', {'username': 'hasher', 'password': 'wrong'},
+                content_type='application/json'
+            ))
+            self.assertEqual(response.status_code, 401)
+            # Corps JSON qui n'est pas un objet
+            response = await async_login(factory.post('/api/v1/users/login/', [], content_type='application/json'))
+            self.assertEqual(response.status_code, 400)
+
+        # Les backends d'authentification sont passés par django.contrib.auth : signal d'échec émis
+        self.assertEqual(failures, ['hasher'])
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith('password-hashing') for name in threads))
+        await self.user.arefresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+class CachedJWTAuthenticationTests(TestCase):
+    """Utilisateur du jeton mis en cache par jti, révocation vérifiée à chaque appel"""
+
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        from .authentication import principal_cache
+        principal_cache.clear()
+        self.addCleanup(principal_cache.clear)
+        self.user = MobileUser.objects.create_user(username='principal', password='testpass123')
+        self.token = str(AccessToken.for_user(self.user))
+
+    def authenticate(self, token=None):
+        from rest_framework.test import APIRequestFactory
+        from .authentication import CachedJWTAuthentication
+        request = APIRequestFactory().get('/api/v1/products/', HTTP_AUTHORIZATION=f'Bearer {token or self.token}')
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    @mock.patch('api.revocation.is_revoked', return_value=False)
+    def test_cache_hit_skips_query(self, is_revoked):
+        with self.assertNumQueries(1):
+            first = self.authenticate()
+        with self.assertNumQueries(0):
+            second = self.authenticate()
+        self.assertEqual(second.pk, self.user.pk)
+        self.assertEqual(second.username, 'principal')
+        self.assertIsNot(first, second)
+        self.assertEqual(is_revoked.call_count, 2)
+
+    @mock.patch('api.revocation.is_revoked', return_value=True)
+    def test_revoked_token_rejected(self, is_revoked):
+        from rest_framework_simplejwt.exceptions import AuthenticationFailed
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    @override_settings(JWT_PRINCIPAL_CACHE_SIZE=1)
+    @mock.patch('api.revocation.is_revoked', return_value=False)
+    def test_lru_bound(self, is_revoked):
+        from rest_framework_simplejwt.tokens import AccessToken
+        other = str(AccessToken.for_user(self.user))
+        self.authenticate()
+        self.authenticate(other)
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+    def test_redis_unavailable_falls_back_to_database(self):
+        from redis.exceptions import ConnectionError as RedisConnectionError
+        with mock.patch('api.revocation.is_revoked', side_effect=RedisConnectionError('down')):
+            with self.assertNumQueries(1):
+                self.authenticate()
+            with self.assertNumQueries(1):
+                self.authenticate()
+
+
+class JWTRevocationTests(TestCase):
+    """Déconnexion et désactivation révoquent les jetons immédiatement (nécessite un serveur Redis)"""
+
+    @classmethod
+    def setUpClass(cls):
+        from .redis_client import redis_available
+        if not redis_available():
+            raise unittest.SkipTest("Serveur Redis indisponible")
+        super().setUpClass()
+
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import RefreshToken
+        from .authentication import principal_cache
+        from .redis_client import get_redis
+        principal_cache.clear()
+        self.addCleanup(principal_cache.clear)
+        self.user = MobileUser.objects.create_user(username='revoked', password='testpass123')
+        get_redis().delete(revocation.REVOKED_KEY, revocation.user_key(self.user.pk))
+        self.addCleanup(get_redis().delete, revocation.REVOKED_KEY, revocation.user_key(self.user.pk))
+        self.refresh = RefreshToken.for_user(self.user)
+        self.token = str(self.refresh.access_token)
+
+    def authenticate(self, token=None):
+        from rest_framework.test import APIRequestFactory
+        from .authentication import CachedJWTAuthentication
+        request = APIRequestFactory().get('/api/v1/products/', HTTP_AUTHORIZATION=f'Bearer {token or self.token}')
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_logout_revokes_token(self):
+        from rest_framework_simplejwt.exceptions import AuthenticationFailed
+        self.assertEqual(self.authenticate().pk, self.user.pk)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        response = client.post('/api/v1/users/logout/', {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 204)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+        self.assertTrue(revocation.is_revoked(self.refresh))
+
+    def test_deactivation_revokes_all_tokens(self):
+        from rest_framework_simplejwt.exceptions import AuthenticationFailed
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deletion_revokes_all_tokens(self):
+        from rest_framework_simplejwt.exceptions import AuthenticationFailed
+        self.authenticate()
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed) as context:
+            self.authenticate()
+        self.assertEqual(context.exception.detail['code'], 'token_revoked')
+
+class GraphQLDataLoaderTests(TestCase):
+    """Le nombre de requêtes des requêtes GraphQL imbriquées ne dépend pas du nombre de lignes"""
+
+    def setUp(self):
+        self.staff = MobileUser.objects.create_user(username='graphstaff', password='testpass123', is_staff=True)
+        self.products = [Product.objects.create(name=f'Article {i}', price=10 + i, stock=50) for i in range(4)]
+
+    def execute(self, query, user=None):
+        from django.test import RequestFactory
+        from .schema import schema
+        request = RequestFactory().post('/graphql/')
+        request.user = user or self.staff
+        result = schema.execute(query, context_value=request)
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def add_orders(self, count):
+        for i in range(count):
+            buyer = MobileUser.objects.create_user(username=f'buyer{Order.objects.count()}', password='testpass123')
+            order = Order.objects.create(user=buyer)
+            OrderLine.objects.bulk_create([
+                OrderLine(order=order, product=product, quantity=1, unit_price=product.price)
+                for product in self.products[:2]
+            ])
+
+    def test_orders_query_count(self):
+        """Test orders { user lines { product } } : commandes, lignes et utilisateurs"""
+        query = '{ orders { edges { node { id user { username } lines { quantity product { name } } } } } }'
+        self.add_orders(2)
+        with self.assertNumQueries(3):
+            data = self.execute(query)
+        self.assertEqual(len(data['orders']['edges']), 2)
+        self.add_orders(5)
+        with self.assertNumQueries(3):
+            data = self.execute(query)
+        orders = [edge['node'] for edge in data['orders']['edges']]
+        self.assertEqual(len(orders), 7)
+        self.assertTrue(all(order['user']['username'].startswith('buyer') for order in orders))
+        self.assertEqual(orders[0]['lines'][0]['product']['name'], 'Article 0')
+
+    def test_product_reviews_query_count(self):
+        """Test products { reviews { user product } } : produits, avis, auteurs, produits des avis"""
+        for i in range(6):
+            reviewer = MobileUser.objects.create_user(username=f'reviewer{i}', password='testpass123')
+            ProductReview.objects.create(product=self.products[i % 4], user=reviewer, rating=4, comment='Bien')
+        with self.assertNumQueries(4):
+            data = self.execute('{ products { edges { node { name reviews { rating user { username } product { id } } } } } }')
+        self.assertEqual(sum(len(edge['node']['reviews']) for edge in data['products']['edges']), 6)
+
+        with self.assertNumQueries(3):
+            data = self.execute(
+                f'{{ productReviews(productId: {self.products[0].id}) {{ user {{ username }} product {{ name }} }} }}'
+            )
+        self.assertEqual(len(data['productReviews']), 2)
+
+    def test_cart_query_count(self):
+        """Test cart { items { product } total } : panier, articles avec produits, utilisateur"""
+        cart = Cart.objects.create(user=self.staff)
+        for product in self.products:
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        with self.assertNumQueries(3):
+            data = self.execute('{ cart { user { username } total items { quantity subtotal product { name } } } }')
+        self.assertEqual(len(data['cart']['items']), 4)
+        self.assertEqual(Decimal(data['cart']['total']), Decimal('92.00'))
+
+class GraphQLConnectionTests(TestCase):
+    """Connexions Relay paginées par curseur, nombre total calculé à la demande"""
+
+    def setUp(self):
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Article {i:02}', price=5, stock=1) for i in range(25)
+        ])
+
+    def execute(self, query):
+        from django.test import RequestFactory
+        from django.contrib.auth.models import AnonymousUser
+        from .schema import schema
+        request = RequestFactory().post('/graphql/')
+        request.user = AnonymousUser()
+        return schema.execute(query, context_value=request)
+
+    def test_walk_all_products(self):
+        """Test le parcours complet du catalogue anonyme, page par page"""
+        seen = []
+        after = None
+        while True:
+            argument = f', after: "{after}"' if after else ''
+            with self.assertNumQueries(1):
+                result = self.execute(
+                    f'{{ allProducts(first: 10{argument}) {{ '
+                    f'pageInfo {{ hasNextPage endCursor }} edges {{ cursor node {{ id }} }} }} }}'
+                )
+            self.assertIsNone(result.errors)
+            connection = result.data['allProducts']
+            seen += [int(edge['node']['id']) for edge in connection['edges']]
+            if not connection['pageInfo']['hasNextPage']:
+                break
+            after = connection['pageInfo']['endCursor']
+        self.assertEqual(seen, sorted((p.id for p in self.products), reverse=True))
+
+    def test_total_count_is_lazy(self):
+        with self.assertNumQueries(1):
+            result = self.execute('{ allProducts(first: 5) { edges { node { name } } } }')
+        self.assertEqual(len(result.data['allProducts']['edges']), 5)
+        with self.assertNumQueries(2):
+            result = self.execute('{ allProducts(first: 5) { totalCount } }')
+        self.assertEqual(result.data['allProducts']['totalCount'], 25)
+
+    def test_page_size_is_capped(self):
+        from .pagination import ProductCursorPagination
+        Product.objects.bulk_create([Product(name=f'Extra {i}', price=5, stock=1) for i in range(100)])
+        result = self.execute('{ allProducts(first: 1000) { edges { node { id } } } }')
+        self.assertEqual(len(result.data['allProducts']['edges']), ProductCursorPagination.max_page_size)
+        result = self.execute('{ allProducts { edges { node { id } } } }')
+        self.assertEqual(len(result.data['allProducts']['edges']), ProductCursorPagination.page_size)
+
+    def test_invalid_cursor(self):
+        result = self.execute('{ allProducts(after: "nope") { edges { node { id } } } }')
+        self.assertEqual(result.errors[0].message, 'Invalid cursor')
+        result = self.execute('{ products { edges { node { id } } } }')
+        self.assertIsNotNone(result.errors)
+
+class GraphQLCostLimitTests(TestCase):
+    """Coût et profondeur des requêtes GraphQL bornés avant exécution, selon le profil"""
+
+    COSTLY_QUERY = '{ allProducts(first: 100) { edges { node { reviews { user { username } } } } } }'
+
+    def setUp(self):
+        Product.objects.create(name='Lampe', price=15, stock=4)
+
+    def post(self, query, variables=None):
+        return self.client.post(
+            '/graphql/', {'query': query, 'variables': variables or {}}, content_type='application/json'
+        )
+
+    def test_cost_in_extensions(self):
+        response = self.post('{ allProducts(first: 5) { edges { node { name } } } }')
+        self.assertEqual(response.status_code, 200)
+        cost = response.json()['extensions']['cost']
+        # allProducts 1 + 5 × (edges 1 + node 1)
+        self.assertEqual((cost['requested'], cost['depth']), (11, 3))
+        self.assertEqual(cost['maxCost'], 300)
+
+        response = self.post(
+            'query($n: Int) { allProducts(first: $n) { edges { node { name } } } }', {'n': 2}
+        )
+        self.assertEqual(response.json()['extensions']['cost']['requested'], 5)
+
+    def test_anonymous_cannot_read_reviewer_private_fields(self):
+        """Test qu'un anonyme ne lit ni l'email ni le statut staff des auteurs d'avis"""
+        reviewer = MobileUser.objects.create_user(
+            username='critique', email='critique@example.com', password='testpass123', is_staff=True
+        )
+        ProductReview.objects.create(product=Product.objects.get(), user=reviewer, rating=4, comment='Bien')
+        for field in ('email', 'isStaff'):
+            response = self.post(
+                f'{{ allProducts(first: 5) {{ edges {{ node {{ reviews {{ user {{ username {field} }} }} }} }} }} }}'
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertNotIn('critique@example.com', response.content.decode())
+            self.assertIn(f"Cannot query field '{field}'", response.json()['errors'][0]['message'])
+
+        response = self.post('{ allProducts(first: 5) { edges { node { reviews { user { id username } } } } } }')
+        node = response.json()['data']['allProducts']['edges'][0]['node']
+        self.assertEqual(node['reviews'][0]['user']['username'], 'critique')
+
+    def test_invalid_variables(self):
+        """Test qu'une variable invalide donne une erreur de validation, pas une erreur serveur"""
+        query = 'query($n: Int) { allProducts(first: $n) { edges { node { name } } } }'
+        response = self.post(query, {'n': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('$n', response.json()['errors'][0]['message'])
+
+        response = self.post(query, {'n': None})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['extensions']['cost']['requested'], 41)
+
+    def test_cost_budget_per_tier(self):
+        """Test qu'une requête trop coûteuse est refusée sans SQL pour un anonyme, acceptée pour le staff"""
+        with self.assertNumQueries(0):
+            response = self.post(self.COSTLY_QUERY)
+        self.assertEqual(response.status_code, 400)
+        body = response.json()
+        self.assertEqual(body['errors'][0]['extensions']['code'], 'QUERY_TOO_COSTLY')
+        self.assertEqual(body['extensions']['cost']['requested'], 1301)
+        self.assertNotIn('data', body)
+
+        staff = MobileUser.objects.create_user(username='graphcost', password='testpass123', is_staff=True)
+        self.client.force_login(staff)
+        response = self.post(self.COSTLY_QUERY)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['extensions']['cost']['maxCost'], 10000)
+
+    @mock.patch('api.revocation.is_revoked', return_value=False)
+    def test_bearer_token_selects_tier(self, is_revoked):
+        """Test que le jeton Bearer fixe le profil sans passer par authenticate()"""
+        from django.contrib.auth.signals import user_login_failed
+        staff = MobileUser.objects.create_user(username='graphbearer', password='testpass123', is_staff=True)
+        failures = []
+        handler = lambda **kwargs: failures.append(kwargs)
+        user_login_failed.connect(handler)
+        self.addCleanup(user_login_failed.disconnect, handler)
+
+        self.assertEqual(self.post(self.COSTLY_QUERY).status_code, 400)
+        response = self.client.post(
+            '/graphql/', {'query': self.COSTLY_QUERY}, content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(staff)}'
+        )
+        self.assertEqual(response.json()['extensions']['cost']['maxCost'], 10000)
+
+        # Jeton invalide : profil anonyme
+        response = self.client.post(
+            '/graphql/', {'query': self.COSTLY_QUERY}, content_type='application/json',
+            HTTP_AUTHORIZATION='Bearer invalide'
+        )
+        self.assertEqual(response.json()['errors'][0]['extensions']['code'], 'QUERY_TOO_COSTLY')
+        self.assertEqual(failures, [])
+
+    def test_depth_limit(self):
+        response = self.post(
+            '{ allProducts(first: 1) { edges { node { reviews { product { reviews { product '
+            '{ reviews { user { username } } } } } } } } } }'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['extensions']['code'], 'QUERY_TOO_DEEP')
+
+    def test_cyclic_fragment(self):
+        """Test qu'un fragment cyclique n'emballe pas l'analyse et reste refusé par la validation"""
+        response = self.post(
+            'fragment A on ProductType { reviews { product { ...A } } } '
+            '{ allProducts(first: 1) { edges { node { ...A } } } }'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class GraphQLPersistedQueryTests(TestCase):
+    """Requêtes persistées automatiques et cache des documents analysés et validés"""
+
+    QUERY = '{ allProducts(first: 5) { edges { node { name } } } }'
+
+    def setUp(self):
+        Product.objects.create(name='Lampe', price=15, stock=4)
+        caches['default'].clear()
+        graphql_documents.document_cache.clear()
+
+    def post(self, query=None, sha256_hash=None):
+        data = {}
+        if query is not None:
+            data['query'] = query
+        if sha256_hash is not None:
+            data['extensions'] = {'persistedQuery': {'version': 1, 'sha256Hash': sha256_hash}}
+        return self.client.post('/graphql/', data, content_type='application/json')
+
+    def test_register_on_first_use(self):
+        sha256_hash = graphql_documents.query_hash(self.QUERY)
+        response = self.post(sha256_hash=sha256_hash)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['errors'][0]['message'], 'PersistedQueryNotFound')
+        self.assertEqual(response.json()['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+
+        response = self.post(self.QUERY, sha256_hash)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(graphql_documents.get_persisted_query(sha256_hash), self.QUERY)
+
+        # Régime établi : le hash seul suffit
+        response = self.post(sha256_hash=sha256_hash)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['allProducts']['edges'][0]['node']['name'], 'Lampe')
+        self.assertIn('cost', response.json()['extensions'])
+
+    def test_hash_mismatch(self):
+        response = self.post(self.QUERY, '0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(graphql_documents.get_persisted_query('0' * 64))
+
+    def test_cached_document_skips_parse_and_validate(self):
+        self.assertEqual(self.post(self.QUERY).status_code, 200)
+        with mock.patch('api.graphql_cost.parse') as parse, mock.patch('api.graphql_cost.validate') as validate:
+            response = self.post(self.QUERY)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['allProducts']['edges'][0]['node']['name'], 'Lampe')
+        parse.assert_not_called()
+        validate.assert_not_called()
+        self.assertEqual(graphql_documents.document_cache.hits, 1)
+
+    def test_invalid_documents_not_cached(self):
+        for _ in range(2):
+            response = self.post('{ allProducts { unknownField } }')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(graphql_documents.document_cache.entries), 0)
+
+    @override_settings(GRAPHQL_DOCUMENT_CACHE_SIZE=2)
+    def test_lru_eviction(self):
+        queries = [
+            '{ allProducts(first: %d) { edges { node { name } } } }' % first for first in (1, 2, 3)
+        ]
+        for query in queries:
+            self.post(query)
+        self.post(queries[1])
+        self.assertEqual(
+            list(graphql_documents.document_cache.entries),
+            [graphql_documents.query_hash(queries[2]), graphql_documents.query_hash(queries[1])]
+        )
+
+
+class WebSocketTestClient:
+    """Client graphql-transport-ws branché directement sur l'application ASGI"""
+
+    def __init__(self, subprotocols=('graphql-transport-ws',)):
+        self.scope = {'type': 'websocket', 'path': '/graphql/', 'subprotocols': list(subprotocols)}
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+
+    async def connect(self):
+        from .graphql_ws import graphql_ws_application
+        self.task = asyncio.create_task(graphql_ws_application(self.scope, self.incoming.get, self.outgoing.put))
+        await self.incoming.put({'type': 'websocket.connect'})
+        return await self.receive()
+
+    async def send_json(self, message):
+        await self.incoming.put({'type': 'websocket.receive', 'text': json.dumps(message)})
+
+    async def receive(self):
+        return await asyncio.wait_for(self.outgoing.get(), timeout=5)
+
+    async def receive_json(self):
+        message = await self.receive()
+        assert message['type'] == 'websocket.send', message
+        return json.loads(message['text'])
+
+    async def disconnect(self):
+        await self.incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, timeout=5)
+
+
+class GraphQLSubscriptionTests(TransactionTestCase):
+    """Statuts de commande et paniers poussés aux abonnés GraphQL sur websocket"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(username='subscriber', password='testpass123')
+        self.other = MobileUser.objects.create_user(username='neighbour', password='testpass123')
+        self.product = Product.objects.create(name='Lampe', price=15, stock=10)
+        self.order = Order.objects.create(user=self.user)
+
+    async def connect(self, user=None, token=None):
+        client = WebSocketTestClient()
+        accepted = await client.connect()
+        self.assertEqual(accepted['subprotocol'], 'graphql-transport-ws')
+        payload = {}
+        if user is not None:
+            payload['authorization'] = f'Bearer {token or AccessToken.for_user(user)}'
+        await client.send_json({'type': 'connection_init', 'payload': payload})
+        self.assertEqual((await client.receive_json())['type'], 'connection_ack')
+        return client
+
+    async def wait_for_subscriber(self, channel):
+        broker = subscriptions.get_broker()
+        for _ in range(100):
+            if broker.subscribers.get(channel):
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f"Aucun abonné sur {channel}")
+
+    @staticmethod
+    @sync_to_async
+    def set_status(order, status):
+        order.status = status
+        order.save(update_fields=['status'])
+
+    async def test_order_status_pushed(self):
+        client = await self.connect(self.user)
+        await client.send_json({
+            'id': '1', 'type': 'subscribe',
+            'payload': {'query': 'subscription { orderStatusChanged { id status user { username } } }'}
+        })
+        await self.wait_for_subscriber(subscriptions.user_orders_channel(self.user.pk))
+
+        order = await Order.objects.aget(pk=self.order.pk)
+        await self.set_status(order, 'paid')
+        message = await client.receive_json()
+        self.assertEqual((message['id'], message['type']), ('1', 'next'))
+        self.assertEqual(message['payload']['data']['orderStatusChanged'], {
+            'id': str(self.order.pk), 'status': 'PAID', 'user': {'username': 'subscriber'}
+        })
+
+        # Ni une sauvegarde sans transition ni la commande d'un autre utilisateur ne sont poussées
+        await self.set_status(order, 'paid')
+        other_order = await Order.objects.acreate(user=self.other)
+        await self.set_status(other_order, 'paid')
+        await self.set_status(order, 'shipped')
+        message = await client.receive_json()
+        self.assertEqual(message['payload']['data']['orderStatusChanged']['status'], 'SHIPPED')
+
+        await client.send_json({'id': '1', 'type': 'complete'})
+        await client.disconnect()
+        self.assertNotIn(subscriptions.user_orders_channel(self.user.pk), subscriptions.get_broker().subscribers)
+
+    async def test_cart_changes_pushed(self):
+        client = await self.connect(self.user)
+        await client.send_json({
+            'id': 'cart', 'type': 'subscribe',
+            'payload': {'query': 'subscription { cartChanged { total items { quantity } } }'}
+        })
+        await self.wait_for_subscriber(subscriptions.user_cart_channel(self.user.pk))
+
+        # Mutation envoyée sur la même socket
+        await client.send_json({
+            'id': 'add', 'type': 'subscribe',
+            'payload': {
+                'query': 'mutation($id: Int!) { addToCart(input: {productId: $id, quantity: 2}) { cart { id } } }',
+                'variables': {'id': self.product.pk},
+            }
+        })
+        messages = {}
+        while len(messages) < 3:
+            message = await client.receive_json()
+            messages[(message['id'], message['type'])] = message.get('payload')
+        self.assertIn(('add', 'complete'), messages)
+        self.assertIn('id', messages[('add', 'next')]['data']['addToCart']['cart'])
+        cart = messages[('cart', 'next')]['data']['cartChanged']
+        self.assertEqual(cart['items'], [{'quantity': 2}])
+        self.assertEqual(Decimal(cart['total']), Decimal('30'))
+        await client.disconnect()
+
+    async def test_revoked_token_ends_subscription(self):
+        """Test qu'un jeton révoqué après connection_init ferme la socket au prochain événement"""
+        client = await self.connect(self.user)
+        await client.send_json({
+            'id': '1', 'type': 'subscribe', 'payload': {'query': 'subscription { orderStatusChanged { id } }'}
+        })
+        await self.wait_for_subscriber(subscriptions.user_orders_channel(self.user.pk))
+
+        order = await Order.objects.aget(pk=self.order.pk)
+        with mock.patch('api.revocation.is_revoked', return_value=True):
+            await self.set_status(order, 'paid')
+            message = await client.receive()
+        self.assertEqual((message['type'], message['code']), ('websocket.close', 4401))
+        await client.disconnect()
+
+    async def test_expired_token_closes_socket(self):
+        token = AccessToken.for_user(self.user)
+        token.set_exp(lifetime=datetime.timedelta(seconds=1))
+        client = await self.connect(self.user, token)
+        message = await client.receive()
+        self.assertEqual((message['type'], message['code'], message['reason']), ('websocket.close', 4401, 'Token expired'))
+        await client.disconnect()
+
+    async def test_anonymous_subscription_refused(self):
+        client = await self.connect()
+        await client.send_json({
+            'id': '1', 'type': 'subscribe', 'payload': {'query': 'subscription { cartChanged { id } }'}
+        })
+        message = await client.receive_json()
+        self.assertEqual((message['id'], message['type']), ('1', 'error'))
+        self.assertIn('permission', message['payload'][0]['message'])
+        await client.disconnect()
+
+    async def test_protocol_errors(self):
+        client = WebSocketTestClient()
+        await client.connect()
+        await client.send_json({'id': '1', 'type': 'subscribe', 'payload': {'query': '{ allProducts { totalCount } }'}})
+        self.assertEqual((await client.receive())['code'], 4401)
+        await client.disconnect()
+
+        client = WebSocketTestClient()
+        await client.connect()
+        await client.send_json({'type': 'connection_init', 'payload': {'authorization': 'Bearer invalide'}})
+        self.assertEqual((await client.receive())['code'], 4403)
+        await client.disconnect()
+
+        client = WebSocketTestClient(subprotocols=())
+        self.assertEqual((await client.connect())['type'], 'websocket.close')
+
+
+class ProductConditionalGetTests(TestCase):
+    """ETag faibles, 304 et Cache-Control sur les lectures du catalogue"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = MobileUser.objects.create_user(username='etaguser', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.products = [
+            Product.objects.create(name=f'Etag Product {i}', price=10, stock=5, is_ai_generated=True)
+            for i in range(3)
+        ]
+        self.cart = Cart.objects.create(user=self.user)
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_not_modified(self):
+        product = self.products[0]
+        for url in (
+            '/api/v1/products/?page_size=2',
+            f'/api/v1/products/{product.id}/',
+            f'/api/v1/products/{product.id}/reviews/',
+            '/api/v1/products/ai_generated/',
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            self.assertTrue(etag.startswith('W/"'))
+            self.assertIn('no-cache', response['Cache-Control'])
+            # Une seule requête étroite, sans avis ni sérialisation
+            with self.assertNumQueries(1):
+                response = self.revalidate(url, etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response.content, b'')
+
+    def test_etag_without_extra_queries(self):
+        """Test que le calcul de l'ETag d'une réponse complète n'ajoute aucune requête"""
+        product = self.products[0]
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/v1/products/{product.id}/')
+        self.assertIn('ETag', response)
+
+    def test_stock_and_reservations_change_etag(self):
+        url = '/api/v1/products/'
+        etag = self.client.get(url)['ETag']
+        reservations.hold(self.cart, {self.products[0].id: 2})
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][-1]['available_stock'], 3)
+
+        etag = response['ETag']
+        Product.objects.take_stock({self.products[1].id: 1})
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_page_etag_is_per_page(self):
+        """Test qu'un produit modifié n'invalide que la page qui le contient"""
+        first_page = self.client.get('/api/v1/products/?page_size=1')
+        second_url = first_page.data['next']
+        second_etag = self.client.get(second_url)['ETag']
+        newest = self.products[-1]
+        newest.price = 12
+        newest.save()
+        self.assertEqual(self.revalidate('/api/v1/products/?page_size=1', first_page['ETag']).status_code, 200)
+        self.assertEqual(self.revalidate(second_url, second_etag).status_code, 304)
+
+    def test_review_changes_etag(self):
+        product = self.products[0]
+        url = f'/api/v1/products/{product.id}/reviews/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/v1/products/{product.id}/review/', {'rating': 4, 'comment': 'Bien'}, format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+
+    def test_username_change_changes_etag(self):
+        """Test que le renommage d'un auteur d'avis invalide les produits qui l'embarquent"""
+        product = self.products[0]
+        ProductReview.objects.create(product=product, user=self.user, rating=5, comment='Parfait')
+        url = f'/api/v1/products/{product.id}/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.username = 'renamed'
+            self.user.save()
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['reviews'][0]['user_username'], 'renamed')
+
+    def test_save_without_username_change_keeps_caches(self):
+        """Test qu'une sauvegarde complète sans renommage n'invalide rien"""
+        user = MobileUser.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.phone_number = '0600000000'
+            user.save()
+            self.user.is_verified = True
+            self.user.save()
+        self.assertEqual(callbacks, [])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.username = 'renamed'
+            user.save()
+            user.save()
+        self.assertEqual(len(callbacks), 2)
+
+    def test_catalog_version_survives_eviction(self):
+        url = f'/api/v1/products/{self.products[0].id}/'
+        etag = self.client.get(url)['ETag']
+        caches['default'].clear()
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_unknown_product(self):
+        response = self.revalidate('/api/v1/products/999999/', 'W/"product-1-1:1"')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
+class ProductRepresentationCacheTests(TestCase):
+    """Cache des représentations sérialisées des produits dans les listes"""
+
+    url = '/api/v1/products/'
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = MobileUser.objects.create_user(username='reprcacheuser', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.products = [
+            Product.objects.create(name=f'Repr Product {i}', price=10, stock=5, is_ai_generated=True)
+            for i in range(3)
+        ]
+        ProductReview.objects.create(product=self.products[0], user=self.user, rating=5, comment='Parfait')
+
+    def test_warm_list_skips_reviews_and_serialization(self):
+        cold = self.client.get(self.url)
+        with mock.patch.object(ProductSerializer, 'to_representation') as to_representation:
+            with self.assertNumQueries(1):
+                warm = self.client.get(self.url)
+        to_representation.assert_not_called()
+        self.assertEqual(warm.data['results'], cold.data['results'])
+        self.assertEqual(warm.data['results'][-1]['reviews'][0]['comment'], 'Parfait')
+
+    def test_review_invalidates_product(self):
+        product = self.products[0]
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductReview.objects.filter(product=product).update(comment='Modifié')
+            review = ProductReview.objects.get(product=product)
+            review.save()
+        results = self.client.get(self.url).data['results']
+        self.assertEqual(results[-1]['reviews'][0]['comment'], 'Modifié')
+        self.assertEqual(product_cache.get_metrics()['misses'], 4)
+
+    def test_product_save_and_stock_update_invalidate(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.products[1].pk).update(name='Renommé')
+            Product.objects.get(pk=self.products[1].pk).save(update_fields=['name'])
+        Product.objects.take_stock({self.products[2].id: 2})
+        results = {product['id']: product for product in self.client.get(self.url).data['results']}
+        self.assertEqual(results[self.products[1].id]['name'], 'Renommé')
+        self.assertEqual(results[self.products[2].id]['stock'], 3)
+
+    def test_variants_are_cached_separately(self):
+        self.client.get(self.url)
+        response = self.client.get(f'{self.url}?reviews_limit=0')
+        self.assertEqual(response.data['results'][-1]['reviews'], [])
+        self.assertEqual(len(self.client.get(self.url).data['results'][-1]['reviews']), 1)
+
+    def test_metrics(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        response = self.client.get('/api/v1/products/representation-metrics/')
+        self.assertEqual(response.status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/v1/products/representation-metrics/')
+        self.assertEqual(response.data, {'hits': 3, 'misses': 3, 'hit_ratio': 0.5})
+
+    @override_settings(PRODUCT_REPRESENTATION_CACHE=None)
+    def test_disabled(self):
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+
+class CartCheckoutTests(TestCase):
+    """La validation du panier est atomique et son nombre de requêtes ne dépend pas de sa taille"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(username='buyer', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, size, stock=10, quantity=2):
+        products = Product.objects.bulk_create([
+            Product(name=f'Produit {i}', price=5 + i, stock=stock) for i in range(size)
+        ])
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=product, quantity=quantity) for product in products
+        ])
+        return products
+
+    def checkout(self):
+        return self.client.post(f'/api/v1/carts/{self.cart.id}/checkout/')
+
+    def test_checkout_creates_order(self):
+        """Test la création de la commande et de ses lignes, la mise à jour du stock et le panier vidé"""
+        products = self.fill_cart(3)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 200)
+        lines = response.data['order']['lines']
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0]['product_name'], 'Produit 0')
+        self.assertEqual(Decimal(response.data['order']['total_price']), Decimal('36.00'))
+        self.assertFalse(self.cart.items.exists())
+        order = Order.objects.get()
+        self.assertEqual(order.total_price, sum(product.price * 2 for product in products))
+        for product in products:
+            product.refresh_from_db()
+            self.assertEqual(product.stock, 8)
+            self.assertEqual(order.lines.get(product=product).unit_price, product.price)
+
+    def test_constant_query_count(self):
+        """Test que le nombre de requêtes est le même pour 1 et 20 articles"""
+        self.fill_cart(1)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.checkout().status_code, 200)
+        self.fill_cart(20)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.checkout().status_code, 200)
+        self.assertEqual(len(small), len(large))
+
+    def test_insufficient_stock_rolls_back(self):
+        """Test qu'un produit en rupture annule toute la commande"""
+        products = self.fill_cart(2)
+        Product.objects.filter(pk=products[1].pk).update(stock=1)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Stock insuffisant pour Produit 1')
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+        products[0].refresh_from_db()
+        self.assertEqual(products[0].stock, 10)
+
+    def test_empty_cart(self):
+        """Test la validation d'un panier vide"""
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class CartCheckoutConcurrencyTests(TransactionTestCase):
+    """Des validations concurrentes ne peuvent pas survendre un produit"""
+
+    def test_no_oversell(self):
+        product = Product.objects.create(name='Édition limitée', price=50, stock=3)
+        carts = []
+        for i in range(8):
+            user = MobileUser.objects.create_user(username=f'concurrent{i}', password='testpass123')
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+            carts.append(cart)
+
+        barrier = threading.Barrier(len(carts))
+        outcomes = []
+
+        def buy(cart):
+            barrier.wait()
+            try:
+                cart.checkout()
+                outcomes.append('ok')
+            except InsufficientStockError:
+                outcomes.append('insufficient')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(outcomes.count('ok'), 3)
+        self.assertEqual(OrderLine.objects.filter(product=product).count(), 3)
+
+
+class OrderHistoryTests(TestCase):
+    """Commandes multi-lignes : création, historique en une requête préchargée"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(username='historian', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.products = [
+            Product.objects.create(name=f'Article {i}', price=10 + i, stock=50) for i in range(3)
+        ]
+
+    def test_create_order_with_lines(self):
+        """Test la création d'une commande de plusieurs produits"""
+        response = self.client.post('/api/v1/orders/', {
+            'lines': [
+                {'product': self.products[0].id, 'quantity': 2},
+                {'product': self.products[2].id, 'quantity': 1},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.data['total_price']), Decimal('32.00'))
+        self.assertEqual([line['subtotal'] for line in response.data['lines']], ['20.00', '12.00'])
+
+        response = self.client.post('/api/v1/orders/', {'lines': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_update_ignores_lines(self):
+        """Test qu'un PUT ou PATCH avec des lignes ne les modifie pas (ni erreur serveur)"""
+        response = self.client.post('/api/v1/orders/', {
+            'lines': [{'product': self.products[0].id, 'quantity': 2}]
+        }, format='json')
+        url = f"/api/v1/orders/{response.data['id']}/"
+        lines = [{'product': self.products[1].id, 'quantity': 5}]
+        for method in (self.client.put, self.client.patch):
+            response = method(url, {'lines': lines}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [(line['product'], line['quantity']) for line in response.data['lines']],
+                [(self.products[0].id, 2)]
+            )
+        self.products[1].refresh_from_db()
+        self.assertEqual(self.products[1].stock, 50)
+
+    def test_history_query_count(self):
+        """Test que l'historique ne dépend pas du nombre de commandes ni de lignes"""
+        for size in (1, 3, 3):
+            order = Order.objects.create(user=self.user)
+            OrderLine.objects.bulk_create([
+                OrderLine(order=order, product=product, quantity=1, unit_price=product.price)
+                for product in self.products[:size]
+            ])
+        Order.objects.update_totals()
+        # commandes + lignes préchargées avec leurs produits
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/orders/')
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(
+            sorted(Decimal(order['total_price']) for order in response.data),
+            [Decimal('10.00'), Decimal('33.00'), Decimal('33.00')]
+        )
+
+    def test_active_order_blocks_product_deletion(self):
+        """Test qu'un produit d'une commande en cours ne peut pas être supprimé"""
+        admin = MobileUser.objects.create_user(username='orderadmin', password='testpass123', is_staff=True)
+        self.client.force_authenticate(user=admin)
+        order = Order.objects.create(user=self.user)
+        OrderLine.objects.create(order=order, product=self.products[0], quantity=1, unit_price=10)
+        response = self.client.delete(f'/api/v1/products/{self.products[0].id}/')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Product.objects.filter(pk=self.products[0].pk).exists())
+
+
+    def test_insufficient_stock_conflict(self):
+        """Test qu'une commande sans stock suffisant renvoie 409 sans rien écrire"""
+        self.products[1].stock = 1
+        self.products[1].save(update_fields=['stock'])
+        response = self.client.post('/api/v1/orders/', {
+            'lines': [
+                {'product': self.products[0].id, 'quantity': 2},
+                {'product': self.products[1].id, 'quantity': 2},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('error', response.data)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(
+            list(Product.objects.filter(pk__in=[p.pk for p in self.products[:2]]).order_by('pk').values_list('stock', flat=True)),
+            [50, 1]
+        )
+
+    def test_order_decrements_stock_and_respects_holds(self):
+        """Test que la commande directe décrémente le stock sans entamer les réservations"""
+        cart = Cart.objects.create(user=MobileUser.objects.create_user(username='holder', password='testpass123'))
+        reservations.hold(cart, {self.products[0].id: 45})
+        response = self.client.post('/api/v1/orders/', {
+            'lines': [
+                {'product': self.products[0].id, 'quantity': 3},
+                {'product': self.products[0].id, 'quantity': 2},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/v1/orders/', {
+            'lines': [{'product': self.products[0].id, 'quantity': 1}]
+        }, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.products[0].refresh_from_db()
+        self.assertEqual((self.products[0].stock, self.products[0].reserved_stock), (45, 45))
+
+
+# Les processus enfants ne partagent pas une base SQLite en mémoire
+@skipUnlessDBFeature('has_select_for_update')
+class OrderConcurrencyTests(TransactionTestCase):
+    """Des commandes concurrentes depuis plusieurs processus ne perdent aucune décrémentation"""
+
+    def test_hammer_orders(self):
+        out = StringIO()
+        call_command('hammer_orders', orders=500, processes=8, stock=250, stdout=out)
+        self.assertIn('créées=250 refusées=250 erreurs=0', out.getvalue())
+        self.assertFalse(Product.objects.filter(name__startswith='hammer-').exists())
+
+class CartSnapshotQueryTests(TestCase):
+    """Les réponses des mutations du panier calculent sous-totaux et total en SQL"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(username='shopper', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Article {i}', price=Decimal('2.50') + i, stock=100) for i in range(12)
+        ])
+
+    def fill_cart(self, size):
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=product, quantity=2) for product in self.products[:size]
+        ])
+
+    def count_queries(self, action, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/api/v1/carts/{self.cart.id}/{action}/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_add_item_fixed_queries(self):
+        """Test que add_item coûte autant de requêtes pour 1 ou 10 articles"""
+        self.fill_cart(1)
+        small, _ = self.count_queries('add_item', {'product': self.products[11].id, 'quantity': 1})
+        CartItem.objects.all().delete()
+        reservations.release_cart(self.cart)
+        self.fill_cart(10)
+        large, response = self.count_queries('add_item', {'product': self.products[11].id, 'quantity': 1})
+        self.assertEqual(small, large)
+        expected = sum(product.price * 2 for product in self.products[:10]) + self.products[11].price
+        self.assertEqual(Decimal(response.data['cart']['total']), expected)
+        self.assertEqual(len(response.data['cart']['items']), 11)
+        self.assertTrue(response.data['has_items'])
+
+    def test_update_and_remove_fixed_queries(self):
+        """Test que update_item et remove_item ne dépendent pas de la taille du panier"""
+        counts = []
+        for size in (1, 10):
+            CartItem.objects.all().delete()
+            self.fill_cart(size)
+            item = self.cart.items.order_by('id').first()
+            update, response = self.count_queries('update_item', {'item': item.id, 'quantity': 3})
+            self.assertEqual(response.data['cart']['items'][0]['subtotal'], '7.50')
+            remove, response = self.count_queries('remove_item', {'item': item.id})
+            self.assertEqual(response.data['is_empty'], size == 1)
+            counts.append((update, remove))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_empty_cart_total(self):
+        """Test le total d'un panier vide"""
+        response = self.client.get(f'/api/v1/carts/{self.cart.id}/')
+        self.assertEqual(response.data['total'], '0.00')
+        self.fill_cart(3)
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/v1/carts/{self.cart.id}/')
+        self.assertEqual(response.data['total'], '21.00')
+
+
+@override_settings(CART_STORE='redis')
+class RedisCartStoreTests(TestCase):
+    """Paniers en Redis avec écriture différée en base (nécessite un serveur Redis)"""
+
+    @classmethod
+    def setUpClass(cls):
+        from .redis_client import redis_available
+        if not redis_available():
+            raise unittest.SkipTest("Serveur Redis indisponible")
+        super().setUpClass()
+
+    def setUp(self):
+        from .cart_store import RedisCartStore, DIRTY_KEY
+        self.user = MobileUser.objects.create_user(username='rediscart', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = [
+            Product.objects.create(name=f'Article {i}', price=10 + i, stock=20) for i in range(3)
+        ]
+        self.store = RedisCartStore()
+        self.store.client.delete(self.store.key(self.cart.id))
+        self.store.client.srem(DIRTY_KEY, self.cart.id)
+        self.addCleanup(self.store.client.delete, self.store.key(self.cart.id))
+        self.addCleanup(self.store.client.srem, DIRTY_KEY, self.cart.id)
+
+    def post(self, action, data):
+        return self.client.post(f'/api/v1/carts/{self.cart.id}/{action}/', data, format='json')
+
+    def test_mutations_skip_cart_items(self):
+        """Test que les mutations n'écrivent pas CartItem avant la persistance différée"""
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        response = self.post('add_item', {'product': self.products[1].id, 'quantity': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.data['cart']['total']), Decimal('32.00'))
+        # Le panier existant a été chargé depuis la base au premier accès
+        self.assertEqual(len(response.data['cart']['items']), 2)
+        self.assertEqual(CartItem.objects.count(), 1)
+
+        # Sous Redis, l'identifiant d'article est celui du produit
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post('update_item', {'item': self.products[1].id, 'quantity': 5})
+        # Seule la réservation de stock est écrite en base, pas le panier
+        self.assertFalse([query for query in queries if 'api_cartitem' in query['sql']])
+        self.assertEqual(response.data['cart']['items'][1]['quantity'], 5)
+        response = self.post('remove_item', {'item': self.products[0].id})
+        self.assertEqual(len(response.data['cart']['items']), 1)
+        self.assertEqual(self.post('remove_item', {'item': self.products[2].id}).status_code, 404)
+
+        from .tasks import flush_cart_store
+        self.assertEqual(flush_cart_store(), 1)
+        self.assertEqual(
+            list(CartItem.objects.values_list('product_id', 'quantity')),
+            [(self.products[1].id, 5)]
+        )
+
+    def test_batch(self):
+        """Test un lot d'opérations appliqué dans Redis puis persisté"""
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        response = self.client.post(f'/api/v1/carts/{self.cart.id}/batch/', {'operations': [
+            {'op': 'remove', 'item': self.products[0].id},
+            {'op': 'add', 'product': self.products[1].id, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['cart']['items']], [self.products[1].id])
+        self.assertEqual(CartItem.objects.get().product, self.products[0])
+        self.store.flush()
+        self.assertEqual(CartItem.objects.get().product, self.products[1])
+
+    def test_checkout_persists_pending_changes(self):
+        """Test que la validation écrit d'abord les modifications en attente"""
+        self.post('add_item', {'product': self.products[2].id, 'quantity': 3})
+        response = self.post('checkout', {})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.data['order']['total_price']), Decimal('36.00'))
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(self.client.get(f'/api/v1/carts/{self.cart.id}/').data['items'], [])
+
+    def test_graphql_reads_and_writes_store(self):
+        """Test que GraphQL lit et écrit le panier dans Redis, comme les vues REST"""
+        from django.test import RequestFactory
+        from .schema import schema
+        request = RequestFactory().post('/graphql/')
+        request.user = self.user
+        self.post('add_item', {'product': self.products[0].id, 'quantity': 1})
+        result = schema.execute(
+            'mutation($id: Int!) { addToCart(input: {productId: $id, quantity: 2}) '
+            '{ cart { total items { id quantity subtotal product { name } } } } }',
+            variable_values={'id': self.products[1].id}, context_value=request
+        )
+        self.assertIsNone(result.errors)
+        cart = result.data['addToCart']['cart']
+        self.assertEqual(Decimal(cart['total']), Decimal('32.00'))
+        self.assertEqual(
+            [(item['id'], item['quantity'], item['product']['name']) for item in cart['items']],
+            [(str(self.products[0].id), 1, 'Article 0'), (str(self.products[1].id), 2, 'Article 1')]
+        )
+        self.assertFalse(CartItem.objects.exists())
+
+        # L'écriture GraphQL survit à la persistance différée
+        self.store.flush()
+        self.assertEqual(
+            sorted(CartItem.objects.values_list('product_id', 'quantity')),
+            [(self.products[0].id, 1), (self.products[1].id, 2)]
+        )
+        result = schema.execute('{ cart { total } }', context_value=request)
+        self.assertEqual(Decimal(result.data['cart']['total']), Decimal('32.00'))
+
+
+class CartBatchTests(TestCase):
+    """Plusieurs modifications du panier en un seul aller-retour"""
+
+    def setUp(self):
+        self.user = MobileUser.objects.create_user(username='batcher', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Article {i}', price=10 + i, stock=5) for i in range(12)
+        ])
+
+    def batch(self, operations):
+        return self.client.post(
+            f'/api/v1/carts/{self.cart.id}/batch/', {'operations': operations}, format='json'
+        )
+
+    def test_apply_operations(self):
+        """Test l'application ordonnée d'ajouts, modifications et suppressions"""
+        kept = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        removed = CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=1)
+        response = self.batch([
+            {'op': 'add', 'product': self.products[2].id, 'quantity': 2},
+            {'op': 'add', 'product': self.products[2].id},
+            {'op': 'update', 'item': kept.id, 'quantity': 4},
+            {'op': 'remove', 'item': removed.id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['product'], item['quantity']) for item in response.data['cart']['items']],
+            [(self.products[0].id, 4), (self.products[2].id, 3)]
+        )
+        self.assertEqual(Decimal(response.data['cart']['total']), Decimal('76.00'))
+        self.assertFalse(response.data['is_empty'])
+
+    def test_failed_operation_changes_nothing(self):
+        """Test qu'une opération en échec annule tout le lot"""
+        item = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        response = self.batch([
+            {'op': 'remove', 'item': item.id},
+            {'op': 'add', 'product': self.products[1].id, 'quantity': 6},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['operation'], 1)
+        self.assertEqual(response.data['error'], 'Stock insuffisant pour Article 1')
+        self.assertEqual(list(self.cart.items.values_list('id', flat=True)), [item.id])
+
+        response = self.batch([{'op': 'update', 'item': 999999, 'quantity': 2}])
+        self.assertEqual(response.status_code, 404)
+        response = self.batch([{'op': 'add', 'product': 999999}])
+        self.assertEqual(response.status_code, 404)
+        response = self.batch([{'op': 'update', 'quantity': 2}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_fixed_queries(self):
+        """Test qu'un lot de 10 opérations coûte autant de requêtes qu'un lot de 2"""
+        counts = []
+        for size in (2, 10):
+            CartItem.objects.all().delete()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.batch([
+                    {'op': 'add', 'product': product.id} for product in self.products[:size]
+                ])
+            self.assertEqual(len(response.data['cart']['items']), size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class StockReservationTests(TestCase):
+    """Réservations de stock posées par le panier, libérées à l'expiration ou consommées à la validation"""
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Console', price=300, stock=5)
+        self.carts = []
+        self.clients = []
+        for i in range(2):
+            user = MobileUser.objects.create_user(username=f'holder{i}', password='testpass123')
+            client = APIClient()
+            client.force_authenticate(user=user)
+            self.carts.append(Cart.objects.create(user=user))
+            self.clients.append(client)
+
+    def add(self, index, quantity):
+        return self.clients[index].post(
+            f'/api/v1/carts/{self.carts[index].id}/add_item/',
+            {'product': self.product.id, 'quantity': quantity}, format='json'
+        )
+
+    def add_graphql(self, index, quantity):
+        from django.test import RequestFactory
+        from .schema import schema
+        request = RequestFactory().post('/graphql/')
+        request.user = self.carts[index].user
+        return schema.execute(
+            'mutation($id: Int!, $q: Int!) { addToCart(input: {productId: $id, quantity: $q}) { cart { id } } }',
+            variable_values={'id': self.product.id, 'q': quantity}, context_value=request
+        )
+
+    def test_graphql_add_to_cart_holds_stock(self):
+        """Test que la mutation addToCart réserve le stock comme add_item"""
+        self.assertEqual(self.add(0, 5).status_code, 200)
+        result = self.add_graphql(1, 3)
+        self.assertEqual(result.errors[0].message, 'Insufficient stock')
+        self.assertFalse(self.carts[1].items.exists())
+
+        self.clients[0].post(
+            f'/api/v1/carts/{self.carts[0].id}/update_item/',
+            {'item': self.carts[0].items.get().id, 'quantity': 2}, format='json'
+        )
+        self.assertIsNone(self.add_graphql(1, 3).errors)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.reserved_stock, self.product.available_stock), (5, 0))
+        self.assertEqual(StockReservation.objects.get(cart=self.carts[1]).quantity, 3)
+
+    def test_add_item_rejects_non_positive_quantity(self):
+        """Test qu'une quantité nulle, négative ou invalide ne touche pas aux réservations"""
+        self.add(0, 2)
+        for quantity in (0, -1, 'abc'):
+            self.assertEqual(self.add(0, quantity).status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_stock, 2)
+        self.assertEqual(self.carts[0].items.get().quantity, 2)
+
+    def test_update_and_remove_item(self):
+        """Test la validation de la quantité et le verrou du panier de update_item et remove_item"""
+        self.add(0, 2)
+        url = f'/api/v1/carts/{self.carts[0].id}'
+        item = self.carts[0].items.get()
+        response = self.clients[0].post(f'{url}/update_item/', {'item': item.id, 'quantity': 'abc'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        with mock.patch('api.reservations.lock_cart', wraps=reservations.lock_cart) as lock_cart:
+            self.clients[0].post(f'{url}/update_item/', {'item': item.id, 'quantity': 4}, format='json')
+            self.product.refresh_from_db()
+            self.assertEqual(self.product.reserved_stock, 4)
+            self.clients[0].post(f'{url}/remove_item/', {'item': item.id}, format='json')
+        # Verrou pris par chaque action avant de lire l'article, puis repris par hold/release
+        self.assertEqual(lock_cart.call_count, 4)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_stock, 0)
+        self.assertFalse(self.carts[0].items.exists())
+
+    def test_add_item_holds_stock(self):
+        """Test que le stock réservé par un panier n'est plus disponible pour les autres"""
+        self.assertEqual(self.add(0, 3).status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.reserved_stock, self.product.available_stock), (3, 2))
+        self.assertEqual(self.add(1, 3).status_code, 400)
+        self.assertEqual(self.add(1, 2).status_code, 200)
+
+        item = self.carts[0].items.get()
+        self.clients[0].post(
+            f'/api/v1/carts/{self.carts[0].id}/update_item/', {'item': item.id, 'quantity': 1}, format='json'
+        )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_stock, 3)
+        self.clients[0].post(f'/api/v1/carts/{self.carts[0].id}/remove_item/', {'item': item.id}, format='json')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_stock, 2)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_reap_expired(self):
+        """Test la libération par lots des réservations expirées"""
+        from .tasks import reap_expired_reservations
+        self.add(0, 2)
+        self.add(1, 3)
+        StockReservation.objects.filter(cart=self.carts[0]).update(expires_at=timezone.now())
+        with override_settings(STOCK_REAP_BATCH=1):
+            self.assertEqual(reap_expired_reservations(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_stock, 3)
+        # L'article reste dans le panier, il est revérifié à la validation
+        self.assertEqual(self.carts[0].items.count(), 1)
+
+    def test_checkout_consumes_holds(self):
+        """Test que la validation consomme les réservations du panier"""
+        self.add(0, 2)
+        self.add(1, 3)
+        response = self.clients[0].post(f'/api/v1/carts/{self.carts[0].id}/checkout/')
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved_stock), (3, 3))
+        self.assertFalse(StockReservation.objects.filter(cart=self.carts[0]).exists())
+
+    def test_checkout_after_expiry_respects_other_holds(self):
+        """Test qu'une réservation expirée ne permet pas de prendre le stock réservé par un autre panier"""
+        self.add(0, 2)
+        reservations.release_cart(self.carts[0])
+        self.add(1, 4)
+        response = self.clients[0].post(f'/api/v1/carts/{self.carts[0].id}/checkout/')
+        self.assertEqual(response.status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved_stock), (5, 4))
+
+    def test_cart_deletion_releases_holds(self):
+        """Test que la suppression d'un utilisateur libère les réservations de son panier"""
+        self.add(0, 2)
+        self.carts[0].user.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_stock, 0)
@@ -3,7 +3,7 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     MobileUserViewSet, UserLoginView, UserRegisterView,
     DeviceTokenViewSet, GestureDataViewSet, ProductViewSet,
-    CartViewSet, OrderViewSet, upload_product_image
+    CartViewSet, OrderViewSet, upload_product_image, async_login, UserLogoutView
 )
 from django.conf import settings
 from django.conf.urls.static import static
@@ -20,8 +20,14 @@ router.register(r'orders', OrderViewSet, basename='order')
 # Define custom URL patterns
 custom_urlpatterns = [
     path('v1/products/upload_image/', upload_product_image, name='product-image-upload'),
-    path('v1/users/login/', UserLoginView.as_view(), name='user-login'),
+    # Sous ASGI, la connexion asynchrone ne bloque pas la boucle pendant le hachage
+    path(
+        'v1/users/login/',
+        async_login if getattr(settings, 'ASYNC_LOGIN', False) else UserLoginView.as_view(),
+        name='user-login'
+    ),
     path('v1/users/register/', UserRegisterView.as_view(), name='user-register'),
+    path('v1/users/logout/', UserLogoutView.as_view(), name='user-logout'),
 ]
 
 # Combine URL patterns, ensuring custom patterns take precedence
@@ -3,30 +3,50 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action, api_view, parser_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth import authenticate
-from .models import MobileUser, DeviceToken, GestureData, Product, Order, Cart, CartItem, ProductReview
+from rest_framework_simplejwt.exceptions import TokenError
+from redis.exceptions import RedisError
+from django.contrib.auth import aauthenticate, authenticate
+from .models import (
+    MobileUser, DeviceToken, GestureData, Product, Order, Cart, CartItem, ProductReview,
+    InsufficientStockError
+)
 from .serializers import (
     MobileUserSerializer, DeviceTokenSerializer, GestureDataSerializer,
-    ProductSerializer, OrderSerializer, CartSerializer, CartItemSerializer,
+    ProductSerializer, OrderSerializer, CartSerializer, CartItemSerializer, CartBatchSerializer,
     ProductReviewSerializer
 )
-from .tasks import process_gesture_data, send_push_notification, generate_product_with_ai, demo_long_task
+from .pagination import (
+    ProductCursorPagination, ProductRatingCursorPagination, ProductSearchCursorPagination
+)
+from .search import search_products
+from .cart_store import get_cart_store
+from .login_tracking import get_login_tracker
+from . import ai_cache, http_cache, product_cache, reservations, revocation, subscriptions
+from .tasks import (
+    process_gesture_data, send_push_notification, generate_product_with_ai, demo_long_task,
+    build_search_prompt, ai_generation_enabled
+)
+from celery.result import AsyncResult
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from rest_framework.reverse import reverse
 from django.core.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from django.utils import timezone
-from django.db import models
+from django.db import models, transaction
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-import openai
 from django.conf import settings
-import json
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 import magic  # Pour la détection MIME
 import logging
 import os
 from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.http import Http404, JsonResponse
+from asgiref.sync import sync_to_async
+import json
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -59,11 +79,8 @@ class MobileUserViewSet(viewsets.ModelViewSet):
         
         if user:
             refresh = RefreshToken.for_user(user)
-            user.last_login_ip = request.META.get('REMOTE_ADDR')
-            user.save()
-            
-            # Créer un panier pour l'utilisateur s'il n'en a pas
-            Cart.objects.get_or_create(user=user)
+            # Panier créé à l'inscription ou à la première consultation (CartViewSet.list)
+            get_login_tracker().record(user, request.META.get('REMOTE_ADDR'))
             
             return Response({
                 'refresh': str(refresh),
@@ -123,32 +140,116 @@ class ProductViewSet(viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     parser_classes = [MultiPartParser, FormParser, JSONParser]
     permission_classes = [IsAuthenticated]
+    pagination_class = ProductCursorPagination
+    # Actions qui sérialisent un produit avec ses avis ; les listes ne préchargent
+    # que les avis des produits absents du cache (api/product_cache.py)
+    listing_actions = ('retrieve',)
+    # Actions qui acceptent une recherche plein texte
+    search_actions = ('list', 'search')
+    # Nombre d'avis embarqués par produit dans les listes (?reviews_limit=K)
+    default_reviews_limit = 5
+    max_reviews_limit = 50
+    # Attente maximale (secondes) du long-polling des générations IA
+    max_generation_wait = 10
     
     def get_serializer_context(self):
         """Add request to serializer context"""
         context = super().get_serializer_context()
         context['request'] = self.request
+        context['reviews_limit'] = self.get_reviews_limit()
         return context
+
+    def get_reviews_limit(self):
+        """Nombre K de derniers avis embarqués ; None embarque tous les avis (détail d'un produit)"""
+        try:
+            limit = int(self.request.query_params['reviews_limit'])
+        except (KeyError, ValueError):
+            return None if self.action == 'retrieve' else self.default_reviews_limit
+        return max(0, min(limit, self.max_reviews_limit))
+
+    def get_search_query(self):
+        """Recherche plein texte : ?search= sur la liste, ?query= sur l'action search"""
+        if self.action not in self.search_actions:
+            return ''
+        param = 'query' if self.action == 'search' else 'search'
+        return self.request.query_params.get(param, '').strip()
+
+    @property
+    def paginator(self):
+        """Keyset sur le rang de recherche, sur (rating_avg, id) pour le tri par note, sinon (created_at, id)"""
+        if not hasattr(self, '_paginator'):
+            if self.get_search_query():
+                self._paginator = ProductSearchCursorPagination()
+            elif self.request.query_params.get('ordering') == '-rating':
+                self._paginator = ProductRatingCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_paginated_list(self, queryset):
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
     def get_queryset(self):
         queryset = Product.objects.all()
-        search = self.request.query_params.get('search', None)
+        if self.action in self.listing_actions:
+            queryset = queryset.for_listing(reviews_limit=self.get_reviews_limit())
+
+        # Tri et filtre par note à partir des colonnes dénormalisées
+        min_rating = self.request.query_params.get('min_rating')
+        if min_rating or self.request.query_params.get('ordering') == '-rating':
+            queryset = queryset.with_rating_avg()
+        if min_rating:
+            try:
+                queryset = queryset.filter(rating_avg__gte=float(min_rating))
+            except ValueError:
+                pass
+
+        search = self.get_search_query()
         
         if search:
             # First try to find existing products
-            queryset = queryset.filter(name__icontains=search)
+            queryset = search_products(queryset, search)
             
-            # If no products found, generate one with AI
-            if not queryset.exists():
-                result = generate_product_with_ai.delay(search)
-                product_data = result.get(timeout=30)  # Wait for AI generation
-                
-                if product_data:
-                    # Return the newly created product
-                    return Product.objects.filter(id=product_data['id'])
         
         return queryset
 
+    def get_conditional_list(self, queryset, build):
+        """Page de produits servie en 304 si ses produits n'ont pas changé (api/http_cache.py)"""
+        def current_etag(version):
+            page = self.paginate_queryset(queryset.prefetch_related(None).only('updated_at'))
+            return http_cache.page_etag(version, page, self.paginator.has_next)
+
+        def build_with_etag(version):
+            response = build()
+            if response.status_code != 200:
+                return response, None
+            return response, http_cache.page_etag(version, self.paginator.page, self.paginator.has_next)
+
+        return http_cache.conditional_response(self.request, current_etag, build_with_etag)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        def build():
+            # If no products found, generate one with AI (without blocking the worker)
+            search = self.get_search_query()
+            if search and not queryset.exists():
+                return self.search_miss_response(search)
+            return self.get_paginated_list(queryset)
+
+        return self.get_conditional_list(queryset, build)
+
+    def retrieve(self, request, *args, **kwargs):
+        def build(version):
+            instance = self.get_object()
+            return Response(self.get_serializer(instance).data), http_cache.product_etag(version, instance)
+
+        return http_cache.conditional_response(
+            request, lambda version: http_cache.current_product_etag(version, kwargs['pk']), build
+        )
+
     def update(self, request, *args, **kwargs):
         """Handle both product data and image updates"""
         instance = self.get_object()
@@ -217,7 +318,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             print(f"Attempting to delete product {instance.id}: {instance.name}")
             
             # Get all orders for this product
-            orders = instance.orders.all()
+            orders = Order.objects.filter(lines__product=instance).distinct()
             if orders.exists():
                 order_details = [
                     f"Order #{order.id} (Status: {order.status})"
@@ -226,7 +327,7 @@ class ProductViewSet(viewsets.ModelViewSet):
                 print(f"Found orders for product: {', '.join(order_details)}")
                 
                 # Check for active orders
-                active_orders = orders.filter(status__in=['pending', 'paid', 'shipped'])
+                active_orders = orders.filter(status__in=Order.ACTIVE_STATUSES)
                 if active_orders.exists():
                     active_order_details = [
                         f"Order #{order.id} (Status: {order.status})"
@@ -285,24 +386,30 @@ class ProductViewSet(viewsets.ModelViewSet):
         
         serializer = ProductReviewSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(product=product, user=request.user)
+            with transaction.atomic():
+                review = serializer.save(product=product, user=request.user)
+                Product.objects.record_rating(product.id, review.rating)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=True, methods=['get'])
     def reviews(self, request, pk=None):
         """Get all reviews for a product"""
-        product = self.get_object()
-        reviews = product.reviews.all()
-        serializer = ProductReviewSerializer(reviews, many=True)
-        return Response(serializer.data)
+        def build(version):
+            product = self.get_object()
+            reviews = product.reviews.all()
+            serializer = ProductReviewSerializer(reviews, many=True)
+            return Response(serializer.data), http_cache.product_etag(version, product, prefix='reviews')
+
+        return http_cache.conditional_response(
+            request, lambda version: http_cache.current_product_etag(version, pk, prefix='reviews'), build
+        )
     
     @action(detail=False, methods=['get'])
     def ai_generated(self, request):
         """Get all AI-generated products"""
-        products = Product.objects.filter(is_ai_generated=True)
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        products = self.get_queryset().filter(is_ai_generated=True)
+        return self.get_conditional_list(products, lambda: self.get_paginated_list(products))
     
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
@@ -315,92 +422,120 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
         
         product.is_ai_generated = False  # Convert to regular product
-        product.save()
+        product.save(update_fields=['is_ai_generated', 'updated_at'])
         
         serializer = self.get_serializer(product)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def search(self, request):
-        query = request.query_params.get('query', '')
+        query = self.get_search_query()
         if not query:
-            products = Product.objects.all()
-            serializer = self.get_serializer(products, many=True)
-            return Response(serializer.data)
+            return self.get_paginated_list(self.get_queryset())
 
-        # First, search existing products
-        products = Product.objects.filter(name__icontains=query)
+        # First, search existing products (full-text, ranked)
+        products = self.get_queryset()
         
-        # If no products found and we have an API key, generate one with AI
+        # If no products found, enqueue an AI generation instead of waiting for it
         if not products.exists():
-            if not settings.OPENAI_API_KEY or settings.OPENAI_API_KEY.startswith('sk-xxxxxxx'):
-                # If no API key, just return empty results
-                return Response(
-                    [],
-                    status=status.HTTP_200_OK
-                )
-
-            try:
-                # Initialize OpenAI client
-                client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-                
-                # Generate product details using GPT
-                prompt = f"""Generate a product based on this search: {query}
-                Format the response as JSON with these fields:
-                {{
-                    "name": "product name",
-                    "description": "detailed description",
-                    "price": decimal number between 10 and 1000,
-                    "stock": integer between 1 and 100
-                }}"""
-                
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "You are a helpful AI that generates product listings. Always return valid JSON."},
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                
-                # Parse the AI response
-                try:
-                    product_data = json.loads(response.choices[0].message.content)
-                except json.JSONDecodeError as e:
-                    print(f"JSON Parse Error: {str(e)}")
-                    print(f"Raw response: {response.choices[0].message.content}")
-                    return Response([], status=status.HTTP_200_OK)
-                
-                # Validate the required fields
-                required_fields = ['name', 'description', 'price', 'stock']
-                if not all(field in product_data for field in required_fields):
-                    print(f"Missing fields in response: {product_data}")
-                    return Response([], status=status.HTTP_200_OK)
-                
-                # Create the new product
-                product_data['is_ai_generated'] = True
-                product_data['ai_source'] = 'GPT-3.5'
-                
-                serializer = self.get_serializer(data=product_data)
-                if serializer.is_valid():
-                    product = serializer.save()
-                    return Response(serializer.data)
-                else:
-                    print(f"Serializer errors: {serializer.errors}")
-                    return Response([], status=status.HTTP_200_OK)
-                    
-            except Exception as e:
-                print(f"AI Generation Error: {str(e)}")
-                return Response([], status=status.HTTP_200_OK)
+            return self.search_miss_response(query)
         
         # Return the found products
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        return self.get_paginated_list(products)
+
+    def search_miss_response(self, query):
+        """
+        Répond immédiatement à une recherche sans résultat : met en file
+        generate_product_with_ai et renvoie un job que le client interroge sur
+        generation-jobs/<task_id>/.
+        """
+        if not ai_generation_enabled():
+            # If no API key, just return empty results
+            return Response({'next': None, 'results': []}, status=status.HTTP_200_OK)
+
+        # Produit déjà généré pour une recherche équivalente
+        cache_key = ai_cache.get_cache_key(query)
+        product_id = ai_cache.get_cached_product_id(cache_key)
+        if product_id:
+            products = Product.objects.for_listing(
+                reviews_limit=self.get_reviews_limit()
+            ).filter(id=product_id).annotate(search_rank=models.Value(0))
+            if products.exists():
+                ai_cache.increment('hits')
+                return self.get_paginated_list(products)
+            ai_cache.forget_product(cache_key)
+
+        # Une seule génération en vol par recherche normalisée
+        task_id, _ = ai_cache.get_or_start_generation(
+            cache_key,
+            lambda task_id: generate_product_with_ai.apply_async(
+                args=[build_search_prompt(query)],
+                kwargs={'cache_key': cache_key},
+                task_id=task_id
+            )
+        )
+        return Response({
+            'next': None,
+            'results': [],
+            'generation': self.get_generation_job(task_id),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    def get_generation_job(self, task_id):
+        return {
+            'task_id': task_id,
+            'status': 'pending',
+            'status_url': reverse('product-generation-job', kwargs={'task_id': task_id}, request=self.request),
+        }
 
     @action(detail=False, methods=['post'], url_path='generate-ai')
     def generate_ai_product(self, request):
         prompt = request.data.get("prompt", "Génère un produit e-commerce réaliste au format JSON.")
-        task = generate_product_with_ai.delay(prompt)
-        return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
+        task_id = str(uuid.uuid4())
+        ai_cache.record_job(task_id)
+        generate_product_with_ai.apply_async(args=[prompt], task_id=task_id)
+        return Response(self.get_generation_job(task_id), status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path='generation-metrics', permission_classes=[IsAdminUser])
+    def generation_metrics(self, request):
+        """Taux de hit du cache des générations IA et appels amont évités"""
+        return Response(ai_cache.get_metrics())
+
+    @action(detail=False, methods=['get'], url_path='representation-metrics', permission_classes=[IsAdminUser])
+    def representation_metrics(self, request):
+        """Taux de hit du cache des représentations sérialisées des produits"""
+        return Response(product_cache.get_metrics())
+
+    @action(detail=False, methods=['get'], url_path=r'generation-jobs/(?P<task_id>[^/.]+)')
+    def generation_job(self, request, task_id=None):
+        """
+        Statut d'un job de génération IA. ?wait=N attend jusqu'à N secondes
+        (borné par max_generation_wait) avant de répondre (long-polling). Seules les
+        tâches lancées par generate-ai ou une recherche sans résultat sont suivies.
+        """
+        if not ai_cache.is_generation_job(task_id):
+            raise Http404("No generation job matches the given query.")
+        result = AsyncResult(task_id)
+        try:
+            wait = min(float(request.query_params.get('wait', 0)), self.max_generation_wait)
+        except ValueError:
+            wait = 0
+        if wait > 0 and not result.ready():
+            try:
+                result.get(timeout=wait, propagate=False)
+            except CeleryTimeoutError:
+                pass
+
+        job = {'task_id': task_id, 'status': 'pending', 'product': None}
+        if result.successful():
+            # La tâche renvoie l'id du produit créé, ou None en cas d'échec
+            if isinstance(result.result, int) and not isinstance(result.result, bool):
+                product = get_object_or_404(Product.objects.for_listing(), id=result.result)
+                job.update(status='success', product=self.get_serializer(product).data)
+            else:
+                job['status'] = 'failed'
+        elif result.failed():
+            job['status'] = 'failed'
+        return Response(job)
 
 def get_mime_type(file_obj):
     """
@@ -480,19 +615,25 @@ def upload_product_image(request):
                 product = Product.objects.get(id=product_id)
                 logger.info(f"Mise à jour du produit existant {product_id}")
 
-                # Mise à jour des données du produit si fournies
+                # Mise à jour des données du produit si fournies ; seules les colonnes
+                # modifiées sont écrites
+                update_fields = ['image', 'updated_at']
                 if 'name' in request.data:
                     product.name = request.data['name']
+                    update_fields.append('name')
                 if 'description' in request.data:
                     product.description = request.data['description']
+                    update_fields.append('description')
                 if 'price' in request.data:
                     try:
                         product.price = float(request.data['price'])
+                        update_fields.append('price')
                     except (ValueError, TypeError):
                         pass
                 if 'stock' in request.data:
                     try:
                         product.stock = int(request.data['stock'])
+                        update_fields.append('stock')
                     except (ValueError, TypeError):
                         pass
 
@@ -505,7 +646,7 @@ def upload_product_image(request):
 
                 # Sauvegarder la nouvelle image
                 product.image = image_file
-                product.save()
+                product.save(update_fields=update_fields)
 
             except Product.DoesNotExist:
                 logger.warning(f"Produit non trouvé: {product_id}")
@@ -580,50 +721,72 @@ class CartViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        queryset = Cart.objects.filter(user=self.request.user)
+        if self.action == 'list' and not get_cart_store().write_behind:
+            queryset = queryset.with_items()
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        store = get_cart_store()
+        carts = list(self.get_queryset())
+        if not carts:
+            # Création paresseuse : les connexions ne créent plus de panier
+            Cart.objects.get_or_create(user=request.user)
+            carts = list(self.get_queryset())
+        if not store.write_behind:
+            return Response(self.get_serializer(carts, many=True).data)
+        return Response([store.snapshot(cart) for cart in carts])
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(get_cart_store().snapshot(self.get_object()))
 
     @action(detail=True, methods=['post'])
     def add_item(self, request, pk=None):
         cart = self.get_object()
+        store = get_cart_store()
         product_id = request.data.get('product')
-        quantity = int(request.data.get('quantity', 1))
+        try:
+            quantity = int(request.data.get('quantity', 1))
+        except (TypeError, ValueError):
+            quantity = 0
+        if quantity < 1:
+            return Response(
+                {'error': 'La quantité doit être positive.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         product = get_object_or_404(Product, id=product_id)
         
-        if product.stock < quantity:
+        try:
+            reservations.add_to_cart(cart, store, product, quantity)
+        except InsufficientStockError:
             return Response(
                 {'error': 'Stock insuffisant'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        subscriptions.publish_cart_changed(cart)
         
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
-        
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
-        
+        snapshot = store.snapshot(cart)
         return Response({
-            'cart': CartSerializer(cart).data,
-            'has_items': cart.items.exists()
+            'cart': snapshot,
+            'has_items': bool(snapshot['items'])
         })
 
     @action(detail=True, methods=['post'])
     def remove_item(self, request, pk=None):
         cart = self.get_object()
+        store = get_cart_store()
         item_id = request.data.get('item')
         
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
-        cart_item.delete()
+        reservations.remove_from_cart(cart, store, item_id)
+        subscriptions.publish_cart_changed(cart)
         
         # Check if cart is empty after deletion
-        is_empty = not cart.items.exists()
+        snapshot = store.snapshot(cart)
+        is_empty = not snapshot['items']
         
         return Response({
-            'cart': CartSerializer(cart).data,
+            'cart': snapshot,
             'is_empty': is_empty,
             'message': 'Cart is empty' if is_empty else None
         })
@@ -631,72 +794,133 @@ class CartViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def update_item(self, request, pk=None):
         cart = self.get_object()
+        store = get_cart_store()
         item_id = request.data.get('item')
-        quantity = int(request.data.get('quantity', 1))
-        
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
-        
-        if cart_item.product.stock < quantity:
+        try:
+            quantity = int(request.data.get('quantity', 1))
+        except (TypeError, ValueError):
             return Response(
-                {'error': 'Stock insuffisant'},
+                {'error': 'La quantité doit être un entier.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
         if quantity <= 0:
-            cart_item.delete()
-            is_empty = not cart.items.exists()
+            reservations.remove_from_cart(cart, store, item_id)
+            subscriptions.publish_cart_changed(cart)
+            snapshot = store.snapshot(cart)
+            is_empty = not snapshot['items']
             return Response({
-                'cart': CartSerializer(cart).data,
+                'cart': snapshot,
                 'is_empty': is_empty,
                 'message': 'Cart is empty' if is_empty else 'Item removed'
             })
         
-        cart_item.quantity = quantity
-        cart_item.save()
+        try:
+            reservations.set_cart_quantity(cart, store, item_id, quantity)
+        except InsufficientStockError:
+            return Response(
+                {'error': 'Stock insuffisant'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        subscriptions.publish_cart_changed(cart)
         
         return Response({
-            'cart': CartSerializer(cart).data,
+            'cart': store.snapshot(cart),
             'has_items': True
         })
 
+    @action(detail=True, methods=['post'])
+    def batch(self, request, pk=None):
+        """
+        Applique une liste d'opérations (add, update, remove) dans une transaction,
+        avec une seule requête de contrôle du stock, et renvoie un seul instantané.
+        Aucune opération n'est appliquée si l'une d'elles échoue.
+        """
+        cart = self.get_object()
+        store = get_cart_store()
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data['operations']
+
+        with transaction.atomic():
+            reservations.lock_cart(cart)
+            items = store.get_item_map(cart)
+            quantities = {}
+            for product_id, quantity in items.values():
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+            touched = {}
+            for index, operation in enumerate(operations):
+                if operation['op'] == 'add':
+                    product_id = operation['product']
+                    quantities[product_id] = quantities.get(product_id, 0) + operation['quantity']
+                else:
+                    if operation['item'] not in items:
+                        return Response(
+                            {'error': 'Article introuvable', 'operation': index},
+                            status=status.HTTP_404_NOT_FOUND
+                        )
+                    product_id = items[operation['item']][0]
+                    if operation['op'] == 'remove' or operation['quantity'] <= 0:
+                        quantities.pop(product_id, None)
+                    else:
+                        quantities[product_id] = operation['quantity']
+                touched[product_id] = index
+
+            existing = set(Product.objects.filter(pk__in=touched).values_list('pk', flat=True))
+            for product_id, index in touched.items():
+                if product_id not in existing:
+                    return Response(
+                        {'error': 'Produit introuvable', 'operation': index},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+
+            # Un seul UPDATE conditionnel réserve le stock de tous les produits modifiés
+            try:
+                reservations.hold(cart, {
+                    product_id: quantities.get(product_id, 0) for product_id in touched
+                })
+            except InsufficientStockError as e:
+                return Response(
+                    {'error': str(e), 'operation': touched[e.product.pk]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            store.replace_items(cart, quantities)
+            subscriptions.publish_cart_changed(cart)
+
+        snapshot = store.snapshot(cart)
+        return Response({
+            'cart': snapshot,
+            'is_empty': not snapshot['items']
+        })
+
     @action(detail=True, methods=['post'])
     def checkout(self, request, pk=None):
         cart = self.get_object()
-        
-        if not cart.items.exists():
+        store = get_cart_store()
+        # Les modifications encore en attente dans Redis sont écrites avant validation
+        store.persist(cart)
+
+        try:
+            order = cart.checkout()
+        except InsufficientStockError as e:
             return Response(
-                {'error': 'Le panier est vide'},
+                {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        # Create orders for each cart item
-        orders = []
-        for item in cart.items.all():
-            if item.product.stock < item.quantity:
-                return Response(
-                    {'error': f'Stock insuffisant pour {item.product.name}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            order = Order.objects.create(
-                user=request.user,
-                product=item.product,
-                quantity=item.quantity,
-                unit_price=item.product.price,
-                status='pending'
+
+        if order is None:
+            return Response(
+                {'error': 'Le panier est vide'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            orders.append(order)
-            
-            # Update stock
-            item.product.stock -= item.quantity
-            item.product.save()
-        
-        # Empty the cart
-        cart.items.all().delete()
-        
+
+        store.forget(cart)
+        subscriptions.publish_cart_changed(cart)
         return Response({
             'message': 'Commande créée avec succès',
-            'orders': OrderSerializer(orders, many=True).data,
+            'order': OrderSerializer(order).data,
             'is_empty': True
         })
 
@@ -705,33 +929,31 @@ class OrderViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user).with_lines()
 
-    def perform_create(self, serializer):
-        product = serializer.validated_data['product']
-        quantity = serializer.validated_data['quantity']
-
-        # Vérifier le stock
-        if product.stock < quantity:
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            self.perform_create(serializer)
+        except InsufficientStockError as e:
             return Response(
-                {'error': 'Stock insuffisant'},
-                status=status.HTTP_400_BAD_REQUEST
+                {'error': str(e)},
+                status=status.HTTP_409_CONFLICT
             )
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-        # Créer la commande
-        order = serializer.save(
-            user=self.request.user,
-            unit_price=product.price
-        )
+    def perform_create(self, serializer):
+        quantities = {}
+        for line in serializer.validated_data['lines']:
+            product_id = line['product'].pk
+            quantities[product_id] = quantities.get(product_id, 0) + line['quantity']
 
-        # Mettre à jour le stock
-        product.stock -= quantity
-        product.save()
-
-        return Response(
-            OrderSerializer(order).data,
-            status=status.HTTP_201_CREATED
-        )
+        with transaction.atomic():
+            # UPDATE ... SET stock = stock - q WHERE stock >= q : pas de lecture-modification-écriture
+            Product.objects.take_stock(quantities)
+            serializer.save(user=self.request.user)
 
 @method_decorator(csrf_exempt, name='dispatch')
 class UserLoginView(APIView):
@@ -744,11 +966,8 @@ class UserLoginView(APIView):
         
         if user:
             refresh = RefreshToken.for_user(user)
-            user.last_login_ip = request.META.get('REMOTE_ADDR')
-            user.save()
-            
-            # Créer un panier pour l'utilisateur s'il n'en a pas
-            Cart.objects.get_or_create(user=user)
+            # Panier créé à l'inscription ou à la première consultation (CartViewSet.list)
+            get_login_tracker().record(user, request.META.get('REMOTE_ADDR'))
             
             return Response({
                 'refresh': str(refresh),
@@ -761,6 +980,60 @@ class UserLoginView(APIView):
             status=status.HTTP_401_UNAUTHORIZED
         )
 
+class UserLogoutView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """Révoque le jeton d'accès de la requête et, s'il est fourni, le jeton de rafraîchissement"""
+        tokens = [request.auth]
+        if request.data.get('refresh'):
+            try:
+                tokens.append(RefreshToken(request.data['refresh']))
+            except TokenError:
+                return Response({'error': 'Invalid refresh token'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            for token in tokens:
+                revocation.revoke_token(token)
+        except RedisError as e:
+            logger.error(f"Révocation impossible à la déconnexion : {e}")
+            return Response(
+                {'error': 'Logout temporarily unavailable'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+@csrf_exempt
+async def async_login(request):
+    """
+    Variante asynchrone de UserLoginView, servie sous ASGI (réglage ASYNC_LOGIN) :
+    mêmes backends et signaux que authenticate() ; avec api.passwords.PooledModelBackend,
+    le mot de passe est vérifié dans le pool de api/passwords.py, pas dans la boucle.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    else:
+        data = request.POST
+
+    user = await aauthenticate(request, username=data.get('username'), password=data.get('password'))
+    if user is None:
+        return JsonResponse({'error': 'Invalid credentials'}, status=401)
+
+    refresh = await sync_to_async(RefreshToken.for_user)(user)
+    await sync_to_async(get_login_tracker().record)(user, request.META.get('REMOTE_ADDR'))
+    return JsonResponse({
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+        'user': MobileUserSerializer(user).data,
+        'is_admin': user.is_staff
+    })
+
 @method_decorator(csrf_exempt, name='dispatch')
 class UserRegisterView(APIView):
     authentication_classes = []  # Disable authentication
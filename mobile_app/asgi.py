@@ -2,6 +2,11 @@
 ASGI config for mobile_app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Les websockets ``/graphql/`` (abonnements GraphQL, api/graphql_ws.py) sont servies
+à côté de Django ; uvicorn a besoin d'une implémentation websocket
+(``pip install "uvicorn[standard]"``) :
+
+    uvicorn mobile_app.asgi:application
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +18,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mobile_app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Importé après le chargement de Django (modèles et schéma)
+from api.graphql_ws import graphql_ws_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        if scope['path'].rstrip('/') == '/graphql':
+            await graphql_ws_application(scope, receive, send)
+        else:
+            await receive()
+            await send({'type': 'websocket.close'})
+        return
+    await django_application(scope, receive, send)
@@ -15,4 +15,114 @@ ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 # OpenAI settings
 OPENAI_API_KEY = 'your-api-key-here'  # Set this in your environment variables
 
+# Recherche plein texte des produits (api/search.py)
+PRODUCT_SEARCH_MAX_RESULTS = 200  # Nombre maximal de résultats classés par recherche (renvoyé dans max_results)
+
+# GET conditionnels des produits (api/http_cache.py) : ETag faibles et 304
+CATALOG_VERSION_CACHE = 'default'  # Partagé entre workers : préférer Redis en production
+PRODUCT_CACHE_CONTROL = {'private': True, 'no_cache': True}  # Derrière un CDN : {'public': True, 's_maxage': 30}
+
+# Cache des représentations sérialisées des produits (api/product_cache.py)
+# (python manage.py bench_product_cache)
+PRODUCT_REPRESENTATION_CACHE = 'default'  # None pour désactiver ; partagé entre workers avec Redis
+PRODUCT_REPRESENTATION_CACHE_TTL = 60 * 60  # Durée de vie d'une représentation
+
+# Cache des générations IA (api/ai_cache.py). LocMemCache évince en LRU au-delà
+# de MAX_ENTRIES ; en production, préférer Redis avec maxmemory-policy allkeys-lru
+# pour partager le cache et la coalescence entre workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+AI_GENERATION_CACHE = 'default'
+AI_GENERATION_CACHE_TTL = 60 * 60 * 24  # Durée de vie d'un produit généré en cache
+AI_GENERATION_INFLIGHT_TTL = 120  # Durée maximale d'une génération en vol
+
+# Fournisseur LLM des tâches IA (api/llm.py) : 'openai' ou 'fake' (local, déterministe,
+# pour les tests de charge : python manage.py bench_ai_generation)
+LLM_PROVIDER = 'openai'
+LLM_FAKE_LATENCY = 0.2  # Latence simulée par appel (secondes)
+LLM_FAKE_ERROR_RATE = 0.0  # Proportion d'erreurs amont simulées
+LLM_FAKE_RATE_LIMIT_RATE = 0.0  # Proportion de 429 simulés
+LLM_FAKE_SEED = 0
+
+# Redis partagé (api/redis_client.py)
+REDIS_URL = 'redis://localhost:6379/0'
+
+# Stockage des paniers (api/cart_store.py) : 'db' ou 'redis' (écriture différée en base)
+CART_STORE = 'db'
+CART_STORE_TTL = 60 * 60 * 24 * 7  # Durée de vie d'un panier inactif dans Redis
+CART_STORE_FLUSH_BATCH = 500  # Paniers persistés par lot
+
+# Hachage des mots de passe (api/passwords.py). Le premier hacheur est celui des
+# nouveaux mots de passe ; les anciens hachages sont convertis à la connexion suivante.
+# Argon2 nécessite argon2-cffi (pip install "django[argon2]"), bcrypt est dans requirements.txt.
+PASSWORD_HASHERS = [
+    'api.passwords.ConfigurablePBKDF2PasswordHasher',
+    'api.passwords.ConfigurableBCryptSHA256PasswordHasher',
+    'api.passwords.ConfigurableArgon2PasswordHasher',
+]
+PASSWORD_PBKDF2_ITERATIONS = 600_000
+PASSWORD_BCRYPT_ROUNDS = 12
+PASSWORD_ARGON2_TIME_COST = 2
+PASSWORD_ARGON2_MEMORY_COST = 102400  # Kio
+PASSWORD_ARGON2_PARALLELISM = 8
+PASSWORD_HASHING_THREADS = 4  # Pool de la connexion asynchrone
+# ModelBackend dont la variante asynchrone (async_login) hache dans ce pool
+AUTHENTICATION_BACKENDS = ['api.passwords.PooledModelBackend']
+ASYNC_LOGIN = False  # True sous ASGI (uvicorn) : api.views.async_login
+
+# Authentification JWT (api/authentication.py) : utilisateur mis en cache par jti,
+# révocation (déconnexion, compte désactivé) vérifiée dans Redis à chaque appel
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': ['api.authentication.CachedJWTAuthentication'],
+}
+JWT_PRINCIPAL_CACHE_SIZE = 10000  # Utilisateurs en cache par processus
+JWT_PRINCIPAL_CACHE_TTL = 60  # Délai maximal de prise en compte des autres changements (secondes)
+
+# Limites des requêtes GraphQL (api/graphql_cost.py), vérifiées avant exécution
+GRAPHQL_QUERY_LIMITS = {
+    'anonymous': {'depth': 6, 'cost': 300},
+    'user': {'depth': 8, 'cost': 1500},
+    'staff': {'depth': 12, 'cost': 10000},
+}
+GRAPHQL_DEFAULT_LIST_SIZE = 10  # Taille estimée des listes non paginées
+GRAPHQL_FIELD_COSTS = {}  # Coûts propres à certains champs : {'TypeName.fieldName': coût}
+
+# Requêtes persistées et cache des documents GraphQL (api/graphql_documents.py)
+GRAPHQL_PERSISTED_QUERY_CACHE = 'default'  # Partagé entre workers : préférer Redis en production
+GRAPHQL_PERSISTED_QUERY_TTL = 60 * 60 * 24 * 30  # Durée de vie d'une requête enregistrée
+GRAPHQL_DOCUMENT_CACHE_SIZE = 500  # Documents analysés et validés par processus
+
+# Abonnements GraphQL sur websocket (api/graphql_ws.py, servi par mobile_app/asgi.py)
+# Courtier (api/subscriptions.py) : 'memory' (un seul worker) ou 'redis' (plusieurs workers)
+GRAPHQL_SUBSCRIPTION_BROKER = 'memory'
+GRAPHQL_SUBSCRIPTION_QUEUE_SIZE = 100  # Événements en attente par abonné
+GRAPHQL_WS_INIT_TIMEOUT = 10  # Délai d'envoi de connection_init (secondes)
+
+# Suivi des connexions (api/login_tracking.py) : 'db' ou 'redis' (écriture par lots)
+LOGIN_TRACKING = 'db'
+LOGIN_TRACKING_FLUSH_BATCH = 1000  # Utilisateurs par bulk_update
+
+# Réservations de stock des paniers (api/reservations.py)
+STOCK_HOLD_TTL = 15 * 60  # Durée d'une réservation (secondes)
+STOCK_REAP_BATCH = 1000  # Réservations expirées libérées par lot
+
+CELERY_BEAT_SCHEDULE = {
+    'flush-cart-store': {
+        'task': 'api.tasks.flush_cart_store',
+        'schedule': 5.0,  # secondes
+    },
+    'flush-login-tracking': {
+        'task': 'api.tasks.flush_login_tracking',
+        'schedule': 10.0,
+    },
+    'reap-expired-reservations': {
+        'task': 'api.tasks.reap_expired_reservations',
+        'schedule': 60.0,
+    },
+}
+
 # Add your other settings here... 
\ No newline at end of file
@@ -16,7 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from graphene_django.views import GraphQLView
+from api.graphql_documents import PersistedQueryGraphQLView
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.conf.urls.static import static
@@ -25,7 +25,7 @@ from api.schema import schema
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),  # Include all API URLs
-    path("graphql/", GraphQLView.as_view(graphiql=True, schema=schema)),
+    path("graphql/", PersistedQueryGraphQLView.as_view(graphiql=True, schema=schema)),
 ]
 
 # Ajouter les URLs des médias en mode développement
@@ -12,6 +12,7 @@ from kivymd.uix.menu import MDDropdownMenu
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.scrollview import ScrollView
 from kivy.metrics import dp
+from kivy.clock import Clock
 from datetime import datetime
 import requests
 import json
@@ -28,6 +29,17 @@ from kivymd.icon_definitions import md_icons
 from kivy.uix.widget import Widget  # For creating a simple separator
 from kivy.uix.image import AsyncImage
 
+# Pagination du catalogue
+PRODUCTS_PAGE_SIZE = 20
+REVIEWS_PREVIEW_LIMIT = 5
+
+# Suivi des générations IA (recherche sans résultat)
+GENERATION_POLL_INTERVAL = 2  # secondes
+GENERATION_POLL_ATTEMPTS = 15
+
+# Modifications du panier regroupées en un seul appel batch après ce délai d'inactivité
+CART_BATCH_DELAY = 0.8  # secondes
+
 # Custom separator widget
 class Separator(Widget):
     def __init__(self, **kwargs):
@@ -487,8 +499,13 @@ class ShopScreen(MDScreen):
         super().__init__(**kwargs)
         self.name = 'shop'
         self.products = []
+        self.next_products_url = None
+        self.load_more_button = None
+        # Pages du catalogue déjà reçues : url -> (ETag, données), revalidées par If-None-Match
+        self.products_page_cache = {}
         self.cart = None
         self.cart_dialog = None
+        self.pending_cart_operations = []
         self.api_client = ApiClient()
         
         # Create main layout
@@ -596,9 +613,16 @@ class ShopScreen(MDScreen):
             print(f"Search Response Status: {response.status_code}")
             print(f"Search Response: {response.text}")
             
-            if response.status_code == 200:
-                products = response.json()
-                self.display_products(products)
+            if response.status_code == 202:
+                # Aucun résultat : un produit est en cours de génération par l'IA
+                self.products_list.add_widget(OneLineListItem(
+                    text="No products found, AI is creating one..."
+                ))
+                self.poll_generation_job(response.json()['generation']['status_url'])
+            elif response.status_code == 200:
+                data = response.json()
+                # Résultats paginés par curseur
+                self.display_products(data['results'], next_url=data.get('next'))
             else:
                 toast(f"Error searching products: {response.status_code}")
                 
@@ -608,31 +632,71 @@ class ShopScreen(MDScreen):
         finally:
             self.loading.active = False
     
-    def load_products(self):
-        """Load all products"""
-        self.loading.active = True
-        self.products_list.clear_widgets()
-        
+    def poll_generation_job(self, status_url, attempt=0):
+        """Interroge un job de génération IA sans bloquer l'interface entre deux tentatives"""
         try:
-            # Check if token exists
-            if not self.parent or not self.parent.token:
-                print("No authentication token available")
-                self.products_list.add_widget(OneLineListItem(
-                    text="Please log in to view products"
-                ))
-                return
-                
             response = requests.get(
-                "http://localhost:8000/api/v1/products/",
+                status_url,
                 headers={'Authorization': f'Bearer {self.parent.token}'}
             )
+            job = response.json() if response.status_code == 200 else {'status': 'failed'}
+        except Exception as e:
+            print(f"Generation poll error: {str(e)}")
+            job = {'status': 'failed'}
+        
+        if job['status'] == 'success':
+            self.display_products([job['product']])
+        elif job['status'] == 'pending' and attempt < GENERATION_POLL_ATTEMPTS:
+            Clock.schedule_once(
+                lambda dt: self.poll_generation_job(status_url, attempt + 1),
+                GENERATION_POLL_INTERVAL
+            )
+        else:
+            self.display_products([])
+    
+    def load_products(self):
+        """Charge la première page de produits"""
+        self.products_list.clear_widgets()
+        
+        # Check if token exists
+        if not self.parent or not self.parent.token:
+            print("No authentication token available")
+            self.products_list.add_widget(OneLineListItem(
+                text="Please log in to view products"
+            ))
+            return
+        
+        self.load_products_page(
+            f"http://localhost:8000/api/v1/products/?page_size={PRODUCTS_PAGE_SIZE}&reviews_limit={REVIEWS_PREVIEW_LIMIT}"
+        )
+    
+    def load_more_products(self, instance):
+        """Charge la page suivante de produits"""
+        if self.next_products_url:
+            self.load_products_page(self.next_products_url, append=True)
+    
+    def load_products_page(self, url, append=False):
+        """Récupère une page du catalogue paginé par curseur"""
+        self.loading.active = True
+        
+        try:
+            headers = {'Authorization': f'Bearer {self.parent.token}'}
+            cached = self.products_page_cache.get(url)
+            if cached:
+                headers['If-None-Match'] = cached[0]
+            response = requests.get(url, headers=headers)
             
             print(f"Load Products Response Status: {response.status_code}")
-            print(f"Load Products Response: {response.text}")
             
-            if response.status_code == 200:
-                products = response.json()
-                self.display_products(products)
+            if response.status_code == 304 and cached:
+                # Catalogue inchangé : la page reçue précédemment est réutilisée
+                data = cached[1]
+                self.display_products(data['results'], append=append, next_url=data.get('next'))
+            elif response.status_code == 200:
+                data = response.json()
+                if response.headers.get('ETag'):
+                    self.products_page_cache[url] = (response.headers['ETag'], data)
+                self.display_products(data['results'], append=append, next_url=data.get('next'))
             else:
                 toast(f"Error loading products: {response.status_code}")
                 
@@ -642,13 +706,22 @@ class ShopScreen(MDScreen):
         finally:
             self.loading.active = False
     
-    def display_products(self, products):
+    def display_products(self, products, append=False, next_url=None):
         """Display products in the list"""
-        self.products_list.clear_widgets()
+        if append:
+            self.products.extend(products)
+            # Retirer le bouton "Load more" de la page précédente
+            if self.load_more_button is not None:
+                self.products_list.remove_widget(self.load_more_button)
+        else:
+            self.products = list(products)
+            self.products_list.clear_widgets()
+        self.next_products_url = next_url
+        self.load_more_button = None
         
         print(f"Displaying {len(products) if products else 0} products")
         
-        if not products:
+        if not products and not append:
             no_products = OneLineListItem(
                 text="No products found"
             )
@@ -771,6 +844,15 @@ class ShopScreen(MDScreen):
             )
         )
         
+        # Page suivante disponible
+        if next_url:
+            self.load_more_button = MDRaisedButton(
+                text="Load more",
+                pos_hint={'center_x': 0.5},
+                on_release=self.load_more_products
+            )
+            self.products_list.add_widget(self.load_more_button)
+        
         print("Finished displaying products")
     
     def on_enter(self):
@@ -840,7 +922,7 @@ class ShopScreen(MDScreen):
         
         # Reviews section
         reviews_label = MDLabel(
-            text="Avis des clients",
+            text=f"Avis des clients ({product.get('review_count', len(product.get('reviews', [])))})",
             theme_text_color="Primary",
             font_style="H6",
             size_hint_y=None,
@@ -1232,7 +1314,7 @@ class ShopScreen(MDScreen):
             
             if response.status_code == 200:
                 dialog.dismiss()
-                self.load_cart()
+                self.cart = response.json()['cart']
                 self.show_success_dialog("Succès", "Produit ajouté au panier")
             else:
                 self.show_error_dialog("Erreur", "Impossible d'ajouter au panier")
@@ -1312,61 +1394,70 @@ class ShopScreen(MDScreen):
             self.cart_dialog = None
 
     def remove_from_cart(self, item):
-        try:
-            response = requests.post(
-                f"http://localhost:8000/api/v1/carts/{self.cart['id']}/remove_item/",
-                headers={'Authorization': f'Bearer {self.parent.token}'},
-                json={'item': item['id']}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                self.cart = data['cart']
-                
-                if data.get('is_empty', False):
-                    # If cart is empty, show empty cart message
-                    if self.cart_dialog:
-                        self.cart_dialog.dismiss()
-                    self.show_empty_cart_message()
-                else:
-                    # Refresh cart dialog with updated items
-                    if self.cart_dialog:
-                        self.cart_dialog.dismiss()
-                    self.show_cart(None)
-            else:
-                self.show_error_dialog("Erreur", "Impossible de retirer l'article")
-        except Exception as e:
-            self.show_error_dialog("Erreur", str(e))
+        self.queue_cart_operation(item, {'op': 'remove', 'item': item['id']})
+        self.cart['items'] = [i for i in self.cart['items'] if i['id'] != item['id']]
+        self.refresh_cart_dialog()
 
     def update_cart_item(self, item, new_quantity):
+        if new_quantity <= 0:
+            self.remove_from_cart(item)
+            return
+        self.queue_cart_operation(item, {'op': 'update', 'item': item['id'], 'quantity': new_quantity})
+        item['quantity'] = new_quantity
+        self.refresh_cart_dialog()
+
+    def queue_cart_operation(self, item, operation):
+        # Seule la dernière modification d'un article compte
+        self.pending_cart_operations = [
+            op for op in self.pending_cart_operations if op.get('item') != item['id']
+        ]
+        self.pending_cart_operations.append(operation)
+        Clock.unschedule(self.send_cart_operations)
+        Clock.schedule_once(self.send_cart_operations, CART_BATCH_DELAY)
+
+    def send_cart_operations(self, dt=None):
+        Clock.unschedule(self.send_cart_operations)
+        if not self.pending_cart_operations or not self.cart:
+            return True
+        operations, self.pending_cart_operations = self.pending_cart_operations, []
         try:
             response = requests.post(
-                f"http://localhost:8000/api/v1/carts/{self.cart['id']}/update_item/",
+                f"http://localhost:8000/api/v1/carts/{self.cart['id']}/batch/",
                 headers={'Authorization': f'Bearer {self.parent.token}'},
-                json={
-                    'item': item['id'],
-                    'quantity': new_quantity
-                }
+                json={'operations': operations}
             )
             
             if response.status_code == 200:
-                data = response.json()
-                self.cart = data['cart']
-                
-                if data.get('is_empty', False):
-                    if self.cart_dialog:
-                        self.cart_dialog.dismiss()
-                    self.show_empty_cart_message()
-                else:
-                    if self.cart_dialog:
-                        self.cart_dialog.dismiss()
-                    self.show_cart(None)
-            else:
-                self.show_error_dialog("Erreur", "Impossible de mettre à jour la quantité")
+                self.cart = response.json()['cart']
+                return True
+            self.show_error_dialog(
+                "Erreur",
+                response.json().get('error', "Impossible de mettre à jour le panier")
+            )
         except Exception as e:
             self.show_error_dialog("Erreur", str(e))
+        # Resynchroniser l'affichage avec le panier du serveur
+        self.load_cart()
+        if self.cart_dialog:
+            self.refresh_cart_dialog()
+        return False
+
+    def refresh_cart_dialog(self):
+        # Total recalculé localement en attendant la réponse du serveur
+        self.cart['total'] = sum(
+            float(i['product_price']) * i['quantity'] for i in self.cart['items']
+        )
+        if self.cart_dialog:
+            self.cart_dialog.dismiss()
+        if not self.cart['items']:
+            self.show_empty_cart_message()
+        else:
+            self.show_cart(None)
 
     def checkout(self, instance):
+        # Envoyer les modifications du panier encore en attente
+        if not self.send_cart_operations():
+            return
         try:
             response = requests.post(
                 f"http://localhost:8000/api/v1/carts/{self.cart['id']}/checkout/",
@@ -1388,6 +1479,15 @@ class ShopScreen(MDScreen):
             self.show_error_dialog("Erreur", str(e))
     
     def logout(self, instance):
+        # Révoquer le jeton côté serveur ; la déconnexion locale a lieu dans tous les cas
+        try:
+            requests.post(
+                "http://localhost:8000/api/v1/users/logout/",
+                headers={'Authorization': f'Bearer {self.parent.token}'},
+                timeout=5
+            )
+        except requests.RequestException:
+            pass
         # Réinitialiser les informations de l'utilisateur
         self.parent.token = None
         self.parent.username = None